@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Action plugin for foreman_host.
+
+If foreman_host is delegated to the controller (delegate_to: localhost) every host of a play would start its own
+module process. Instead each host spools its module arguments and the first host getting the batch lock runs
+foreman_host once for all spooled hosts using the hosts option. Results are handed back to the waiting hosts.
+
+The spool directory and its files are only readable by the user running Ansible. Options applying to the whole run
+(SHARED_KEYS, e.g. foreman_pass) aren't spooled, only a digest to find the hosts sharing them. The last host to
+collect its result removes the spool directory.
+
+Batching can be disabled with the variable foreman_batch: false. The variable foreman_batch_window defines how long
+(seconds) a host waits for other hosts to spool their arguments before running the batch, foreman_batch_pool_size
+is passed to the module as pool_size.
+"""
+
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from ansible import constants as C
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.action import ActionBase
+
+# Options applying to the whole module run, only hosts sharing them are batched
+SHARED_KEYS = ['foreman_host', 'foreman_read_hosts', 'foreman_port', 'foreman_user', 'foreman_pass', 'mirror',
+               'metrics_file', 'mirror_max_age', 'per_page', 'result_fields', 'trace_dir', 'http_cache',
+               'http_pool_size', 'http_timeout', 'wait_for_build', 'build_timeout', 'poll_interval', 'progress',
+               'job_state']
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False
+
+    def run(self, tmp=None, task_vars=None):
+        if task_vars is None:
+            task_vars = dict()
+
+        result = super(ActionModule, self).run(tmp, task_vars)
+
+        if not self._batching_enabled(task_vars=task_vars):
+            result.update(self._execute_module(task_vars=task_vars))
+            return result
+
+        spool_dir = os.path.join(C.DEFAULT_LOCAL_TMP, 'foreman_host-{0}'.format(self._task._uuid))
+        key = uuid.uuid4().hex
+        spec = dict((option, value) for option, value in self._task.args.items() if option not in SHARED_KEYS)
+        write_json(os.path.join(spool_dir, key + '.spec'), dict(shared=self._shared_digest(), spec=spec))
+
+        time.sleep(float(task_vars.get('foreman_batch_window', 0.2)))
+
+        lock_file = os.path.join(spool_dir, '.lock')
+        with open(lock_file, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                result_file = os.path.join(spool_dir, key + '.result')
+                if not os.path.exists(result_file):
+                    self._run_batch(spool_dir=spool_dir, task_vars=task_vars)
+                with open(result_file) as f:
+                    result.update(json.load(f))
+                os.remove(result_file)
+                remove_spool(spool_dir)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return result
+
+    def _batching_enabled(self, task_vars):
+        if not boolean(task_vars.get('foreman_batch', True), strict=False):
+            return False
+        if self._task.args.get('hosts') is not None:
+            return False
+        return getattr(self._connection, 'transport', None) == 'local'
+
+    def _shared_digest(self):
+        """
+        Return a digest of the SHARED_KEYS options of the task, equal for the hosts that can be batched.
+        """
+        shared = json.dumps([self._task.args.get(key) for key in SHARED_KEYS], sort_keys=True)
+        return hashlib.sha256(shared.encode('utf-8')).hexdigest()
+
+    def _run_batch(self, spool_dir, task_vars):
+        """
+        Run foreman_host once for all spooled hosts sharing our connection settings and write a result file for each.
+        Hosts using other connection or mirror settings are left for their own batch.
+        """
+        own = dict((key, self._task.args.get(key)) for key in SHARED_KEYS)
+        shared = self._shared_digest()
+
+        keys = list()
+        hosts = list()
+        for filename in sorted(os.listdir(spool_dir)):
+            if not filename.endswith('.spec'):
+                continue
+            spec_file = os.path.join(spool_dir, filename)
+            with open(spec_file) as f:
+                spooled = json.load(f)
+            if spooled['shared'] != shared:
+                continue
+            keys.append(filename[:-len('.spec')])
+            hosts.append(spooled['spec'])
+            os.remove(spec_file)
+
+        module_args = dict((key, value) for key, value in own.items() if value is not None)
+        module_args['hosts'] = hosts
+        module_args['pool_size'] = int(task_vars.get('foreman_batch_pool_size', 4))
+
+        module_result = self._execute_module(module_name='foreman_host', module_args=module_args,
+                                             task_vars=task_vars)
+        results = module_result.get('results')
+        if not results or len(results) != len(keys):
+            results = [dict(failed=True, msg=module_result.get('msg', 'foreman_host batch failed'))] * len(keys)
+
+        for key, host_result in zip(keys, results):
+            write_json(os.path.join(spool_dir, key + '.result'), host_result)
+
+
+def write_json(path, data):
+    """
+    Write data to path readable only by the current user, creating the spool directory if needed.
+    """
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        try:
+            os.makedirs(os.path.dirname(path), 0o700)
+        except OSError:
+            # Another host created it meanwhile
+            pass
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.rename(tmp_path, path)
+
+
+def remove_spool(spool_dir):
+    """
+    Remove the spool directory once no host has spooled arguments or results left in it. Must hold the lock.
+    Hosts spool before taking the lock, so no host waits for the lock of an empty spool directory.
+    """
+    if any(filename != '.lock' for filename in os.listdir(spool_dir)):
+        return
+    try:
+        os.remove(os.path.join(spool_dir, '.lock'))
+        os.rmdir(spool_dir)
+    except OSError:
+        # A host spooled its arguments meanwhile, it creates a new lock file
+        pass
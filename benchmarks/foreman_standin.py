@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Stand-in for the Foreman API v2 to benchmark the modules without a Foreman.
+
+Serves GET /api/v2/<endpoint> with generated objects and Foreman's paging (page, per_page, search on name and
+title, thin) and GET /api/v2/<endpoint>/<id> with an ETag, answering If-None-Match with 304 Not Modified, over
+HTTPS using a self-signed certificate created with openssl. Responses are gzip compressed if the client accepts
+it. Every request waits latency seconds to simulate a loaded Foreman. Requests are counted per path, bytes of
+response bodies as sent and connections in total.
+
+Usage: python benchmarks/foreman_standin.py [port] [objects per endpoint] [latency]
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+
+SEARCH = re.compile(r'^(name|title)\s*(=|\^)\s*\(?(.*?)\)?$')
+
+
+def generate(endpoint, count):
+    singular = endpoint[:-1]
+    return [dict(id=i, name='{0}-{1:06d}'.format(singular, i), title='{0}-{1:06d}'.format(singular, i),
+                 description='Generated {0} {1}'.format(singular, i), updated_at='2017-01-01 00:00:00 UTC')
+            for i in range(1, count + 1)]
+
+
+def matches(search, obj):
+    if not search:
+        return True
+    match = SEARCH.match(search.strip())
+    if not match:
+        return True
+    field, operator, value = match.groups()
+    values = [item.strip().strip('"') for item in value.split(',')] if operator == '^' else [value.strip('"')]
+    return obj.get(field) in values
+
+
+class StandIn(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, objects=1000, latency=0.0, detail_size=0):
+        """
+        :param detail_size: Length of the template field objects have in their details, e.g. of config templates
+        """
+        HTTPServer.__init__(self, address, Handler)
+        self.objects = objects
+        self.latency = latency
+        self.template = ''.join('<%= @host.params["param_{0}"] %> # line {0}\n'.format(i)
+                                for i in range(detail_size // 30 + 1))[:detail_size]
+        self.data = dict()
+        self.requests = dict()
+        self.bytes = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def get_objects(self, endpoint):
+        with self.lock:
+            if endpoint not in self.data:
+                self.data[endpoint] = generate(endpoint, self.objects)
+            return self.data[endpoint]
+
+    def count(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def count_bytes(self, size):
+        with self.lock:
+            self.bytes += size
+
+    def count_connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def reset(self):
+        with self.lock:
+            self.requests = dict()
+            self.bytes = 0
+            self.connections = 0
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        # One handler per connection, serving all requests sent over it
+        BaseHTTPRequestHandler.setup(self)
+        self.server.count_connection()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.count(url.path)
+        time.sleep(self.server.latency)
+        if not url.path.startswith('/api/v2/'):
+            return self.reply(404, dict(error=dict(message='Not found')))
+        endpoint = url.path[len('/api/v2/'):]
+        if re.match(r'^\w+/\d+$', endpoint):
+            return self.reply_object(*endpoint.split('/'))
+        query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+        page = int(query.get('page', 1))
+        per_page = int(query.get('per_page', 20))
+        search = query.get('search')
+
+        objects = [obj for obj in self.server.get_objects(endpoint) if matches(search, obj)]
+        results = objects[(page - 1) * per_page:page * per_page]
+        if query.get('thin') == 'true':
+            results = [dict(id=obj['id'], name=obj['name']) for obj in results]
+        self.reply(200, dict(total=len(self.server.get_objects(endpoint)), subtotal=len(objects), page=page,
+                             per_page=per_page, search=search, results=results))
+
+    def reply_object(self, endpoint, obj_id):
+        for obj in self.server.get_objects(endpoint):
+            if obj['id'] == int(obj_id):
+                break
+        else:
+            return self.reply(404, dict(error=dict(message='Not found')))
+        obj = dict(obj)
+        if self.server.template:
+            obj['template'] = self.server.template
+        content = json.dumps(obj).encode('utf-8')
+        etag = '"{0}"'.format(hashlib.md5(content).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            return self.reply(304, None, etag=etag)
+        self.reply(200, obj, etag=etag)
+
+    def reply(self, status, body, etag=None):
+        content = json.dumps(body).encode('utf-8') if body is not None else b''
+        gzipped = content and 'gzip' in (self.headers.get('Accept-Encoding') or '')
+        if gzipped:
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(content)
+            content = buf.getvalue()
+        self.server.count_bytes(len(content))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def create_certificate(directory):
+    certfile = os.path.join(directory, 'standin.pem')
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                           '-subj', '/CN=localhost', '-keyout', certfile, '-out', certfile],
+                          stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+    return certfile
+
+
+def start(port=0, objects=1000, latency=0.0, detail_size=0):
+    """
+    Start a stand-in in a background thread. Returns the server, server.server_port is the port it listens on.
+    """
+    server = StandIn(('127.0.0.1', port), objects=objects, latency=latency, detail_size=detail_size)
+    directory = tempfile.mkdtemp()
+    try:
+        certfile = create_certificate(directory)
+        if hasattr(ssl, 'SSLContext'):
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER if hasattr(ssl, 'PROTOCOL_TLS_SERVER')
+                                     else ssl.PROTOCOL_SSLv23)
+            context.load_cert_chain(certfile)
+            server.socket = context.wrap_socket(server.socket, server_side=True)
+        else:
+            server.socket = ssl.wrap_socket(server.socket, certfile=certfile, server_side=True)
+    finally:
+        shutil.rmtree(directory)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8443
+    objects = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    server = start(port=port, objects=objects, latency=latency)
+    print('Foreman stand-in listening on https://127.0.0.1:{0}/api/v2/'.format(server.server_port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Count the Foreman API requests foreman_hostgroup sends per code path, using a client that answers from memory.
+
+Every path sets all nine references (architecture, compute profile, domain, environment, medium, operatingsystem,
+partition table, smart proxy, subnet). lazy is what the module sends, counted: references are only looked up if the
+path sends them, in parallel. Every request takes [latency] seconds, so the time shows the parallel lookups as well.
+
+eager est. is not measured but computed for comparison: what resolving every reference before checking the
+hostgroup, as the module did before, would send, i.e. the search of the hostgroup, one search per reference and
+the write if the path changes anything.
+
+Requires Ansible.
+
+Usage: python benchmarks/hostgroup_requests.py [latency]
+"""
+
+import os
+import sys
+import threading
+import time
+
+import ansible.module_utils
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+ansible.module_utils.__path__.append(os.path.join(ROOT, 'module_utils'))
+sys.path.insert(0, ROOT)
+
+import foreman_hostgroup  # noqa: E402
+
+REFERENCES = dict(architecture='x86_64', compute_profile='small', domain='example.com', environment='production',
+                  medium='CentOS mirror', operatingsystem='CentOS 7', partition_table='Kickstart default',
+                  smart_proxy='proxy.example.com', subnet='net-a')
+
+
+class CountingForeman(object):
+    """
+    Answer search_*, create_*, update_* and delete_* calls from memory after latency seconds and count them.
+    """
+
+    def __init__(self, hostgroup, latency):
+        self.hostgroup = hostgroup
+        self.latency = latency
+        self.calls = list()
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            with self.lock:
+                self.calls.append(name)
+            time.sleep(self.latency)
+            if name == 'search_hostgroup':
+                return self.hostgroup
+            if name.startswith('search_'):
+                return dict(id=len(self.calls), name=kwargs['data'].get('name'))
+            return dict(id=1, **(kwargs.get('data') or dict()))
+
+        return call
+
+
+class Module(object):
+    def __init__(self, params):
+        self.params = params
+
+    def fail_json(self, msg, **kwargs):
+        raise Exception(msg)
+
+
+PATHS = [
+    ('create', None, 'present'),
+    ('unchanged', dict(id=1, name='web'), 'present'),
+    ('update', dict(id=1, name='web', location_id=3), 'present'),
+    ('delete', dict(id=1, name='web'), 'absent'),
+    ('absent', None, 'absent'),
+]
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.02
+
+    print('{0} ms per request'.format(latency * 1000))
+    print('{0:10} {1:>10} {2:>6} {3:>10}'.format('path', 'eager est.', 'lazy', 'lazy time'))
+    for name, hostgroup, state in PATHS:
+        params = dict(name='web', state=state, mirror=None)
+        params.update(REFERENCES)
+        theforeman = CountingForeman(hostgroup=hostgroup, latency=latency)
+        start = time.time()
+        changed, result = foreman_hostgroup.ensure(Module(params), theforeman)
+        elapsed = time.time() - start
+        # Estimate, see above
+        eager = 1 + len(REFERENCES) + (1 if changed else 0)
+        print('{0:10} {1:10} {2:6} {3:7.1f} ms'.format(name, eager, len(theforeman.calls), elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare reading objects by id against the Foreman stand-in (see foreman_standin.py) with and without HttpCache.
+
+plain:      GET every object, as python-foreman does
+cold:       GET every object through an empty HttpCache
+revalidate: GET every object again through the HttpCache, unchanged objects are answered with 304
+
+Objects carry a template of size bytes, as config templates do.
+Requires Ansible, python-requests and openssl.
+
+Usage: python benchmarks/http_cache.py [objects] [size] [latency]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+import ansible.module_utils
+
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'module_utils'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ansible.module_utils.foreman_http_cache import HttpCache  # noqa: E402
+from foreman_standin import start  # noqa: E402
+
+
+def measure(server, name, func):
+    server.reset()
+    start_time = time.time()
+    func()
+    elapsed = time.time() - start_time
+    print('{0:12} {1:7.1f} ms  {2:9} bytes received'.format(name, elapsed * 1000, server.bytes))
+
+
+def main():
+    import requests
+
+    objects = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+
+    # The stand-in's certificate is self-signed
+    warnings.filterwarnings('ignore')
+    server = start(objects=objects, latency=latency, detail_size=size)
+    session = requests.Session()
+    session.verify = False
+    urls = ['https://127.0.0.1:{0}/api/v2/config_templates/{1}'.format(server.server_port, obj_id)
+            for obj_id in range(1, objects + 1)]
+    directory = tempfile.mkdtemp()
+    cache = HttpCache(path=directory)
+
+    def plain():
+        for url in urls:
+            session.get(url).json()
+
+    def cached():
+        for url in urls:
+            cache.get(session=session, url=url, username='admin')
+
+    print('{0} objects of {1} bytes, {2:.0f} ms latency'.format(objects, size, latency * 1000))
+    try:
+        measure(server, 'plain', plain)
+        measure(server, 'cold', cached)
+        measure(server, 'revalidate', cached)
+    finally:
+        shutil.rmtree(directory)
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare reading list endpoints against the Foreman stand-in (see foreman_standin.py).
+
+full:       Read all items, one page after the other
+prefetch:   Read all items, the next page is requested while the current one is processed
+first:      Stop paging once the searched item was found (find_first)
+per_page:   Read all items with prefetch using different page sizes
+
+Each item is "processed" for processing seconds, as the modules do when comparing objects.
+Requires Ansible, python-requests and openssl.
+
+Usage: python benchmarks/pagination.py [objects] [latency] [processing]
+"""
+
+import os
+import sys
+import time
+import warnings
+
+import ansible.module_utils
+
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'module_utils'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ansible.module_utils.foreman_utils import find_first, iter_resources  # noqa: E402
+from foreman_standin import start  # noqa: E402
+
+
+def measure(server, name, func):
+    server.reset()
+    start_time = time.time()
+    func()
+    elapsed = time.time() - start_time
+    print('{0:22} {1:7.1f} ms  {2:3} requests'.format(name, elapsed * 1000, sum(server.requests.values())))
+
+
+def main():
+    objects = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    processing = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0005
+
+    # The stand-in's certificate is self-signed
+    warnings.filterwarnings('ignore')
+    server = start(objects=objects, latency=latency)
+    params = dict(foreman_host='127.0.0.1', foreman_port=server.server_port, foreman_user='admin',
+                  foreman_pass='secret')
+    wanted = 'hostgroup-{0:06d}'.format(min(150, objects))
+
+    def read_all(prefetch, per_page=100):
+        for _ in iter_resources(params, 'hostgroups', per_page=per_page, prefetch=prefetch):
+            time.sleep(processing)
+
+    def read_first():
+        def match(item):
+            time.sleep(processing)
+            return item.get('name') == wanted
+        find_first(iter_resources(params, 'hostgroups', per_page=100), match)
+
+    print('{0} objects, {1:.0f} ms latency, {2:.1f} ms processing per item'.format(objects, latency * 1000,
+                                                                                  processing * 1000))
+    measure(server, 'full', lambda: read_all(prefetch=False))
+    measure(server, 'prefetch', lambda: read_all(prefetch=True))
+    measure(server, 'first', read_first)
+    for per_page in (20, 100, 500):
+        measure(server, 'per_page {0}'.format(per_page), lambda: read_all(prefetch=True, per_page=per_page))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the requests the modules send themselves against the Foreman stand-in (see foreman_standin.py) before and
+after sharing sessions.
+
+before:     A new session per request (as iter_resources had per listing), uncompressed responses
+after:      The session of get_session, kept alive connections and gzip compressed responses
+
+Every variant lists all hostgroups page by page and reads all config templates by id using [threads] threads as
+foreman_host's hosts mode does. Printed are the bytes of response bodies as sent and the connections opened.
+Requires Ansible, python-requests and openssl.
+
+Usage: python benchmarks/session.py [objects] [template size] [latency] [threads]
+"""
+
+import os
+import sys
+import time
+import warnings
+from multiprocessing.pool import ThreadPool
+
+import ansible.module_utils
+
+ansible.module_utils.__path__.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'module_utils'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ansible.module_utils.foreman_utils import get_session  # noqa: E402
+from foreman_standin import start  # noqa: E402
+
+
+def measure(server, name, func):
+    server.reset()
+    start_time = time.time()
+    func()
+    elapsed = time.time() - start_time
+    print('{0:8} {1:8.1f} ms  {2:9} bytes  {3:4} connections'.format(name, elapsed * 1000, server.bytes,
+                                                                     server.connections))
+
+
+def main():
+    import requests
+
+    objects = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.005
+    threads = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+
+    # The stand-in's certificate is self-signed
+    warnings.filterwarnings('ignore')
+    server = start(objects=objects, latency=latency, detail_size=size)
+    params = dict(foreman_host='127.0.0.1', foreman_port=server.server_port, foreman_user='admin',
+                  foreman_pass='secret', http_pool_size=threads)
+    base = 'https://127.0.0.1:{0}/api/v2/'.format(server.server_port)
+    urls = ['{0}hostgroups?page={1}&per_page=20'.format(base, page) for page in range(1, objects // 20 + 1)]
+    urls += ['{0}config_templates/{1}'.format(base, obj_id) for obj_id in range(1, objects + 1)]
+
+    def new_session(url):
+        session = requests.Session()
+        session.verify = False
+        session.headers['Accept-Encoding'] = 'identity'
+        session.get(url).json()
+        session.close()
+
+    def shared_session(url):
+        get_session(params).get(url).json()
+
+    def run(get):
+        pool = ThreadPool(processes=threads)
+        try:
+            pool.map(get, urls)
+        finally:
+            pool.close()
+
+    print('{0} requests, {1} bytes templates, {2:.0f} ms latency, {3} threads'.format(len(urls), size,
+                                                                                     latency * 1000, threads))
+    try:
+        measure(server, 'before', lambda: run(new_session))
+        measure(server, 'after', lambda: run(shared_session))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the cold start time of the imports a foreman_* module does before talking to Foreman.
+
+eager: What modules imported before: Ansible's basic module_utils and python-foreman.
+lazy:  What modules import now: AnsibleModule and foreman_utils. python-foreman and requests are imported on the
+       first API call only.
+
+Each variant is started in a fresh interpreter, so the numbers include interpreter startup.
+Requires Ansible and python-foreman to be installed.
+
+Usage: python benchmarks/startup.py [runs]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+MODULE_UTILS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'module_utils')
+
+VARIANTS = [
+    ('eager', 'from ansible.module_utils.basic import *\n'
+              'from foreman.foreman import *\n'),
+    ('lazy', 'import ansible.module_utils\n'
+             'ansible.module_utils.__path__.append({0!r})\n'
+             'from ansible.module_utils.basic import AnsibleModule\n'
+             'from ansible.module_utils.foreman_utils import ForemanError, get_foreman_client\n'.format(MODULE_UTILS)),
+]
+
+
+def measure(code, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code])
+        timings.append(time.time() - start)
+    return sorted(timings)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    medians = dict()
+    for name, code in VARIANTS:
+        timings = measure(code, runs)
+        medians[name] = timings[len(timings) // 2]
+        print('{0:6} median {1:7.1f} ms  min {2:7.1f} ms  max {3:7.1f} ms'.format(
+            name, medians[name] * 1000, timings[0] * 1000, timings[-1] * 1000))
+    print('saved  {0:7.1f} ms per module start'.format((medians['eager'] - medians['lazy']) * 1000))
+
+
+if __name__ == '__main__':
+    main()
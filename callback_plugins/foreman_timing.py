@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Callback plugin printing how long foreman_* tasks took at the end of a playbook.
+
+Enable it in ansible.cfg:
+
+    [defaults]
+    callback_plugins = /path/to/ansible-library-foreman/callback_plugins
+    callback_whitelist = foreman_timing
+
+Printed are p50, p95 and p99 of the wall time of foreman_* tasks by module and by Foreman server (foreman_host as
+the module got it, the Foremans of foreman_endpoints together), the API calls the modules returned in api_stats by
+call, also those of every endpoint, and the hosts whose foreman_* tasks took longest. Modules only return
+percentiles of their API calls, so calls are printed with their mean, the highest p95 of a task and their maximum.
+Set FOREMAN_TIMING_JSON to a path to also write the raw measurements as JSON.
+"""
+
+import json
+import math
+import os
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+SLOWEST_HOSTS = 10
+
+
+def percentile(values, p):
+    """
+    Return the p-th percentile (nearest rank) of values.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, int(math.ceil(p / 100.0 * len(values))))
+    return values[rank - 1]
+
+
+def get_foreman_host(result):
+    """
+    Return the foreman_host the module of result got. The task's arguments aren't templated yet, so they are only
+    used if the result has no invocation and they hold no template.
+    """
+    module_args = (result._result.get('invocation') or dict()).get('module_args')
+    if module_args is not None:
+        return str(module_args.get('foreman_host') or '127.0.0.1')
+    foreman_host = str(result._task.args.get('foreman_host', '127.0.0.1'))
+    return 'unknown' if '{{' in foreman_host or '{%' in foreman_host else foreman_host
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'foreman_timing'
+    CALLBACK_NEEDS_WHITELIST = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        self.task_start = dict()
+        self.runner_start = dict()
+        # One dict per finished foreman_* task and host
+        self.records = list()
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self.task_start[task._uuid] = time.time()
+
+    def v2_runner_on_start(self, host, task):
+        # Ansible >= 2.8, more exact than the task start for serial strategies
+        self.runner_start[(task._uuid, host.get_name())] = time.time()
+
+    def _record(self, result, status):
+        task = result._task
+        module = task.action
+        if not module.startswith('foreman_'):
+            return
+        host = result._host.get_name()
+        start = self.runner_start.pop((task._uuid, host), None) or self.task_start.get(task._uuid)
+        if start is None:
+            return
+        endpoints = [endpoint for endpoint in result._result.get('endpoints') or [] if isinstance(endpoint, dict)]
+        if endpoints:
+            foreman_host = ','.join(sorted(set(str(endpoint.get('foreman_host')) for endpoint in endpoints)))
+        else:
+            foreman_host = get_foreman_host(result)
+        api_stats = [stats for stats in [result._result.get('api_stats')] +
+                     [endpoint.get('api_stats') for endpoint in endpoints] if stats]
+        self.records.append(dict(module=module,
+                                 host=host,
+                                 foreman_host=foreman_host,
+                                 status=status,
+                                 seconds=time.time() - start,
+                                 api_stats=api_stats))
+
+    def v2_runner_on_ok(self, result):
+        self._record(result, 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record(result, 'failed')
+
+    def v2_runner_on_unreachable(self, result):
+        self._record(result, 'unreachable')
+
+    def _print_table(self, title, rows):
+        """
+        rows: (name, durations in seconds)
+        """
+        self._display.display('{0:40} {1:>6} {2:>9} {3:>9} {4:>9}'.format(title, 'count', 'p50 ms', 'p95 ms',
+                                                                             'p99 ms'))
+        for name, durations in sorted(rows, key=lambda row: -percentile(row[1], 95)):
+            self._display.display('{0:40} {1:6} {2:9.1f} {3:9.1f} {4:9.1f}'.format(
+                name[:40], len(durations), percentile(durations, 50) * 1000, percentile(durations, 95) * 1000,
+                percentile(durations, 99) * 1000))
+        self._display.display('')
+
+    def _print_calls(self, by_call):
+        """
+        by_call: call -> api_stats of the call of every task
+        """
+        self._display.display('{0:40} {1:>6} {2:>9} {3:>9} {4:>9}'.format('API call', 'count', 'mean ms', 'p95 ms',
+                                                                             'max ms'))
+        rows = [(call, sum(stats['count'] for stats in calls), sum(stats['seconds'] for stats in calls),
+                 max(stats['p95_ms'] for stats in calls), max(stats['max_ms'] for stats in calls))
+                for call, calls in by_call.items()]
+        for call, count, seconds, p95, maximum in sorted(rows, key=lambda row: -row[3]):
+            self._display.display('{0:40} {1:6} {2:9.1f} {3:9} {4:9}'.format(call[:40], count,
+                                                                              seconds * 1000 / count, p95, maximum))
+        self._display.display('')
+
+    def v2_playbook_on_stats(self, stats):
+        if not self.records:
+            return
+
+        by_module = dict()
+        by_foreman = dict()
+        by_call = dict()
+        by_host = dict()
+        for record in self.records:
+            by_module.setdefault(record['module'], []).append(record['seconds'])
+            by_foreman.setdefault(record['foreman_host'], []).append(record['seconds'])
+            by_host[record['host']] = by_host.get(record['host'], 0) + record['seconds']
+            for api_stats in record['api_stats']:
+                for call, call_stats in (api_stats.get('by_call') or dict()).items():
+                    by_call.setdefault(call, []).append(call_stats)
+
+        self._display.banner('FOREMAN TIMING')
+        self._print_table('Module', by_module.items())
+        self._print_table('Foreman', by_foreman.items())
+        if by_call:
+            self._print_calls(by_call)
+
+        self._display.display('{0:40} {1:>9}'.format('Slowest hosts', 'total s'))
+        for host, seconds in sorted(by_host.items(), key=lambda item: -item[1])[:SLOWEST_HOSTS]:
+            self._display.display('{0:40} {1:9.1f}'.format(host[:40], seconds))
+        self._display.display('')
+
+        path = os.environ.get('FOREMAN_TIMING_JSON')
+        if path:
+            with open(path, 'w') as f:
+                json.dump(self.records, f)
@@ -18,10 +18,59 @@ options:
     required: false
     default: present
     choices: ["present", "absent"]
+  result_fields:
+    description:
+    - Fields of the returned object to keep besides id, name, title and login.
+    - Use it to keep results small, e.g. [] to return identifying fields only. The whole object is returned if
+      not given.
+    required: false
+    default: None
+  foreman_endpoints:
+    description:
+    - List of Foreman servers to apply the same configuration to in parallel instead of the one of foreman_host.
+    - Items take foreman_host, foreman_port, foreman_user and foreman_pass, missing ones default to the options
+      of the module. String items are taken as foreman_host. Results are returned per Foreman in endpoints.
+    required: false
+    default: None
   foreman_host:
     description: Hostname or IP address of Foreman system
     required: false
     default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
   foreman_port:
     description: Port of Foreman API
     required: false
@@ -50,15 +99,11 @@ EXAMPLES = '''
     foreman_port: 443
 '''
 
-try:
-    from foreman.foreman import *
-except ImportError:
-    foremanclient_found = False
-else:
-    foremanclient_found = True
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_utils import ForemanError, ensure_endpoints, get_foreman_client, project
 
 
-def ensure():
+def ensure(module, theforeman):
     name = module.params['name']
     state = module.params['state']
 
@@ -87,37 +132,33 @@ def ensure():
 
 
 def main():
-    global module
-    global theforeman
-
     module = AnsibleModule(
         argument_spec=dict(
             name=dict(type='str', required=True),
             state=dict(type='str', default='present', choices=['present', 'absent']),
+            result_fields=dict(type='list', default=None),
+            foreman_endpoints=dict(type='list', default=None),
             foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
             foreman_port=dict(type='str', default='443'),
             foreman_user=dict(type='str', required=True),
             foreman_pass=dict(type='str', required=True)
         ),
     )
 
-    if not foremanclient_found:
-        module.fail_json(msg='python-foreman module is required. See https://github.com/Nosmoht/python-foreman.')
-
-    foreman_host = module.params['foreman_host']
-    foreman_port = module.params['foreman_port']
-    foreman_user = module.params['foreman_user']
-    foreman_pass = module.params['foreman_pass']
+    if module.params['foreman_endpoints']:
+        ensure_endpoints(module, ensure, 'architecture')
 
-    theforeman = Foreman(hostname=foreman_host,
-                         port=foreman_port,
-                         username=foreman_user,
-                         password=foreman_pass)
+    theforeman = get_foreman_client(module)
 
-    changed, arch = ensure()
-    module.exit_json(changed=changed, architecture=arch)
+    changed, arch = ensure(module, theforeman)
+    module.exit_json(changed=changed, architecture=project(arch, module.params['result_fields']))
 
-# import module snippets
-from ansible.module_utils.basic import *
 
-main()
+if __name__ == '__main__':
+    main()
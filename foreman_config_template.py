@@ -44,10 +44,59 @@ options:
     required: false
     default: 'present'
     choices: ['present', 'absent']
+  result_fields:
+    description:
+    - Fields of the returned object to keep besides id, name, title and login.
+    - Use it to keep results small, e.g. [] to return identifying fields only. The whole object is returned if
+      not given.
+    required: false
+    default: None
+  foreman_endpoints:
+    description:
+    - List of Foreman servers to apply the same configuration to in parallel instead of the one of foreman_host.
+    - Items take foreman_host, foreman_port, foreman_user and foreman_pass, missing ones default to the options
+      of the module. String items are taken as foreman_host. Results are returned per Foreman in endpoints.
+    required: false
+    default: None
   foreman_host:
     description: Hostname or IP address of Foreman system
     required: false
     default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
   foreman_port:
     description: Port of Foreman API
     required: false
@@ -81,29 +130,12 @@ EXAMPLES = '''
     foreman_pass: secret
 '''
 
-try:
-    from foreman.foreman import *
-
-    foremanclient_found = True
-except ImportError:
-    foremanclient_found = False
-
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_utils import (ForemanError, changed_fields, ensure_endpoints, get_foreman_client,
+                                                project)
 
-def dict_list_to_list(alist, key):
-    result = list()
-    if alist:
-        for item in alist:
-            result.append(item.get(key, None))
-    return result
-
-
-def equal_dict_lists(l1, l2, compare_key='name'):
-    s1 = set(dict_list_to_list(alist=l1, key=compare_key))
-    s2 = set(dict_list_to_list(alist=l2, key=compare_key))
-    return s1.issubset(s2) and s2.issubset(s1)
 
-
-def get_resources(resource_type, resource_func, resource_specs):
+def get_resources(module, resource_type, resource_func, resource_specs):
     result = list()
     if not resource_specs:
         return result
@@ -128,7 +160,7 @@ def get_resources(resource_type, resource_func, resource_specs):
     return result
 
 
-def ensure():
+def ensure(module, theforeman):
     audit_comment = module.params['audit_comment']
     compareable_keys = ['locked', 'snippet', 'template']
     locked = module.params['locked']
@@ -140,16 +172,6 @@ def ensure():
     template_file = module.params['template_file']
     template_kind_name = module.params['template_kind_name']
 
-    foreman_host = module.params['foreman_host']
-    foreman_port = module.params['foreman_port']
-    foreman_user = module.params['foreman_user']
-    foreman_pass = module.params['foreman_pass']
-
-    theforeman = Foreman(hostname=foreman_host,
-                         port=foreman_port,
-                         username=foreman_user,
-                         password=foreman_pass)
-
     data = dict(name=name)
 
     try:
@@ -187,7 +209,8 @@ def ensure():
         data['template_kind_name'] = template_kind_name
 
         if not snippet:
-            data['operatingsystems'] = get_resources(resource_type='operatingsystem',
+            data['operatingsystems'] = get_resources(module=module,
+                                                     resource_type='operatingsystem',
                                                      resource_func=theforeman.search_operatingsystem,
                                                      resource_specs=operatingsystems)
 
@@ -198,11 +221,13 @@ def ensure():
             except ForemanError as e:
                 module.fail_json(msg='Could not create config template: {0}'.format(e.message))
 
-        if (not all(data.get(key, None) == config_template.get(key, None) for key in compareable_keys)) or (
-                not equal_dict_lists(l1=data.get('operatingsystems', None),
-                                     l2=config_template.get('operatingsystems', None))):
+        changed = changed_fields(data=data, current=config_template, keys=compareable_keys + ['operatingsystems'],
+                                 list_keys=['operatingsystems'])
+        if changed:
+            if audit_comment:
+                changed['audit_comment'] = audit_comment
             try:
-                config_template = theforeman.update_config_template(id=config_template.get('id'), data=data)
+                config_template = theforeman.update_config_template(id=config_template.get('id'), data=changed)
                 return True, config_template
             except ForemanError as e:
                 module.fail_json(msg='Could not update config template: {0}'.format(e.message))
@@ -211,7 +236,6 @@ def ensure():
 
 
 def main():
-    global module
     module = AnsibleModule(
         argument_spec=dict(
             audit_comment=dict(type='str', required=False),
@@ -223,20 +247,29 @@ def main():
             template_kind_name=dict(type='str', required=False),
             snippet=dict(type='bool', default=False),
             state=dict(type='str', default='present', choices=['present', 'absent']),
+            result_fields=dict(type='list', default=None),
+            foreman_endpoints=dict(type='list', default=None),
             foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
             foreman_port=dict(type='str', default='443'),
             foreman_user=dict(type='str', required=True),
             foreman_pass=dict(type='str', required=True)
         ),
     )
 
-    if not foremanclient_found:
-        module.fail_json(msg='python-foreman module is required. See https://github.com/Nosmoht/python-foreman.')
+    if module.params['foreman_endpoints']:
+        ensure_endpoints(module, ensure, 'config_template')
+
+    theforeman = get_foreman_client(module)
 
-    changed, config_template = ensure()
-    module.exit_json(changed=changed, config_template=config_template)
+    changed, config_template = ensure(module, theforeman)
+    module.exit_json(changed=changed, config_template=project(config_template, module.params['result_fields']))
 
-# import module snippets
-from ansible.module_utils.basic import *
 
-main()
+if __name__ == '__main__':
+    main()
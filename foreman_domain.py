@@ -22,10 +22,59 @@ options:
     required: false
     default: present
     choices: ["present", "absent"]
+  result_fields:
+    description:
+    - Fields of the returned object to keep besides id, name, title and login.
+    - Use it to keep results small, e.g. [] to return identifying fields only. The whole object is returned if
+      not given.
+    required: false
+    default: None
+  foreman_endpoints:
+    description:
+    - List of Foreman servers to apply the same configuration to in parallel instead of the one of foreman_host.
+    - Items take foreman_host, foreman_port, foreman_user and foreman_pass, missing ones default to the options
+      of the module. String items are taken as foreman_host. Results are returned per Foreman in endpoints.
+    required: false
+    default: None
   foreman_host:
     description: Hostname or IP address of Foreman system
     required: false
     default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
   foreman_port:
     description: Port of Foreman API
     required: false
@@ -55,29 +104,16 @@ EXAMPLES = '''
     foreman_pass: secret
 '''
 
-try:
-    from foreman.foreman import *
-except ImportError:
-    foremanclient_found = False
-else:
-    foremanclient_found = True
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_utils import (ForemanError, changed_fields, ensure_endpoints, get_foreman_client,
+                                                project)
 
 
-def ensure(module):
+def ensure(module, theforeman):
     name = module.params['name']
     fullname = module.params['fullname']
     state = module.params['state']
 
-    foreman_host = module.params['foreman_host']
-    foreman_port = module.params['foreman_port']
-    foreman_user = module.params['foreman_user']
-    foreman_pass = module.params['foreman_pass']
-
-    theforeman = Foreman(hostname=foreman_host,
-                         port=foreman_port,
-                         username=foreman_user,
-                         password=foreman_pass)
-
     data = {'name': name}
 
     try:
@@ -102,7 +138,8 @@ def ensure(module):
             except ForemanError as e:
                 module.fail_json(msg='Could not delete domain: {0}'.format(e.message))
 
-        if not all(data[key] == domain[key] for key in data):
+        data = changed_fields(data=data, current=domain)
+        if data:
             try:
                 domain = theforeman.update_domain(id=domain.get('id'), data=data)
                 return True, domain
@@ -118,20 +155,29 @@ def main():
             name=dict(type='str', required=True),
             fullname=dict(type='str', required=False),
             state=dict(type='str', default='present', choices=['present', 'absent']),
+            result_fields=dict(type='list', default=None),
+            foreman_endpoints=dict(type='list', default=None),
             foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
             foreman_port=dict(type='str', default='443'),
             foreman_user=dict(type='str', required=True),
             foreman_pass=dict(type='str', required=True)
         ),
     )
 
-    if not foremanclient_found:
-        module.fail_json(msg='python-foreman module is required. See https://github.com/Nosmoht/python-foreman.')
+    if module.params['foreman_endpoints']:
+        ensure_endpoints(module, ensure, 'domain')
+
+    theforeman = get_foreman_client(module)
 
-    changed, domain = ensure(module)
-    module.exit_json(changed=changed, domain=domain)
+    changed, domain = ensure(module, theforeman)
+    module.exit_json(changed=changed, domain=project(domain, module.params['result_fields']))
 
-# import module snippets
-from ansible.module_utils.basic import *
 
-main()
+if __name__ == '__main__':
+    main()
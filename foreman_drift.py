@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+DOCUMENTATION = '''
+---
+module: foreman_drift
+short_description: Report differences between a desired configuration and Foreman using Foreman API v2
+description:
+- Compare the desired state of Foreman objects with Foreman without changing anything.
+- Takes the same lists of objects as foreman_state and additionally hosts. Items take the options of the
+  corresponding module.
+- Objects are compared as their modules do, an object drifts if its module would change it. Only the fields the
+  module updates are compared, options not given count with the module's defaults.
+- Each resource type is read once using its list endpoint instead of searching every object. Only objects whose
+  nested details are compared (operatingsystems, config templates, users, host parameters, compute attributes) are
+  fetched one by one, in parallel.
+options:
+  architectures:
+    description: List of architectures
+    required: false
+    default: None
+  compute_attributes:
+    description: List of compute attributes
+    required: false
+    default: None
+  compute_profiles:
+    description: List of compute profiles
+    required: false
+    default: None
+  compute_resources:
+    description: List of compute resources
+    required: false
+    default: None
+  config_templates:
+    description: List of config templates
+    required: false
+    default: None
+  domains:
+    description: List of domains
+    required: false
+    default: None
+  environments:
+    description: List of environments
+    required: false
+    default: None
+  hostgroups:
+    description: List of hostgroups
+    required: false
+    default: None
+  hosts:
+    description: List of hosts. Compared are the references foreman_host updates on existing hosts and parameters.
+    required: false
+    default: None
+  media:
+    description: List of media
+    required: false
+    default: None
+  operatingsystems:
+    description: List of operatingsystems
+    required: false
+    default: None
+  per_page:
+    description: Number of objects requested per page
+    required: false
+    default: 100
+  pool_size:
+    description: Number of objects fetched in parallel
+    required: false
+    default: 8
+  ptables:
+    description: List of partition tables
+    required: false
+    default: None
+  roles:
+    description: List of roles
+    required: false
+    default: None
+  smart_proxies:
+    description: List of smart proxies
+    required: false
+    default: None
+  subnets:
+    description: List of subnets
+    required: false
+    default: None
+  users:
+    description: List of users
+    required: false
+    default: None
+  foreman_host:
+    description: Hostname or IP address of Foreman system
+    required: false
+    default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
+  foreman_port:
+    description: Port of Foreman API
+    required: false
+    default: 443
+  foreman_user:
+    description: Username to be used to authenticate on Foreman
+    required: true
+    default: null
+  foreman_pass:
+    description: Password to be used to authenticate user on Foreman
+    required: true
+    default: null
+notes:
+- Requires the python-foreman package to be installed. See https://github.com/Nosmoht/python-foreman.
+- Never changes anything, changed is always false.
+author: Thomas Krahn
+'''
+
+EXAMPLES = '''
+- name: Report drift
+  foreman_drift:
+    domains:
+    - name: example.com
+      fullname: Example
+    hostgroups: "{{ foreman_hostgroups }}"
+    hosts: "{{ foreman_hosts }}"
+    foreman_user: admin
+    foreman_pass: secret
+    foreman_host: foreman.example.com
+    foreman_port: 443
+  register: drift
+
+- name: Show drift
+  debug:
+    var: drift.drift
+'''
+
+RETURN = '''
+drift:
+  description: One item for every object not in its desired state
+  returned: always
+  type: list
+  sample:
+  - resource: domains
+    name: example.com
+    status: changed
+    fields:
+      fullname:
+        desired: Example
+        current: Example Domain
+in_sync:
+  description: Number of objects in their desired state
+  returned: always
+  type: int
+'''
+
+from multiprocessing.pool import ThreadPool
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_resources import RESOURCES, diff_resource, get_name, normalize_spec
+from ansible.module_utils.foreman_utils import (ForemanError, HOST_UPDATABLE_REFS, get_foreman_client,
+                                                host_ref_differs, name_searches)
+
+
+def get_host_name(spec):
+    name = spec.get('name')
+    domain = spec.get('domain')
+    if domain and domain not in name:
+        return '{0}.{1}'.format(name, domain)
+    return name
+
+
+def read_objects(module, theforeman, resource, wanted, thin=False):
+    """
+    Return the current objects of resource indexed by their names (and titles).
+    """
+    per_page = module.params['per_page']
+    if resource == 'hosts':
+        # Search the wanted hosts instead of reading all hosts
+        searches = name_searches(wanted)
+        key = 'name'
+    else:
+        searches = [None]
+        key = RESOURCES[resource].get('key', 'name')
+
+    result = dict()
+    for search in searches:
+        for obj in theforeman.iter_resources(resource, search=search, per_page=per_page, thin=thin):
+            if 'identity' in RESOURCES.get(resource, dict()):
+                # Objects of the same name differ by the other identity fields, e.g. CentOS 7 and CentOS 8
+                result[get_name(resource, obj)] = obj
+                result.setdefault(obj.get(key), obj)
+            else:
+                result[obj.get(key)] = obj
+            if obj.get('title'):
+                result.setdefault(obj.get('title'), obj)
+    return result
+
+
+def diff_host(theforeman, spec, current):
+    """
+    Compare spec with the current host as foreman_host does: only the references it updates on existing hosts and
+    the parameters. References spec doesn't give aren't compared, foreman_host's defaults only apply to new hosts.
+    """
+    result = dict()
+    for ref in HOST_UPDATABLE_REFS:
+        if host_ref_differs(current, ref, spec.get(ref)):
+            result[ref] = dict(desired=spec[ref], current=current.get('{0}_name'.format(ref)))
+
+    if spec.get('parameters'):
+        current_parameters = dict((item.get('name'), item.get('value')) for item in
+                                  theforeman.iter_resources('hosts/{0}/parameters'.format(current.get('id'))))
+        for param in spec['parameters']:
+            value = current_parameters.get(param.get('name'))
+            # Ignore line breaks as foreman_host does
+            if value is None or value.replace('\n', '') != str(param.get('value')).replace('\n', ''):
+                result['parameters.{0}'.format(param.get('name'))] = dict(desired=param.get('value'), current=value)
+    return result
+
+
+def diff_compute_attribute(theforeman, spec, compute_resources, compute_profiles):
+    compute_resource = compute_resources.get(spec.get('compute_resource'))
+    compute_profile = compute_profiles.get(spec.get('compute_profile'))
+    if not compute_resource or not compute_profile:
+        return None
+    compute_attributes = theforeman.get_compute_attribute(compute_resource_id=compute_resource.get('id'),
+                                                          compute_profile_id=compute_profile.get('id'))
+    if not compute_attributes:
+        return None
+    current = compute_attributes[0]
+    result = dict()
+    for key, value in (spec.get('vm_attributes') or dict()).items():
+        if current.get(key, value) != value:
+            result[key] = dict(desired=value, current=current.get(key))
+    return result
+
+
+def detect(module, theforeman):
+    specs = dict()
+    for resource in list(RESOURCES) + ['hosts']:
+        if module.params[resource]:
+            specs[resource] = [normalize_spec(resource, spec) if resource != 'hosts' else spec
+                               for spec in module.params[resource]]
+
+    # Read every needed resource type once. Types only needed to look up ids of compute attributes are read thin.
+    needed = set(specs)
+    if 'compute_attributes' in needed:
+        needed.discard('compute_attributes')
+        needed.update(['compute_resources', 'compute_profiles'])
+    current = dict()
+    for resource in sorted(needed):
+        wanted = [get_host_name(spec) for spec in specs.get(resource, [])]
+        current[resource] = read_objects(module=module, theforeman=theforeman, resource=resource, wanted=wanted,
+                                         thin=resource not in specs)
+
+    def compare(item):
+        resource, spec = item
+        if resource == 'hosts':
+            name = get_host_name(spec)
+        else:
+            name = get_name(resource, spec)
+        result = dict(resource=resource, name=name)
+        state = spec.get('state', 'present')
+
+        try:
+            if resource == 'compute_attributes':
+                fields = diff_compute_attribute(theforeman=theforeman, spec=spec,
+                                                compute_resources=current['compute_resources'],
+                                                compute_profiles=current['compute_profiles'])
+                obj = fields is not None
+            else:
+                obj = current[resource].get(name)
+                if obj and state != 'absent':
+                    if resource == 'hosts':
+                        fields = diff_host(theforeman=theforeman, spec=spec, current=obj)
+                    else:
+                        if RESOURCES[resource].get('details'):
+                            obj = getattr(theforeman, 'get_{0}'.format(RESOURCES[resource]['type']))(id=obj.get('id'))
+                        fields = diff_resource(resource=resource, spec=spec, current=obj)
+        except ForemanError as e:
+            result.update(status='failed', msg=e.message)
+            return result
+
+        if state == 'absent':
+            if obj:
+                result['status'] = 'unexpected'
+        elif not obj:
+            result['status'] = 'missing'
+        elif fields:
+            result.update(status='changed', fields=fields)
+        return result
+
+    items = [(resource, spec) for resource in sorted(specs) for spec in specs[resource]]
+    pool = ThreadPool(processes=max(1, module.params['pool_size']))
+    try:
+        results = pool.map(compare, items)
+    finally:
+        pool.close()
+
+    drift = [result for result in results if result.get('status')]
+    return drift, len(results) - len(drift)
+
+
+def main():
+    argument_spec = dict(
+        hosts=dict(type='list', default=None),
+        per_page=dict(type='int', default=100),
+        pool_size=dict(type='int', default=8),
+        foreman_host=dict(type='str', default='127.0.0.1'),
+        foreman_read_hosts=dict(type='list', default=None),
+        metrics_file=dict(type='str', default=None),
+        trace_dir=dict(type='str', default=None),
+        http_cache=dict(type='str', default=None),
+        http_pool_size=dict(type='int', default=10),
+        http_timeout=dict(type='float', default=None),
+        foreman_port=dict(type='str', default='443'),
+        foreman_user=dict(type='str', required=True),
+        foreman_pass=dict(type='str', required=True)
+    )
+    for resource in RESOURCES:
+        argument_spec[resource] = dict(type='list', default=None)
+
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+
+    theforeman = get_foreman_client(module)
+
+    try:
+        drift, in_sync = detect(module, theforeman)
+    except ForemanError as e:
+        module.fail_json(msg='Could not read Foreman objects: {0}'.format(e.message))
+    module.exit_json(changed=False, drift=drift, in_sync=in_sync)
+
+
+if __name__ == '__main__':
+    main()
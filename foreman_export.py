@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+DOCUMENTATION = '''
+---
+module: foreman_export
+short_description: Export Foreman objects to a JSON Lines file using Foreman API v2
+description:
+- Page through the Foreman API and write every object as one line of JSON to a file.
+- Each line looks like {"resource": "hostgroups", "object": {...}}. Objects are written as soon as their page
+  was read, so memory usage doesn't grow with the number of objects.
+- Objects are exported as returned by Foreman's list endpoints, i.e. without nested details like parameters.
+options:
+  dest:
+    description: Path of the file to write. The file is replaced once the export finished successfully.
+    required: true
+    default: null
+  compress:
+    description: Compress the file using gzip
+    required: false
+    default: false
+  mirror:
+    description:
+    - Path of a SQLite database used as local mirror of Foreman objects by other modules.
+    - If given the mirror is seeded with the exported objects.
+    required: false
+    default: None
+  per_page:
+    description: Number of objects requested per page
+    required: false
+    default: 100
+  resources:
+    description:
+    - List of resources to export. Resources Foreman doesn't know (e.g. locations without Katello) are skipped.
+    required: false
+    default: All resources
+    choices: ['architectures', 'compute_profiles', 'compute_resources', 'config_templates', 'domains',
+              'environments', 'hosts', 'hostgroups', 'locations', 'media', 'operatingsystems', 'organizations',
+              'ptables', 'roles', 'smart_proxies', 'subnets', 'users']
+  foreman_host:
+    description: Hostname or IP address of Foreman system
+    required: false
+    default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
+  foreman_port:
+    description: Port of Foreman API
+    required: false
+    default: 443
+  foreman_user:
+    description: Username to be used to authenticate on Foreman
+    required: true
+    default: null
+  foreman_pass:
+    description: Password to be used to authenticate user on Foreman
+    required: true
+    default: null
+notes:
+- Requires the python-foreman package to be installed. See https://github.com/Nosmoht/python-foreman.
+author: Thomas Krahn
+'''
+
+EXAMPLES = '''
+- name: Export Foreman configuration
+  foreman_export:
+    dest: /var/backups/foreman/{{ ansible_date_time.date }}.jsonl.gz
+    compress: true
+    mirror: /var/cache/ansible/foreman.sqlite
+    foreman_user: admin
+    foreman_pass: secret
+    foreman_host: foreman.example.com
+    foreman_port: 443
+  delegate_to: localhost
+  run_once: true
+'''
+
+import gzip
+import json
+import os
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_mirror import get_mirror
+from ansible.module_utils.foreman_utils import RESOURCE_ENDPOINTS, ForemanError, get_foreman_client
+
+EXPORT_RESOURCES = sorted(set(RESOURCE_ENDPOINTS.values()))
+
+
+def export(module, theforeman):
+    dest = module.params['dest']
+    per_page = module.params['per_page']
+    resources = module.params['resources'] or EXPORT_RESOURCES
+    mirror = get_mirror(module)
+
+    counts = dict()
+    skipped = list()
+
+    tmp_dest = '{0}.{1}.tmp'.format(dest, os.getpid())
+    if module.params['compress']:
+        f = gzip.open(tmp_dest, 'wb')
+    else:
+        f = open(tmp_dest, 'wb')
+
+    def export_resource(resource):
+        for obj in theforeman.iter_resources(resource, per_page=per_page):
+            f.write((json.dumps(dict(resource=resource, object=obj)) + '\n').encode('utf-8'))
+            counts[resource] += 1
+            yield obj
+
+    try:
+        for resource in resources:
+            counts[resource] = 0
+            try:
+                if mirror:
+                    mirror.replace(resource, export_resource(resource))
+                else:
+                    for _ in export_resource(resource):
+                        pass
+            except ForemanError as e:
+                if e.status_code != 404:
+                    raise
+                del counts[resource]
+                skipped.append(resource)
+        f.close()
+        os.rename(tmp_dest, dest)
+    except ForemanError as e:
+        f.close()
+        os.remove(tmp_dest)
+        module.fail_json(msg='Could not export {0}: {1}'.format(resource, e.message))
+
+    return counts, skipped
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            dest=dict(type='path', required=True),
+            compress=dict(type='bool', default=False),
+            mirror=dict(type='path', default=None),
+            per_page=dict(type='int', default=100),
+            resources=dict(type='list', default=None, choices=EXPORT_RESOURCES),
+            foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
+            foreman_port=dict(type='str', default='443'),
+            foreman_user=dict(type='str', required=True),
+            foreman_pass=dict(type='str', required=True)
+        ),
+    )
+
+    theforeman = get_foreman_client(module)
+
+    counts, skipped = export(module, theforeman)
+    module.exit_json(changed=True, dest=module.params['dest'], counts=counts, skipped=skipped)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,20 +6,28 @@ DOCUMENTATION = '''
 module: foreman_host
 short_description: Create, update and delete hosts with Foreman using Foreman API v2
 description:
-- Create and delete hosts using Foreman API v2
+- Create, update and delete hosts using Foreman API v2
+- References of existing hosts (architecture, domain, environment, hostgroup, location, medium, operatingsystem,
+  organization, subnet) are updated if they differ from the options. References not given are left as they are.
+  Only differing references are looked up and all of them are changed with one update. Everything else is only
+  used to create hosts.
 options:
   name:
-    description: Hostgroup name
+    description: Host name. Required unless I(hosts) is used
     required: false
     default: None
   architecture:
-    description: Architecture name
+    description: Architecture name. New hosts get x86_64 if not given, existing hosts keep theirs
     required: false
-    default: x86_64
+    default: None
   build:
     description: Boolean to define if host should be builded
     required: false
     default: false
+  build_timeout:
+    description: Seconds I(wait_for_build) waits for a host before failing it
+    required: false
+    default: 3600
   compute_profile:
     description: Compute Profile name
     required: false
@@ -44,10 +52,29 @@ options:
     description: Hostgroup name
     required: false
     default: None
+  hosts:
+    description:
+    - List of host definitions to ensure within one module run. Each item takes the same options as the
+      module itself and overrides the values given on module level. All hosts share one connection to Foreman.
+    - Items are checked against the types and choices of the options before any host is ensured.
+    - Used by the foreman_host action plugin to aggregate hosts delegated to the controller.
+    required: false
+    default: None
   image:
     description: Image name to be used if creating from image
     required: false
     default: None
+  job_state:
+    description:
+    - Path of a file on the machine running the module to record pending builds of created hosts and power actions
+      in, with the host id and the deadline given by I(build_timeout).
+    - A later run for a host with a pending job only checks whether the job finished, returning I(pending), instead
+      of ensuring the host again. Once the job finished the host is ensured as usual. Meant for polling hosts
+      started with Ansible's async.
+    - Only a build (state present or running) or the power action of the requested state is checked, other jobs of
+      the host are dropped. Jobs are kept per Foreman, so several Foremans may share the file.
+    required: false
+    default: None
   location:
     description: Location name (Only useful with Katello)
     required: false
@@ -60,6 +87,17 @@ options:
     description: Medium name
     required: false
     default: None
+  mirror:
+    description:
+    - Path of a SQLite database on the system running the module used as local mirror of Foreman objects.
+      References and the host itself are looked up in the mirror and only searched on Foreman if not mirrored.
+    - Changes made outside of Ansible are noticed once the mirror gets synced again, see I(mirror_max_age).
+    required: false
+    default: None
+  mirror_max_age:
+    description: Seconds after which mirrored objects are synced incrementally with Foreman
+    required: false
+    default: 300
   operatingsystem:
     descrtiption: Operatingsystem name
     required: false
@@ -72,6 +110,24 @@ options:
     description: List of parameters and values
     required: false
     default: None
+  per_page:
+    description: Number of host parameters requested per page
+    required: false
+    default: 100
+  poll_interval:
+    description: Seconds between polls of the build state of the hosts I(wait_for_build) waits for
+    required: false
+    default: 30
+  pool_size:
+    description: Number of hosts of I(hosts) ensured in parallel
+    required: false
+    default: 4
+  progress:
+    description:
+    - Path of a file every ensured, built and failed host is appended to as one line of JSON.
+    - Follow it with tail -f while the module runs.
+    required: false
+    default: None
   provision_method:
     description: How to provision the host
     required: false
@@ -85,10 +141,59 @@ options:
     description: Name of subnet to use for this host
     required: false
     default: null
+  wait_for_build:
+    description:
+    - Wait until hosts in build mode are built, i.e. Foreman left build mode for them or they sent their first
+      report. All building hosts (of I(hosts) as well) are polled together with one search per 50 hosts.
+    - The module returns as soon as the last host is built, hosts not built within I(build_timeout) fail.
+    required: false
+    default: false
+  result_fields:
+    description:
+    - Fields of the returned object to keep besides id, name, title and login.
+    - Use it to keep results small, e.g. [] to return identifying fields only. The whole object is returned if
+      not given.
+    required: false
+    default: None
   foreman_host:
     description: Hostname or IP address of Foreman system
     required: false
     default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
   foreman_port:
     description: Port of Foreman API
     required: false
@@ -106,17 +211,89 @@ notes:
 author: Thomas Krahn
 '''
 
-try:
-    from foreman.foreman import *
-except ImportError:
-    foremanclient_found = False
-else:
-    foremanclient_found = True
-
-
-def get_resource(resource_type, resource_func, resource_name):
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_jobs import JobState
+from ansible.module_utils.foreman_mirror import get_mirror
+from ansible.module_utils.foreman_utils import (ARCHITECTURE, COMPUTE_PROFILE, COMPUTE_RESOURCE, DOMAIN, ENVIRONMENT,
+                                                HOST_UPDATABLE_REFS, HOSTGROUP, LOCATION, MEDIUM, OPERATINGSYSTEM,
+                                                ORGANIZATION, SUBNET, ForemanError, ModuleView, Progress,
+                                                get_foreman_client, host_ref_differs, poll_builds, project)
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.module_utils.six import integer_types, string_types
+
+# Architecture of created hosts if the architecture option isn't given
+DEFAULT_ARCHITECTURE = 'x86_64'
+
+
+class HostSpecError(Exception):
+    def __init__(self, message):
+        super(HostSpecError, self).__init__(message)
+        self.message = message
+
+
+class HostSpec(ModuleView):
+    """
+    Stand-in for the AnsibleModule while ensuring one item of the hosts option.
+    fail_json raises instead of exiting so a failing host doesn't abort the other hosts of the batch.
+    """
+
+    def __init__(self, module, spec):
+        if not isinstance(spec, dict):
+            raise HostSpecError('Items of hosts must be dicts, got {0}'.format(spec))
+        params = dict(module.params)
+        params['hosts'] = None
+        unknown = sorted(str(key) for key in spec if key == 'hosts' or key not in module.argument_spec)
+        if unknown:
+            raise HostSpecError('Unsupported parameters {0}'.format(', '.join(unknown)))
+        for key, value in spec.items():
+            params[key] = check_option(key, module.argument_spec[key], value)
+        super(HostSpec, self).__init__(module=module, params=params)
+
+    def fail_json(self, msg, **kwargs):
+        raise HostSpecError(msg)
+
+
+def check_option(name, option, value):
+    """
+    Return value of a hosts item converted to the type of the option as AnsibleModule would, raise HostSpecError if
+    it can't be or isn't one of the option's choices.
+    """
+    if value is None:
+        return None
+    option_type = option.get('type', 'str')
+    try:
+        if option_type == 'bool' and not isinstance(value, bool):
+            value = boolean(value)
+        elif option_type == 'int' and not isinstance(value, integer_types):
+            value = int(value)
+        elif option_type == 'float' and not isinstance(value, float):
+            value = float(value)
+        elif option_type == 'list' and not isinstance(value, list):
+            if not isinstance(value, string_types):
+                raise TypeError(value)
+            value = [item.strip() for item in value.split(',')]
+        elif option_type in ('str', 'path'):
+            if isinstance(value, (bool, list, dict)):
+                raise TypeError(value)
+            value = str(value) if not isinstance(value, string_types) else value
+    except (TypeError, ValueError):
+        raise HostSpecError('{0} must be of type {1}, got {2}'.format(name, option_type, value))
+    if option.get('choices') and value not in option['choices']:
+        raise HostSpecError('{0} must be one of {1}, got {2}'.format(name, ', '.join(option['choices']), value))
+    return value
+
+
+def get_resource(module, resource_type, resource_func, resource_name, mirror=None):
     try:
-        result = resource_func(data=dict(name=resource_name))
+        result = None
+        if mirror:
+            result = mirror.find(resource_type, name=resource_name)
+        if not result:
+            result = resource_func(data=dict(name=resource_name))
+            if mirror:
+                mirror.store(resource_type, result)
         if not result:
             module.fail_json(msg='{resource_type} {resource_name} not found'.format(resource_type=resource_type,
                                                                                     resource_name=resource_name))
@@ -126,8 +303,62 @@ def get_resource(resource_type, resource_func, resource_name):
     return result
 
 
-def ensure():
+def update_refs(module, theforeman, host, mirror=None):
+    """
+    Update the references of the existing host that differ from the options with a single update. References are
+    compared by name, only differing ones are looked up, ones not given are skipped. Return changed and the host.
+    """
+    data = dict()
+    for ref in HOST_UPDATABLE_REFS:
+        wanted = module.params[ref]
+        if not host_ref_differs(host, ref, wanted):
+            continue
+        resource = get_resource(module=module,
+                                resource_type=ref,
+                                resource_func=getattr(theforeman, 'search_{0}'.format(ref)),
+                                resource_name=wanted,
+                                mirror=mirror)
+        if resource.get('id') != host.get('{0}_id'.format(ref)):
+            data['{0}_id'.format(ref)] = resource.get('id')
+
+    if not data:
+        return False, host
+    try:
+        host = theforeman.update_host(id=host.get('id'), data=data)
+        if mirror:
+            mirror.store('host', host)
+    except ForemanError as e:
+        module.fail_json(msg='Could not update host: {0}'.format(e.message))
+    return True, host
+
+
+def get_host_parameters(module, theforeman, host_id, names):
+    """
+    Return the parameters of the host named like one of names. Paging stops once all of them were found.
+    """
+    wanted = set(names)
+    result = list()
+    try:
+        host_parameters = theforeman.iter_resources('hosts/{0}/parameters'.format(host_id),
+                                                    per_page=module.params['per_page'])
+        for item in host_parameters:
+            if item.get('name') in wanted:
+                result.append(item)
+                wanted.discard(item.get('name'))
+                if not wanted:
+                    host_parameters.close()
+                    break
+    except ForemanError as e:
+        module.fail_json(msg='Could not get host parameters: {0}'.format(e.message))
+    return result
+
+
+def ensure(module, theforeman, mirror=None, jobs=None):
+    """
+    Ensure the host. With jobs a build of a created host and power actions are recorded as pending jobs.
+    """
     changed = False
+    job = None
     name = module.params['name']
     architecture_name = module.params[ARCHITECTURE]
     build = module.params['build']
@@ -148,15 +379,9 @@ def ensure():
     root_pass = module.params['root_pass']
     state = module.params['state']
     subnet_name = module.params[SUBNET]
-    foreman_host = module.params['foreman_host']
-    foreman_port = module.params['foreman_port']
-    foreman_user = module.params['foreman_user']
-    foreman_pass = module.params['foreman_pass']
 
-    theforeman = Foreman(hostname=foreman_host,
-                         port=foreman_port,
-                         username=foreman_user,
-                         password=foreman_pass)
+    if not name:
+        module.fail_json(msg='name is required')
 
     if domain_name:
         if domain_name in name:
@@ -169,14 +394,21 @@ def ensure():
     data = dict(name=host_name)
 
     try:
-        host = theforeman.search_host(data=data)
+        host = None
+        if mirror:
+            host = mirror.find('host', name=host_name)
+        if not host:
+            host = theforeman.search_host(data=data)
     except ForemanError as e:
         module.fail_json(msg='Error while searching host: {0}'.format(e.message))
 
     if state == 'absent':
         if host:
             try:
-                host = theforeman.delete_host(id=host.get('id'))
+                host_id = host.get('id')
+                host = theforeman.delete_host(id=host_id)
+                if mirror:
+                    mirror.forget('host', host_id)
                 return True, host
             except ForemanError as e:
                 module.fail_json(msg='Could not delete host: {0}'.format(e.message))
@@ -185,27 +417,32 @@ def ensure():
     if not host:
 
         # Architecture
-        if architecture_name:
-            architecture = get_resource(resource_type=ARCHITECTURE,
-                                        resource_func=theforeman.search_architecture,
-                                        resource_name=architecture_name)
-            data['architecture_id'] = architecture.get('id')
+        architecture = get_resource(module=module,
+                                    resource_type=ARCHITECTURE,
+                                    resource_func=theforeman.search_architecture,
+                                    resource_name=architecture_name or DEFAULT_ARCHITECTURE,
+                                    mirror=mirror)
+        data['architecture_id'] = architecture.get('id')
 
         # Build
         data['build'] = build
 
         # Compute Profile
         if compute_profile_name:
-            compute_profile = get_resource(resource_type=COMPUTE_PROFILE,
+            compute_profile = get_resource(module=module,
+                                           resource_type=COMPUTE_PROFILE,
                                            resource_func=theforeman.search_compute_profile,
-                                           resource_name=compute_profile_name)
+                                           resource_name=compute_profile_name,
+                                           mirror=mirror)
             data['compute_profile_id'] = compute_profile.get('id')
 
         # Compute Resource
         if compute_resource_name:
-            compute_resource = get_resource(resource_type=COMPUTE_RESOURCE,
+            compute_resource = get_resource(module=module,
+                                            resource_type=COMPUTE_RESOURCE,
                                             resource_func=theforeman.search_compute_resource,
-                                            resource_name=compute_resource_name)
+                                            resource_name=compute_resource_name,
+                                            mirror=mirror)
             data['compute_resource_id'] = compute_resource.get('id')
 
             # Image
@@ -227,9 +464,11 @@ def ensure():
 
         # Domain
         if domain_name:
-            domain = get_resource(resource_type=DOMAIN,
+            domain = get_resource(module=module,
+                                  resource_type=DOMAIN,
                                   resource_func=theforeman.search_domain,
-                                  resource_name=domain_name)
+                                  resource_name=domain_name,
+                                  mirror=mirror)
             data['domain_id'] = domain.get('id')
 
         # Enabled
@@ -237,23 +476,29 @@ def ensure():
 
         # Environment
         if environment_name:
-            environment = get_resource(resource_type=ENVIRONMENT,
+            environment = get_resource(module=module,
+                                       resource_type=ENVIRONMENT,
                                        resource_func=theforeman.search_environment,
-                                       resource_name=environment_name)
+                                       resource_name=environment_name,
+                                       mirror=mirror)
             data['environment_id'] = environment.get('id')
 
         # Hostgroup
         if hostgroup_name:
-            hostgroup = get_resource(resource_type=HOSTGROUP,
+            hostgroup = get_resource(module=module,
+                                     resource_type=HOSTGROUP,
                                      resource_func=theforeman.search_hostgroup,
-                                     resource_name=hostgroup_name)
+                                     resource_name=hostgroup_name,
+                                     mirror=mirror)
             data['hostgroup_id'] = hostgroup.get('id')
 
         # Location
         if location_name:
-            location = get_resource(resource_type=LOCATION,
+            location = get_resource(module=module,
+                                    resource_type=LOCATION,
                                     resource_func=theforeman.search_location,
-                                    resource_name=location_name)
+                                    resource_name=location_name,
+                                    mirror=mirror)
             data['location_id'] = location.get('id')
 
         # Managed
@@ -261,23 +506,29 @@ def ensure():
 
         # Medium
         if medium_name:
-            medium = get_resource(resource_type=MEDIUM,
+            medium = get_resource(module=module,
+                                  resource_type=MEDIUM,
                                   resource_func=theforeman.search_medium,
-                                  resource_name=medium_name)
+                                  resource_name=medium_name,
+                                  mirror=mirror)
             data['medium_id'] = medium.get('id')
 
         # Organization
         if organization_name:
-            organization = get_resource(resource_type=ORGANIZATION,
+            organization = get_resource(module=module,
+                                        resource_type=ORGANIZATION,
                                         resource_func=theforeman.search_organization,
-                                        resource_name=organization_name)
+                                        resource_name=organization_name,
+                                        mirror=mirror)
             data['organization_id'] = organization.get('id')
 
         # Operatingssystem
         if operatingsystem_name:
-            operatingsystem = get_resource(resource_type=OPERATINGSYSTEM,
+            operatingsystem = get_resource(module=module,
+                                           resource_type=OPERATINGSYSTEM,
                                            resource_func=theforeman.search_operatingsystem,
-                                           resource_name=operatingsystem_name)
+                                           resource_name=operatingsystem_name,
+                                           mirror=mirror)
             data['operatingsystem_id'] = operatingsystem.get('id')
 
         # Provision Method
@@ -290,26 +541,38 @@ def ensure():
 
         # Subnet
         if subnet_name:
-            subnet = get_resource(resource_type=SUBNET,
+            subnet = get_resource(module=module,
+                                  resource_type=SUBNET,
                                   resource_func=theforeman.search_subnet,
-                                  resource_name=subnet_name)
+                                  resource_name=subnet_name,
+                                  mirror=mirror)
             data['subnet_id'] = subnet.get('id')
 
         try:
             host = theforeman.create_host(data=data)
+            if mirror:
+                mirror.store('host', host)
         except ForemanError as e:
             module.fail_json(msg='Could not create host: {0}'.format(e.message))
 
         changed = True
+        if jobs and not is_built(host):
+            job = jobs.start(get_job_key(module), host_id=host.get('id'), operation='build',
+                             timeout=module.params['build_timeout'])
+    else:
+        # The search result (or mirrored host) may lack details, read the host once
+        try:
+            host = theforeman.get_host(id=host.get('id'))
+        except ForemanError as e:
+            module.fail_json(msg='Could not get host: {0}'.format(e.message))
+        changed, host = update_refs(module=module, theforeman=theforeman, host=host, mirror=mirror)
 
     host_id = host.get('id')
 
     # Parameters
     if parameters:
-        try:
-            host_parameters = theforeman.get_host_parameters(host_id=host_id)
-        except ForemanError as e:
-            module.fail_json(msg='Could not get host parameters: {0}'.format(e.message))
+        host_parameters = get_host_parameters(module=module, theforeman=theforeman, host_id=host_id,
+                                              names=[param.get('name') for param in parameters])
 
         for param in parameters:
             host_params = [item for item in host_parameters if item.get('name') == param.get('name')]
@@ -335,12 +598,14 @@ def ensure():
                                     param_name=param.get('name'), error=e.message))
                         changed = True
 
-    try:
-        host_power = theforeman.get_host_power(host_id=host_id)
-    except ForemanError as e:
-        module.fail_json(msg='Could not get host power information: {0}'.format(e.message))
-
-    host_power_state = host_power.get('power')
+    # Only running and stopped depend on the power state
+    host_power_state = None
+    if state in ['running', 'stopped']:
+        try:
+            host_power = theforeman.get_host_power(host_id=host_id)
+        except ForemanError as e:
+            module.fail_json(msg='Could not get host power information: {0}'.format(e.message))
+        host_power_state = host_power.get('power')
 
     if state == 'rebooted':
         try:
@@ -354,55 +619,261 @@ def ensure():
             changed = True
         except ForemanError as e:
             module.fail_json(msg='Could not power on host: {0}'.format(e.message))
+        if jobs and not job:
+            jobs.start(get_job_key(module), host_id=host_id, operation='power',
+                       timeout=module.params['build_timeout'], power='poweredOn')
     elif state == 'stopped' and host_power_state != 'poweredOff':
         try:
             theforeman.poweroff_host(host_id=host_id)
             changed = True
         except ForemanError as e:
             module.fail_json(msg='Could not power off host: {0}'.format(e.message))
+        if jobs and not job:
+            jobs.start(get_job_key(module), host_id=host_id, operation='power',
+                       timeout=module.params['build_timeout'], power='poweredOff')
 
     return changed, host
 
 
+def get_job_key(module):
+    """
+    Return the key of the host's job in the job state file. Includes the Foreman as several may share the file.
+    """
+    return '{0}:{1}/{2}'.format(module.params['foreman_host'], module.params['foreman_port'], module.params['name'])
+
+
+def job_matches(module, job):
+    """
+    Whether job is what the requested state waits for: a build for present and running, a power action for
+    running and stopped.
+    """
+    state = module.params['state']
+    if job['operation'] == 'build':
+        return state in ['present', 'running']
+    return job.get('power') == dict(running='poweredOn', stopped='poweredOff').get(state)
+
+
+def check_job(module, theforeman, jobs, key, job):
+    """
+    Check whether the pending job of a previous run finished instead of ensuring the host again.
+    Return the host and whether the job is still pending.
+    """
+    name = module.params['name']
+    if time.time() > job['deadline']:
+        jobs.finish(key)
+        module.fail_json(msg='{0} of host {1} did not finish within {2} seconds'.format(
+            job['operation'].capitalize(), name, int(job['deadline'] - job['started'])))
+    try:
+        host = theforeman.get_host(id=job['host_id'])
+        if job['operation'] == 'build':
+            done = is_built(host)
+        else:
+            done = theforeman.get_host_power(host_id=job['host_id']).get('power') == job['power']
+    except ForemanError as e:
+        if e.status_code == 404:
+            jobs.finish(key)
+        module.fail_json(msg='Could not check {0} of host {1}: {2}'.format(job['operation'], name, e.message))
+    if done:
+        jobs.finish(key)
+    return host, not done
+
+
+def ensure_host(module, theforeman, mirror=None, jobs=None):
+    """
+    Ensure the host. If a job of a previous run is pending for it and the requested state waits for that job, only
+    check the job while it's pending. A job the requested state doesn't wait for is dropped.
+    Return changed, the host and whether a job is pending. A job finishing counts as changed.
+    """
+    key = get_job_key(module)
+    job = jobs.get(key) if jobs else None
+    finished = False
+    if job:
+        if not job_matches(module, job):
+            jobs.finish(key)
+        else:
+            host, pending = check_job(module, theforeman, jobs, key, job)
+            if pending:
+                return False, host, True
+            finished = True
+    changed, host = ensure(module=module, theforeman=theforeman, mirror=mirror, jobs=jobs)
+    return changed or finished, host, bool(jobs and jobs.get(key))
+
+
+def is_built(host):
+    return not host.get('build') or bool(host.get('last_report'))
+
+
+def wait_for_builds(module, theforeman, names, progress):
+    """
+    Poll the hosts named names until they are built. All hosts are searched together every poll_interval seconds.
+    Return the error of every host not built (deleted or timed out) and the seconds each built host took.
+    """
+    start = time.time()
+    started = dict((name, start) for name in names)
+    errors = dict()
+    seconds = dict()
+    while started:
+        time.sleep(module.params['poll_interval'])
+        built, failed = poll_builds(theforeman, started, timeout=module.params['build_timeout'], progress=progress,
+                                    per_page=module.params['per_page'], is_built=is_built)
+        for name, elapsed in built.items():
+            seconds[name] = elapsed
+            progress.write(host=name, status='built', seconds=elapsed)
+        for name, msg in failed.items():
+            errors[name] = msg
+            progress.write(host=name, status='failed', msg=msg)
+        for name in list(built) + list(failed):
+            del started[name]
+    return errors, seconds
+
+
+def ensure_hosts(module, theforeman, mirror=None, progress=None, jobs=None):
+    """
+    Ensure all items of the hosts option using a pool of pool_size threads sharing one Foreman connection.
+    Results are returned in the order of the hosts option. With wait_for_build the hosts left in build mode are
+    waited for together once all hosts were ensured.
+    """
+    from multiprocessing.pool import ThreadPool
+
+    from ansible.module_utils.foreman_telemetry import trace_span
+
+    progress = progress or Progress(None)
+
+    host_modules = list()
+    for index, spec in enumerate(module.params['hosts']):
+        try:
+            host_modules.append(HostSpec(module=module, spec=spec))
+        except HostSpecError as e:
+            module.fail_json(msg='hosts item {0}: {1}'.format(index + 1, e.message))
+
+    def ensure_spec(host_module):
+        """
+        Return the result of host_module and the name of the host if it must be waited for. Errors only fail the
+        host.
+        """
+        name = host_module.params['name']
+        try:
+            with trace_span('ensure', **{'foreman.host': name}):
+                changed, host, pending = ensure_host(module=host_module, theforeman=theforeman, mirror=mirror,
+                                                     jobs=jobs)
+        except (HostSpecError, ForemanError) as e:
+            progress.write(host=name, status='failed', msg=e.message)
+            return dict(changed=False, failed=True, msg=e.message), None
+        except Exception as e:
+            progress.write(host=name, status='failed', msg=str(e))
+            return dict(changed=False, failed=True, msg=str(e)), None
+        building = host.get('name') if module.params['wait_for_build'] and host and not is_built(host) else None
+        progress.write(host=name, status='building' if building else 'ensured', changed=changed)
+        result = dict(changed=changed, host=project(host, module.params['result_fields']))
+        if jobs:
+            result.update(job=get_job_key(host_module), pending=pending)
+        return result, building
+
+    pool = ThreadPool(processes=max(1, module.params['pool_size']))
+    try:
+        ensured = pool.map(ensure_spec, host_modules)
+    finally:
+        pool.close()
+
+    results = [result for result, building in ensured]
+    building = dict((name, result) for result, name in ensured if name)
+    if building:
+        errors, seconds = wait_for_builds(module, theforeman, list(building), progress)
+        for name, result in building.items():
+            if name in errors:
+                result.update(failed=True, msg=errors[name])
+            else:
+                result['build_seconds'] = seconds[name]
+            if jobs:
+                jobs.finish(result['job'])
+                result['pending'] = False
+    for result in results:
+        result.pop('job', None)
+    return any(result.get('changed') for result in results), results
+
+
 def main():
-    global module
     module = AnsibleModule(
         argument_spec=dict(
-            name=dict(type='str', required=True),
-            architecture=dict(type='str', default='x86_64'),
+            name=dict(type='str', required=False),
+            architecture=dict(type='str', default=None),
             build=dict(type='bool', default=False),
+            build_timeout=dict(type='int', default=3600),
             compute_profile=dict(type='str', default=None),
             compute_resource=dict(type='str', default=None),
             domain=dict(type='str', default=None),
             enabled=dict(type='bool', default=False),
             environment=dict(type='str', default=None),
             hostgroup=dict(type='str', default=None),
+            hosts=dict(type='list', default=None),
             image=dict(type='str', default=None),
+            job_state=dict(type='path', default=None),
             location=dict(type='str', default=None),
             managed=dict(type='bool', default=False),
             medium=dict(type='str', default=None),
+            mirror=dict(type='str', default=None),
+            mirror_max_age=dict(type='int', default=300),
             operatingsystem=dict(type='str', default=None),
             organization=dict(type='str', default=None),
             parameters=dict(type='list', default=None),
+            per_page=dict(type='int', default=100),
+            poll_interval=dict(type='int', default=30),
+            pool_size=dict(type='int', default=4),
+            progress=dict(type='path', default=None),
             provision_method=dict(type='str', required=False, choices=['build', 'image']),
             root_pass=dict(type='str', default=None),
             state=dict(type='str', default='present',
                        choices=['present', 'absent', 'running', 'stopped', 'rebooted']),
             subnet=dict(type='str', default=None),
+            wait_for_build=dict(type='bool', default=False),
+            result_fields=dict(type='list', default=None),
             foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
             foreman_port=dict(type='str', default='443'),
             foreman_user=dict(type='str', required=True),
             foreman_pass=dict(type='str', required=True)
         ),
+        required_one_of=[['name', 'hosts']],
+        mutually_exclusive=[['name', 'hosts']],
     )
 
-    if not foremanclient_found:
-        module.fail_json(msg='python-foreman module is required. See https://github.com/Nosmoht/python-foreman.')
-
-    changed, host = ensure()
-    module.exit_json(changed=changed, host=host)
-
-# import module snippets
-from ansible.module_utils.basic import *
-
-main()
+    theforeman = get_foreman_client(module)
+    mirror = get_mirror(module)
+
+    progress = Progress(module.params['progress'])
+    jobs = JobState(module.params['job_state']) if module.params['job_state'] else None
+
+    if module.params['hosts'] is not None:
+        changed, results = ensure_hosts(module=module, theforeman=theforeman, mirror=mirror, progress=progress,
+                                        jobs=jobs)
+        progress.close()
+        failed = [result for result in results if result.get('failed')]
+        if failed:
+            module.fail_json(msg='{0} of {1} hosts failed'.format(len(failed), len(results)),
+                             changed=changed, results=results)
+        module.exit_json(changed=changed, results=results)
+
+    changed, host, pending = ensure_host(module=module, theforeman=theforeman, mirror=mirror, jobs=jobs)
+    result = dict(changed=changed, host=project(host, module.params['result_fields']))
+    if jobs:
+        result['pending'] = pending
+    if module.params['wait_for_build'] and host and not is_built(host):
+        progress.write(host=host.get('name'), status='building', changed=changed)
+        errors, seconds = wait_for_builds(module, theforeman, [host.get('name')], progress)
+        progress.close()
+        if jobs:
+            jobs.finish(get_job_key(module))
+            result['pending'] = False
+        if errors:
+            module.fail_json(msg=errors[host.get('name')], **result)
+        result['build_seconds'] = seconds[host.get('name')]
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+DOCUMENTATION = '''
+---
+module: foreman_host_decommission
+short_description: Delete all hosts matching a search using Foreman API v2
+description:
+- Search hosts using a Foreman search query, optionally power them off and delete them.
+- Matching hosts are read page by page keeping only their id and name. They are deleted in parallel after the
+  search finished, deleting while paging would shift the following pages.
+- In check mode nothing is deleted, the module returns how many and which hosts would be deleted.
+options:
+  search:
+    description: Foreman search query selecting the hosts to delete, e.g. hostgroup = legacy. Must not be empty.
+    required: true
+    default: null
+  max_hosts:
+    description:
+    - Fail without deleting anything if more hosts match the search. Protects against broad searches.
+    - Required unless in check mode, which returns the number of matching hosts.
+    required: false
+    default: None
+  mirror:
+    description: Path of a SQLite database used as local mirror of Foreman objects, see foreman_host
+    required: false
+    default: None
+  mirror_max_age:
+    description: Seconds after which mirrored objects are synced incrementally with Foreman
+    required: false
+    default: 300
+  per_page:
+    description: Number of hosts requested per page
+    required: false
+    default: 100
+  pool_size:
+    description: Number of hosts deleted in parallel
+    required: false
+    default: 4
+  power_off:
+    description: Power off hosts before deleting them. Hosts failing to power off are not deleted.
+    required: false
+    default: false
+  progress:
+    description:
+    - Path of a file each processed host is appended to as one line of JSON as soon as it was processed.
+    - Follow it with tail -f while the module runs.
+    required: false
+    default: None
+  rate:
+    description: Maximum number of hosts deleted per second. 0 doesn't limit.
+    required: false
+    default: 0
+  foreman_host:
+    description: Hostname or IP address of Foreman system
+    required: false
+    default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
+  foreman_port:
+    description: Port of Foreman API
+    required: false
+    default: 443
+  foreman_user:
+    description: Username to be used to authenticate on Foreman
+    required: true
+    default: null
+  foreman_pass:
+    description: Password to be used to authenticate user on Foreman
+    required: true
+    default: null
+notes:
+- Requires the python-foreman package to be installed. See https://github.com/Nosmoht/python-foreman.
+- Supports check mode.
+author: Thomas Krahn
+'''
+
+EXAMPLES = '''
+- name: Count hosts to decommission
+  foreman_host_decommission:
+    search: hostgroup = legacy and last_report < "30 days ago"
+    foreman_user: admin
+    foreman_pass: secret
+    foreman_host: foreman.example.com
+    foreman_port: 443
+  check_mode: true
+  register: legacy_hosts
+
+- name: Decommission hosts
+  foreman_host_decommission:
+    search: hostgroup = legacy and last_report < "30 days ago"
+    max_hosts: "{{ legacy_hosts.count }}"
+    power_off: true
+    pool_size: 8
+    rate: 2
+    progress: /var/log/ansible/decommission.jsonl
+    foreman_user: admin
+    foreman_pass: secret
+    foreman_host: foreman.example.com
+    foreman_port: 443
+'''
+
+RETURN = '''
+count:
+  description: Number of hosts matching the search
+  returned: always
+  type: int
+deleted:
+  description: Names of the deleted hosts (in check mode the hosts which would be deleted)
+  returned: always
+  type: list
+failed_hosts:
+  description: Hosts which could not be deleted with the reason
+  returned: always
+  type: list
+'''
+
+from multiprocessing.pool import ThreadPool
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_mirror import get_mirror
+from ansible.module_utils.foreman_utils import ForemanError, Progress, RateLimiter, check_search, get_foreman_client
+
+
+def find_hosts(module, theforeman):
+    try:
+        return [(host.get('id'), host.get('name')) for host in
+                theforeman.iter_resources('hosts', search=module.params['search'], per_page=module.params['per_page'],
+                                          thin=True)]
+    except ForemanError as e:
+        module.fail_json(msg='Could not search hosts: {0}'.format(e.message))
+
+
+def decommission(module, theforeman):
+    hosts = find_hosts(module, theforeman)
+    max_hosts = module.params['max_hosts']
+    if max_hosts is not None and len(hosts) > max_hosts:
+        module.fail_json(msg='{0} hosts match the search, more than max_hosts {1}'.format(len(hosts), max_hosts),
+                         count=len(hosts))
+
+    if module.check_mode:
+        return hosts, [name for host_id, name in hosts], []
+
+    mirror = get_mirror(module)
+    rate_limiter = RateLimiter(module.params['rate'])
+    progress = Progress(module.params['progress'])
+
+    def delete(host):
+        host_id, name = host
+        try:
+            if module.params['power_off']:
+                host_power = theforeman.get_host_power(host_id=host_id)
+                if host_power.get('power') != 'poweredOff':
+                    theforeman.poweroff_host(host_id=host_id)
+            rate_limiter.wait()
+            theforeman.delete_host(id=host_id)
+        except ForemanError as e:
+            progress.write(host=name, id=host_id, status='failed', msg=e.message)
+            return dict(name=name, msg=e.message)
+        if mirror:
+            mirror.forget('host', host_id)
+        progress.write(host=name, id=host_id, status='deleted')
+        return None
+
+    pool = ThreadPool(processes=max(1, module.params['pool_size']))
+    try:
+        results = pool.map(delete, hosts)
+    finally:
+        pool.close()
+        progress.close()
+
+    failed = [result for result in results if result]
+    failed_names = set(result['name'] for result in failed)
+    return hosts, [name for host_id, name in hosts if name not in failed_names], failed
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            search=dict(type='str', required=True),
+            max_hosts=dict(type='int', default=None),
+            mirror=dict(type='str', default=None),
+            mirror_max_age=dict(type='int', default=300),
+            per_page=dict(type='int', default=100),
+            pool_size=dict(type='int', default=4),
+            power_off=dict(type='bool', default=False),
+            progress=dict(type='path', default=None),
+            rate=dict(type='float', default=0),
+            foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
+            foreman_port=dict(type='str', default='443'),
+            foreman_user=dict(type='str', required=True),
+            foreman_pass=dict(type='str', required=True)
+        ),
+        supports_check_mode=True,
+    )
+
+    check_search(module)
+    if module.params['max_hosts'] is None and not module.check_mode:
+        module.fail_json(msg='max_hosts is required to delete hosts, run in check mode to count them')
+
+    theforeman = get_foreman_client(module)
+
+    hosts, deleted, failed = decommission(module, theforeman)
+    if failed:
+        module.fail_json(msg='{0} of {1} hosts could not be deleted'.format(len(failed), len(hosts)),
+                         changed=bool(deleted), count=len(hosts), deleted=deleted, failed_hosts=failed)
+    module.exit_json(changed=bool(deleted), count=len(hosts), deleted=deleted, failed_hosts=failed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+DOCUMENTATION = '''
+---
+module: foreman_host_hostgroup
+short_description: Move many existing hosts to a hostgroup using Foreman API v2
+description:
+- Assign all hosts matching a search or given by name to a hostgroup. The hostgroup is looked up once.
+- Hosts already in the hostgroup are left alone. The others are moved with Foreman's hosts bulk action
+  (PUT hosts/bulk/reassign_hostgroup), one request per bulk_size hosts of the same organization. Hosts of bulk
+  requests Foreman refuses, hosts without organization and all hosts on Foreman versions without the bulk action
+  are updated one by one, pool_size hosts in parallel.
+- Every host is reported, hosts that could not be moved are returned in failed_hosts with the reason.
+- In check mode nothing is changed, the module returns how many and which hosts would be moved.
+options:
+  hostgroup:
+    description: Name of the hostgroup to move the hosts to
+    required: true
+    default: null
+  search:
+    description:
+    - Foreman search query selecting the hosts to move, e.g. hostgroup = legacy. Either search or names.
+    - Must not be empty, an empty search would select all hosts.
+    required: false
+    default: None
+  names:
+    description: Names (FQDN) of the hosts to move. Either search or names.
+    required: false
+    default: None
+  max_hosts:
+    description: Fail without changing anything if more hosts are selected. Protects against broad searches.
+    required: false
+    default: None
+  bulk:
+    description: Use Foreman's hosts bulk action. Without, every host is updated with its own request.
+    required: false
+    default: true
+  bulk_size:
+    description: Number of hosts moved per bulk request
+    required: false
+    default: 500
+  per_page:
+    description: Number of hosts requested per page
+    required: false
+    default: 100
+  pool_size:
+    description: Number of hosts updated in parallel when updating them one by one
+    required: false
+    default: 8
+  progress:
+    description:
+    - Path of a file each processed host is appended to as one line of JSON as soon as it was processed.
+    - Follow it with tail -f while the module runs.
+    required: false
+    default: None
+  foreman_host:
+    description: Hostname or IP address of Foreman system
+    required: false
+    default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
+  foreman_port:
+    description: Port of Foreman API
+    required: false
+    default: 443
+  foreman_user:
+    description: Username to be used to authenticate on Foreman
+    required: true
+    default: null
+  foreman_pass:
+    description: Password to be used to authenticate user on Foreman
+    required: true
+    default: null
+notes:
+- Requires the python-foreman package to be installed. See https://github.com/Nosmoht/python-foreman.
+- Supports check mode.
+author: Thomas Krahn
+'''
+
+EXAMPLES = '''
+- name: Move legacy web hosts
+  foreman_host_hostgroup:
+    hostgroup: web
+    search: hostgroup = legacy-web
+    max_hosts: 5000
+    progress: /var/log/ansible/hostgroup.jsonl
+    foreman_user: admin
+    foreman_pass: secret
+    foreman_host: foreman.example.com
+    foreman_port: 443
+
+- name: Move some hosts
+  foreman_host_hostgroup:
+    hostgroup: db
+    names:
+    - db-01.example.com
+    - db-02.example.com
+    foreman_user: admin
+    foreman_pass: secret
+    foreman_host: foreman.example.com
+    foreman_port: 443
+'''
+
+RETURN = '''
+count:
+  description: Number of selected hosts
+  returned: always
+  type: int
+moved:
+  description: Names of the hosts moved to the hostgroup (in check mode the hosts which would be moved)
+  returned: always
+  type: list
+failed_hosts:
+  description: Hosts which could not be moved with the reason
+  returned: always
+  type: list
+bulk_requests:
+  description: Number of bulk requests Foreman accepted
+  returned: always
+  type: int
+'''
+
+from multiprocessing.pool import ThreadPool
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_utils import ForemanError, Progress, check_search, get_foreman_client, search_hosts
+
+BULK_ENDPOINT = 'hosts/bulk/reassign_hostgroup'
+
+
+def find_hostgroup(module, theforeman):
+    try:
+        hostgroup = theforeman.search_hostgroup(data=dict(name=module.params['hostgroup']))
+    except ForemanError as e:
+        module.fail_json(msg='Could not get hostgroup: {0}'.format(e.message))
+    if not hostgroup:
+        module.fail_json(msg='Hostgroup {0} not found'.format(module.params['hostgroup']))
+    return hostgroup
+
+
+def find_hosts(module, theforeman):
+    """
+    Return the selected hosts as dicts of id, name, hostgroup and organization id, and the names of missing hosts.
+    """
+    per_page = module.params['per_page']
+    try:
+        if module.params['names'] is not None:
+            found = search_hosts(theforeman, module.params['names'], per_page=per_page)
+            hosts = [found[name] for name in module.params['names'] if name in found]
+            missing = [name for name in module.params['names'] if name not in found]
+        else:
+            hosts = list(theforeman.iter_resources('hosts', search=module.params['search'], per_page=per_page))
+            missing = []
+    except ForemanError as e:
+        module.fail_json(msg='Could not search hosts: {0}'.format(e.message))
+
+    return [dict(id=host.get('id'),
+                 name=host.get('name'),
+                 hostgroup=host.get('hostgroup_id'),
+                 organization=host.get('organization_id'))
+            for host in hosts], missing
+
+
+def bulk_move(module, theforeman, hosts, hostgroup_id, progress):
+    """
+    Move hosts with bulk requests per organization. Return the hosts moved and the number of bulk requests.
+    Hosts of refused requests are left to be updated one by one.
+    """
+    size = max(1, module.params['bulk_size'])
+    organizations = dict()
+    for host in hosts:
+        if host['organization'] is not None:
+            organizations.setdefault(host['organization'], []).append(host)
+
+    moved = list()
+    accepted = 0
+    for organization_id in sorted(organizations):
+        chunks = [organizations[organization_id][i:i + size]
+                  for i in range(0, len(organizations[organization_id]), size)]
+        for chunk in chunks:
+            try:
+                theforeman.put_resource(BULK_ENDPOINT, data=dict(organization_id=organization_id,
+                                                                 included=dict(ids=[host['id'] for host in chunk]),
+                                                                 hostgroup_id=hostgroup_id))
+            except ForemanError as e:
+                if e.status_code == 404:
+                    # Foreman without the bulk action
+                    progress.write(status='bulk_unavailable')
+                    return moved, accepted
+                progress.write(status='bulk_failed', organization_id=organization_id, hosts=len(chunk),
+                               msg=e.message)
+                continue
+            accepted += 1
+            for host in chunk:
+                moved.append(host)
+                progress.write(host=host['name'], id=host['id'], status='moved', bulk=True)
+    return moved, accepted
+
+
+def move(module, theforeman):
+    hostgroup = find_hostgroup(module, theforeman)
+    hosts, missing = find_hosts(module, theforeman)
+    failed = [dict(name=name, msg='Host not found') for name in missing]
+    max_hosts = module.params['max_hosts']
+    if max_hosts is not None and len(hosts) > max_hosts:
+        module.fail_json(msg='{0} hosts selected, more than max_hosts {1}'.format(len(hosts), max_hosts),
+                         count=len(hosts))
+
+    count = len(hosts) + len(missing)
+    hostgroup_id = hostgroup.get('id')
+    hosts = [host for host in hosts if host['hostgroup'] != hostgroup_id]
+    if module.check_mode:
+        return count, [host['name'] for host in hosts], failed, 0
+
+    progress = Progress(module.params['progress'])
+    moved = list()
+    bulk_requests = 0
+    try:
+        if module.params['bulk']:
+            moved, bulk_requests = bulk_move(module, theforeman, hosts, hostgroup_id, progress)
+            moved_ids = set(host['id'] for host in moved)
+            hosts = [host for host in hosts if host['id'] not in moved_ids]
+
+        def update(host):
+            try:
+                theforeman.update_host(id=host['id'], data=dict(hostgroup_id=hostgroup_id))
+            except ForemanError as e:
+                progress.write(host=host['name'], id=host['id'], status='failed', msg=e.message)
+                return e.message
+            progress.write(host=host['name'], id=host['id'], status='moved')
+            return None
+
+        pool = ThreadPool(processes=max(1, module.params['pool_size']))
+        try:
+            errors = pool.map(update, hosts)
+        finally:
+            pool.close()
+    finally:
+        progress.close()
+
+    for host, error in zip(hosts, errors):
+        if error:
+            failed.append(dict(name=host['name'], msg=error))
+        else:
+            moved.append(host)
+    return count, [host['name'] for host in moved], failed, bulk_requests
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            hostgroup=dict(type='str', required=True),
+            search=dict(type='str', default=None),
+            names=dict(type='list', default=None),
+            max_hosts=dict(type='int', default=None),
+            bulk=dict(type='bool', default=True),
+            bulk_size=dict(type='int', default=500),
+            per_page=dict(type='int', default=100),
+            pool_size=dict(type='int', default=8),
+            progress=dict(type='path', default=None),
+            foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
+            foreman_port=dict(type='str', default='443'),
+            foreman_user=dict(type='str', required=True),
+            foreman_pass=dict(type='str', required=True)
+        ),
+        required_one_of=[['search', 'names']],
+        mutually_exclusive=[['search', 'names']],
+        supports_check_mode=True,
+    )
+
+    check_search(module)
+    theforeman = get_foreman_client(module)
+
+    count, moved, failed, bulk_requests = move(module, theforeman)
+    if failed:
+        module.fail_json(msg='{0} of {1} hosts could not be moved'.format(len(failed), count),
+                         changed=bool(moved), count=count, moved=moved, failed_hosts=failed,
+                         bulk_requests=bulk_requests)
+    module.exit_json(changed=bool(moved), count=count, moved=moved, failed_hosts=failed, bulk_requests=bulk_requests)
+
+
+if __name__ == '__main__':
+    main()
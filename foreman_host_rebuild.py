@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+DOCUMENTATION = '''
+---
+module: foreman_host_rebuild
+short_description: Rebuild many hosts in waves using Foreman API v2
+description:
+- Set hosts into build mode and reboot them so they are installed again, e.g. over PXE.
+- Hosts are started in waves. A host starts once fewer than max_builds hosts are building and its compute
+  resource, subnet and TFTP smart proxy (of the subnet) are below their caps, so PXE/TFTP proxies and hypervisors
+  aren't overwhelmed. Hosts are started in the order of names or the search.
+- Building hosts are polled every poll_interval seconds, searching them in chunks of names. A host is built once
+  Foreman left build mode for it, i.e. it reported its installation as done.
+- In check mode nothing is changed, the module returns how many and which hosts would be rebuilt.
+options:
+  search:
+    description:
+    - Foreman search query selecting the hosts to rebuild, e.g. hostgroup = web. Either search or names.
+    - Must not be empty, an empty search would select all hosts.
+    required: false
+    default: None
+  names:
+    description: Names (FQDN) of the hosts to rebuild. Either search or names.
+    required: false
+    default: None
+  max_hosts:
+    description: Fail without changing anything if more hosts are selected. Protects against broad searches.
+    required: false
+    default: None
+  max_builds:
+    description: Maximum number of hosts building at the same time
+    required: false
+    default: 20
+  max_per_compute_resource:
+    description: Maximum number of hosts of the same compute resource building at the same time. 0 doesn't limit.
+    required: false
+    default: 5
+  max_per_subnet:
+    description: Maximum number of hosts of the same subnet building at the same time. 0 doesn't limit.
+    required: false
+    default: 10
+  max_per_smart_proxy:
+    description:
+    - Maximum number of hosts building at the same time whose subnet uses the same TFTP smart proxy. 0 doesn't
+      limit.
+    required: false
+    default: 10
+  reboot:
+    description: Reboot hosts after setting build mode. Without, hosts are expected to be booted otherwise.
+    required: false
+    default: true
+  build_timeout:
+    description: Seconds after which a host still in build mode is reported as failed
+    required: false
+    default: 3600
+  poll_interval:
+    description: Seconds between polls of the build state of the building hosts
+    required: false
+    default: 30
+  per_page:
+    description: Number of hosts requested per page
+    required: false
+    default: 100
+  pool_size:
+    description: Number of hosts of a wave started in parallel
+    required: false
+    default: 4
+  progress:
+    description:
+    - Path of a file every started, built and failed host is appended to as one line of JSON.
+    - Follow it with tail -f while the module runs.
+    required: false
+    default: None
+  rate:
+    description: Maximum number of hosts started per second. 0 doesn't limit.
+    required: false
+    default: 0
+  foreman_host:
+    description: Hostname or IP address of Foreman system
+    required: false
+    default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
+  foreman_port:
+    description: Port of Foreman API
+    required: false
+    default: 443
+  foreman_user:
+    description: Username to be used to authenticate on Foreman
+    required: true
+    default: null
+  foreman_pass:
+    description: Password to be used to authenticate user on Foreman
+    required: true
+    default: null
+notes:
+- Requires the python-foreman package to be installed. See https://github.com/Nosmoht/python-foreman.
+- Supports check mode.
+- Rebuilding hundreds of hosts takes a while, run the module with async.
+author: Thomas Krahn
+'''
+
+EXAMPLES = '''
+- name: Rebuild web servers
+  foreman_host_rebuild:
+    search: hostgroup = web
+    max_hosts: 300
+    max_builds: 40
+    max_per_compute_resource: 8
+    max_per_smart_proxy: 20
+    progress: /var/log/ansible/rebuild.jsonl
+    foreman_user: admin
+    foreman_pass: secret
+    foreman_host: foreman.example.com
+    foreman_port: 443
+  async: 14400
+  poll: 60
+'''
+
+RETURN = '''
+count:
+  description: Number of selected hosts
+  returned: always
+  type: int
+rebuilt:
+  description: Names of the rebuilt hosts (in check mode the hosts which would be rebuilt)
+  returned: always
+  type: list
+failed_hosts:
+  description: Hosts which could not be rebuilt with the reason
+  returned: always
+  type: list
+waves:
+  description: Number of waves hosts were started in
+  returned: always
+  type: int
+'''
+
+import time
+from multiprocessing.pool import ThreadPool
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_utils import (ForemanError, Progress, RateLimiter, check_search, get_foreman_client,
+                                                poll_builds, search_hosts)
+
+# Things a host builds from, capped by the max_per_<kind> options
+CAPPED = ['compute_resource', 'subnet', 'smart_proxy']
+
+
+class WaveScheduler(object):
+    """
+    Decide which hosts start building next. Hosts are started in order, a host waits while the building hosts
+    reached max_builds or a cap of its compute resource, subnet or smart proxy. Later hosts not limited by these
+    caps may start before it.
+    """
+
+    def __init__(self, hosts, max_builds, caps):
+        """
+        :param hosts: Dicts with name and the ids of compute_resource, subnet and smart_proxy (None if unknown)
+        :param caps: Maximum number of building hosts per kind of CAPPED, 0 doesn't limit
+        """
+        self.pending = list(hosts)
+        self.building = dict()
+        self.max_builds = max_builds
+        self.caps = caps
+
+    def _counts(self):
+        counts = dict()
+        for host in self.building.values():
+            for kind in CAPPED:
+                if host.get(kind) is not None:
+                    counts[(kind, host[kind])] = counts.get((kind, host[kind]), 0) + 1
+        return counts
+
+    def _allowed(self, host, counts):
+        return all(not self.caps.get(kind) or host.get(kind) is None or
+                   counts.get((kind, host[kind]), 0) < self.caps[kind]
+                   for kind in CAPPED)
+
+    def next_wave(self):
+        """
+        Return the hosts to start now and remove them from the pending hosts.
+        """
+        counts = self._counts()
+        free = max(1, self.max_builds) - len(self.building)
+        wave = list()
+        for host in self.pending:
+            if len(wave) >= free:
+                break
+            if not self._allowed(host, counts):
+                continue
+            wave.append(host)
+            for kind in CAPPED:
+                if host.get(kind) is not None:
+                    counts[(kind, host[kind])] = counts.get((kind, host[kind]), 0) + 1
+        for host in wave:
+            self.pending.remove(host)
+        return wave
+
+    def started(self, host):
+        self.building[host['name']] = host
+
+    def finished(self, name):
+        return self.building.pop(name)
+
+
+def find_hosts(module, theforeman):
+    """
+    Return the selected hosts as dicts of id, name and what they are capped by, and the names of missing hosts.
+    """
+    per_page = module.params['per_page']
+    try:
+        proxies = dict((subnet.get('id'), subnet.get('tftp_id')) for subnet in
+                       theforeman.iter_resources('subnets', per_page=per_page))
+        if module.params['names'] is not None:
+            found = search_hosts(theforeman, module.params['names'], per_page=per_page)
+            hosts = [found[name] for name in module.params['names'] if name in found]
+            missing = [name for name in module.params['names'] if name not in found]
+        else:
+            hosts = list(theforeman.iter_resources('hosts', search=module.params['search'], per_page=per_page))
+            missing = []
+    except ForemanError as e:
+        module.fail_json(msg='Could not search hosts: {0}'.format(e.message))
+
+    return [dict(id=host.get('id'),
+                 name=host.get('name'),
+                 compute_resource=host.get('compute_resource_id'),
+                 subnet=host.get('subnet_id'),
+                 smart_proxy=proxies.get(host.get('subnet_id')))
+            for host in hosts], missing
+
+
+def rebuild(module, theforeman):
+    hosts, missing = find_hosts(module, theforeman)
+    failed = [dict(name=name, msg='Host not found') for name in missing]
+    max_hosts = module.params['max_hosts']
+    if max_hosts is not None and len(hosts) > max_hosts:
+        module.fail_json(msg='{0} hosts selected, more than max_hosts {1}'.format(len(hosts), max_hosts),
+                         count=len(hosts))
+
+    count = len(hosts) + len(missing)
+    if module.check_mode:
+        return count, [host['name'] for host in hosts], failed, 0
+
+    scheduler = WaveScheduler(hosts, max_builds=module.params['max_builds'],
+                              caps=dict((kind, module.params['max_per_{0}'.format(kind)]) for kind in CAPPED))
+    rate_limiter = RateLimiter(module.params['rate'])
+    progress = Progress(module.params['progress'])
+    rebuilt = list()
+    waves = 0
+
+    def start(host):
+        rate_limiter.wait()
+        try:
+            theforeman.update_host(id=host['id'], data=dict(build=True))
+        except ForemanError as e:
+            return 'Could not set build mode: {0}'.format(e.message)
+        if module.params['reboot']:
+            try:
+                theforeman.reboot_host(host_id=host['id'])
+            except ForemanError as e:
+                return 'Build mode set, could not reboot: {0}'.format(e.message)
+        return None
+
+    def fail(host, msg):
+        failed.append(dict(name=host['name'], msg=msg))
+        progress.write(host=host['name'], id=host['id'], status='failed', msg=msg)
+
+    pool = ThreadPool(processes=max(1, module.params['pool_size']))
+    try:
+        while scheduler.pending or scheduler.building:
+            wave = scheduler.next_wave()
+            if wave:
+                waves += 1
+                for host, error in zip(wave, pool.map(start, wave)):
+                    if error:
+                        fail(host, error)
+                        continue
+                    host['started'] = time.time()
+                    scheduler.started(host)
+                    progress.write(host=host['name'], id=host['id'], status='started', wave=waves)
+            if not scheduler.building:
+                continue
+
+            time.sleep(module.params['poll_interval'])
+            started = dict((name, host['started']) for name, host in scheduler.building.items())
+            built, errors = poll_builds(theforeman, started, timeout=module.params['build_timeout'], progress=progress,
+                                        per_page=module.params['per_page'])
+            for name, seconds in built.items():
+                host = scheduler.finished(name)
+                rebuilt.append(name)
+                progress.write(host=name, id=host['id'], status='built', seconds=seconds)
+            for name, msg in errors.items():
+                fail(scheduler.finished(name), msg)
+    finally:
+        pool.close()
+        progress.close()
+
+    return count, rebuilt, failed, waves
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            search=dict(type='str', default=None),
+            names=dict(type='list', default=None),
+            max_hosts=dict(type='int', default=None),
+            max_builds=dict(type='int', default=20),
+            max_per_compute_resource=dict(type='int', default=5),
+            max_per_subnet=dict(type='int', default=10),
+            max_per_smart_proxy=dict(type='int', default=10),
+            reboot=dict(type='bool', default=True),
+            build_timeout=dict(type='int', default=3600),
+            poll_interval=dict(type='int', default=30),
+            per_page=dict(type='int', default=100),
+            pool_size=dict(type='int', default=4),
+            progress=dict(type='path', default=None),
+            rate=dict(type='float', default=0),
+            foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
+            foreman_port=dict(type='str', default='443'),
+            foreman_user=dict(type='str', required=True),
+            foreman_pass=dict(type='str', required=True)
+        ),
+        required_one_of=[['search', 'names']],
+        mutually_exclusive=[['search', 'names']],
+        supports_check_mode=True,
+    )
+
+    check_search(module)
+    theforeman = get_foreman_client(module)
+
+    count, rebuilt, failed, waves = rebuild(module, theforeman)
+    # Hosts failing after build mode was set changed as well
+    changed = bool(rebuilt) or waves > 0
+    if failed:
+        module.fail_json(msg='{0} of {1} hosts could not be rebuilt'.format(len(failed), count),
+                         changed=changed, count=count, rebuilt=rebuilt, failed_hosts=failed, waves=waves)
+    module.exit_json(changed=changed, count=count, rebuilt=rebuilt, failed_hosts=failed, waves=waves)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,8 @@ module: foreman_hostgroup
 short_description: Manage Foreman Hostgroup using Foreman API v2
 description:
 - Manage Foreman Hostgroup using Foreman API v2
+- References are only looked up if they are sent, i.e. all of them to create a hostgroup and the smart proxy to
+  update one, in parallel. Deleting or leaving a hostgroup unchanged costs the search of the hostgroup only.
 options:
   architecture:
     description: Architecture name
@@ -24,6 +26,17 @@ options:
     description: Medium name
     required: False
     default: null
+  mirror:
+    description:
+    - Path of a SQLite database on the system running the module used as local mirror of Foreman objects.
+      References and the hostgroup itself are looked up in the mirror and only searched on Foreman if not mirrored.
+    - Changes made outside of Ansible are noticed once the mirror gets synced again, see I(mirror_max_age).
+    required: False
+    default: null
+  mirror_max_age:
+    description: Seconds after which mirrored objects are synced incrementally with Foreman
+    required: False
+    default: 300
   name:
     description: Hostgroup name
     required: True
@@ -50,10 +63,59 @@ options:
     required: false
     default: present
     choices: ["present", "absent"]
+  result_fields:
+    description:
+    - Fields of the returned object to keep besides id, name, title and login.
+    - Use it to keep results small, e.g. [] to return identifying fields only. The whole object is returned if
+      not given.
+    required: false
+    default: None
+  foreman_endpoints:
+    description:
+    - List of Foreman servers to apply the same configuration to in parallel instead of the one of foreman_host.
+    - Items take foreman_host, foreman_port, foreman_user and foreman_pass, missing ones default to the options
+      of the module. String items are taken as foreman_host. Results are returned per Foreman in endpoints.
+    required: false
+    default: None
   foreman_host:
     description: Hostname or IP address of Foreman system
     required: false
     default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
   foreman_port:
     description: Port of Foreman API
     required: false
@@ -86,29 +148,51 @@ EXAMPLES = '''
     foreman_pass: secret
 '''
 
-try:
-    from foreman.foreman import *
-except ImportError:
-    foremanclient_found = False
-else:
-    foremanclient_found = True
-
-
-def get_resource(module, resource_type, resource_func, resource_name, search_title=False):
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_mirror import get_mirror
+from ansible.module_utils.foreman_utils import (ARCHITECTURE, COMPUTE_PROFILE, DOMAIN, ENVIRONMENT, HOSTGROUP, MEDIUM,
+                                                OPERATINGSYSTEM, PARTITION_TABLE, SMART_PROXY, SUBNET, ForemanError,
+                                                ModuleView, ModuleViewError, ensure_endpoints, get_foreman_client,
+                                                project)
+
+# Resource type (named like its option) and key in the hostgroup data of every reference of a hostgroup
+REFERENCES = [(ARCHITECTURE, 'architecture_id'),
+              (COMPUTE_PROFILE, 'compute_profile_id'),
+              (DOMAIN, 'domain_id'),
+              (ENVIRONMENT, 'environment_id'),
+              (MEDIUM, 'medium_id'),
+              (OPERATINGSYSTEM, 'operatingsystem_id'),
+              (PARTITION_TABLE, 'ptable_id'),
+              (SMART_PROXY, 'puppet_proxy_id'),
+              (SUBNET, 'subnet_id')]
+
+
+def get_resource(module, resource_type, resource_func, resource_name, search_title=False, mirror=None):
     """
     Look for a resource within Foreman Database. Return the resource if found or fail.
     If the Resource could not be found by name search by title.
+    If a mirror is given it is asked first.
 
     :param module:
     :param resource_type:
     :param resource_func:
     :param resource_name:
+    :param search_title:
+    :param mirror:
     :return:
     """
     try:
-        result = resource_func(data=dict(name=resource_name))
-        if not result and search_title:
-            result = resource_func(data=dict(title=resource_name))
+        result = None
+        if mirror:
+            result = mirror.find(resource_type, name=resource_name)
+            if not result and search_title:
+                result = mirror.find(resource_type, title=resource_name)
+        if not result:
+            result = resource_func(data=dict(name=resource_name))
+            if not result and search_title:
+                result = resource_func(data=dict(title=resource_name))
+            if mirror:
+                mirror.store(resource_type, result)
         if not result:
             module.fail_json(msg='{0} {1} not found'.format(resource_type, resource_name))
     except ForemanError as e:
@@ -116,7 +200,45 @@ def get_resource(module, resource_type, resource_func, resource_name, search_tit
     return result
 
 
-def ensure(module):
+def resolve_references(module, theforeman, references, mirror=None):
+    """
+    Return the ids of the resources the options of references name, keyed like in the hostgroup data. References
+    not given are skipped, the others are looked up in parallel. Fail if one isn't found.
+    """
+    wanted = [(resource_type, key) for resource_type, key in references if module.params[resource_type]]
+    if not wanted:
+        return dict()
+    from multiprocessing.pool import ThreadPool
+
+    # fail_json must not exit within the threads
+    view = ModuleView(module=module, params=module.params)
+
+    def resolve(reference):
+        resource_type, key = reference
+        try:
+            resource = get_resource(module=view,
+                                    resource_type=resource_type,
+                                    resource_func=getattr(theforeman, 'search_{0}'.format(resource_type)),
+                                    resource_name=module.params[resource_type],
+                                    search_title=resource_type == OPERATINGSYSTEM,
+                                    mirror=mirror)
+        except ModuleViewError as e:
+            return key, None, e.message
+        return key, resource.get('id'), None
+
+    pool = ThreadPool(processes=len(wanted))
+    try:
+        results = pool.map(resolve, wanted)
+    finally:
+        pool.close()
+
+    for key, resource_id, error in results:
+        if error:
+            module.fail_json(msg=error)
+    return dict((key, resource_id) for key, resource_id, error in results)
+
+
+def ensure(module, theforeman):
     # Changes in one of the following keys fails with:
     # <key> is not allowed as nested parameter for hostgroups. Allowed parameters are puppetclass_id, location_id, organization_id
     # Strange as for example the Compute Profile can be changed via UI
@@ -125,130 +247,54 @@ def ensure(module):
     hostgroup_updateable_keys = ['puppetclass_id', 'location_id', 'organization_id']
 
     name = module.params['name']
-    architecture_name = module.params[ARCHITECTURE]
-    compute_profile_name = module.params[COMPUTE_PROFILE]
-    domain_name = module.params[DOMAIN]
-    environment_name = module.params[ENVIRONMENT]
-    medium_name = module.params[MEDIUM]
-    operatingsystem_name = module.params[OPERATINGSYSTEM]
-    partition_table_name = module.params['partition_table']
-    smart_proxy_name = module.params[SMART_PROXY]
-    subnet_name = module.params[SUBNET]
     state = module.params['state']
 
-    foreman_host = module.params['foreman_host']
-    foreman_port = module.params['foreman_port']
-    foreman_user = module.params['foreman_user']
-    foreman_pass = module.params['foreman_pass']
-
-    theforeman = Foreman(hostname=foreman_host,
-                         port=foreman_port,
-                         username=foreman_user,
-                         password=foreman_pass)
+    mirror = get_mirror(module)
 
     data = {'name': name}
 
     try:
-        hostgroup = theforeman.search_hostgroup(data=data)
+        hostgroup = None
+        if mirror:
+            hostgroup = mirror.find(HOSTGROUP, name=name)
+        if not hostgroup:
+            hostgroup = theforeman.search_hostgroup(data=data)
     except ForemanError as e:
         module.fail_json(msg='Could not get hostgroup: {0}'.format(e.message))
 
-    # Architecture
-    if architecture_name:
-        architecture = get_resource(module=module,
-                                    resource_type=ARCHITECTURE,
-                                    resource_func=theforeman.search_architecture,
-                                    resource_name=architecture_name)
-        data['architecture_id'] = architecture.get('id')
-
-    # Compute Profile
-    if compute_profile_name:
-        compute_profile = get_resource(module=module,
-                                       resource_type=COMPUTE_PROFILE,
-                                       resource_func=theforeman.search_compute_profile,
-                                       resource_name=compute_profile_name)
-        data['compute_profile_id'] = compute_profile.get('id')
-
-    # Domain
-    if domain_name:
-        domain = get_resource(module=module,
-                              resource_type=DOMAIN,
-                              resource_func=theforeman.search_domain,
-                              resource_name=domain_name)
-        data['domain_id'] = domain.get('id')
-
-    # Environment
-    if environment_name:
-        environment = get_resource(module=module,
-                                   resource_type=ENVIRONMENT,
-                                   resource_func=theforeman.search_environment,
-                                   resource_name=environment_name)
-        data['environment_id'] = environment.get('id')
-
-    # Medium
-    if medium_name:
-        medium = get_resource(module=module,
-                              resource_type=MEDIUM,
-                              resource_func=theforeman.search_medium,
-                              resource_name=medium_name)
-        data['medium_id'] = medium.get('id')
-
-    # Operatingssystem
-    if operatingsystem_name:
-        operatingsystem = get_resource(module=module,
-                                       resource_type=OPERATINGSYSTEM,
-                                       resource_func=theforeman.search_operatingsystem,
-                                       resource_name=operatingsystem_name,
-                                       search_title=True)
-        data['operatingsystem_id'] = operatingsystem.get('id')
-
-    # Partition Table
-    if partition_table_name:
-        partition_table = get_resource(module=module,
-                                       resource_type=PARTITION_TABLE,
-                                       resource_func=theforeman.search_partition_table,
-                                       resource_name=partition_table_name)
-        data['ptable_id'] = partition_table.get('id')
-
-    # Smart Proxy
-    if smart_proxy_name:
-        smart_proxy = get_resource(module=module,
-                                   resource_type=SMART_PROXY,
-                                   resource_func=theforeman.search_smart_proxy,
-                                   resource_name=smart_proxy_name)
-        data['puppet_proxy_id'] = smart_proxy.get('id')
-
-    # Subnet
-    if subnet_name:
-        subnet = get_resource(module=module,
-                              resource_type=SUBNET,
-                              resource_func=theforeman.search_subnet,
-                              resource_name=subnet_name)
-        data['subnet_id'] = subnet.get('id')
+    # References are only looked up once it's known they are sent
+    if state == 'absent':
+        if hostgroup:
+            try:
+                hostgroup_id = hostgroup.get('id')
+                hostgroup = theforeman.delete_hostgroup(id=hostgroup_id)
+                if mirror:
+                    mirror.forget(HOSTGROUP, hostgroup_id)
+                return True, hostgroup
+            except ForemanError as e:
+                module.fail_json(msg='Could not delete hostgroup: {0}'.format(e.message))
+        return False, hostgroup
 
-    if not hostgroup and state == 'present':
+    if not hostgroup:
+        data.update(resolve_references(module=module, theforeman=theforeman, references=REFERENCES, mirror=mirror))
         try:
             hostgroup = theforeman.create_hostgroup(data=data)
+            if mirror:
+                mirror.store(HOSTGROUP, hostgroup)
             return True, hostgroup
         except ForemanError as e:
             module.fail_json(msg='Could not create hostgroup: {0}'.format(e.message))
 
-    if hostgroup:
-        if state == 'absent':
-            try:
-                hostgroup = theforeman.delete_hostgroup(id=hostgroup.get('id'))
-                return True, hostgroup
-            except ForemanError as e:
-                module.fail_json(msg='Could not delete hostgroup: {0}'.format(e.message))
-
-        if not all(data.get(key, None) == hostgroup.get(key, None) for key in hostgroup_updateable_keys):
-            try:
-                for key in hostgroup_nonupdateable_keys:
-                    data.pop(key, None)
-                hostgroup = theforeman.update_hostgroup(id=hostgroup.get('id'), data=data)
-                return True, hostgroup
-            except ForemanError as e:
-                module.fail_json(msg='Could not update hostgroup: {0}'.format(e.message))
+    if not all(data.get(key, None) == hostgroup.get(key, None) for key in hostgroup_updateable_keys):
+        references = [reference for reference in REFERENCES if reference[1] not in hostgroup_nonupdateable_keys]
+        data.update(resolve_references(module=module, theforeman=theforeman, references=references, mirror=mirror))
+        try:
+            hostgroup = theforeman.update_hostgroup(id=hostgroup.get('id'), data=data)
+            if mirror:
+                mirror.store(HOSTGROUP, hostgroup)
+            return True, hostgroup
+        except ForemanError as e:
+            module.fail_json(msg='Could not update hostgroup: {0}'.format(e.message))
 
     return False, hostgroup
 
@@ -262,25 +308,36 @@ def main():
             domain=dict(type='str', default=None),
             environment=dict(type='str', default=None),
             medium=dict(type='str', default=None),
+            mirror=dict(type='str', default=None),
+            mirror_max_age=dict(type='int', default=300),
             operatingsystem=dict(type='str', default=None),
             partition_table=dict(type='str', default=None),
             smart_proxy=dict(type='str', default=None),
             subnet=dict(type='str', default=None),
             state=dict(type='str', default='present', choices=['present', 'absent']),
+            result_fields=dict(type='list', default=None),
+            foreman_endpoints=dict(type='list', default=None),
             foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
             foreman_port=dict(type='str', default='443'),
             foreman_user=dict(type='str', required=True),
             foreman_pass=dict(type='str', required=True)
         ),
     )
 
-    if not foremanclient_found:
-        module.fail_json(msg='python-foreman module is required. See https://github.com/Nosmoht/python-foreman.')
+    if module.params['foreman_endpoints']:
+        ensure_endpoints(module, ensure, 'hostgroup')
+
+    theforeman = get_foreman_client(module)
 
-    changed, hostgroup = ensure(module)
-    module.exit_json(changed=changed, hostgroup=hostgroup)
+    changed, hostgroup = ensure(module, theforeman)
+    module.exit_json(changed=changed, hostgroup=project(hostgroup, module.params['result_fields']))
 
-# import module snippets
-from ansible.module_utils.basic import *
 
-main()
+if __name__ == '__main__':
+    main()
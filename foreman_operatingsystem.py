@@ -35,10 +35,59 @@ options:
     required: false
     default: 'present'
     choices: ['present', 'absent']
+  result_fields:
+    description:
+    - Fields of the returned object to keep besides id, name, title and login.
+    - Use it to keep results small, e.g. [] to return identifying fields only. The whole object is returned if
+      not given.
+    required: false
+    default: None
+  foreman_endpoints:
+    description:
+    - List of Foreman servers to apply the same configuration to in parallel instead of the one of foreman_host.
+    - Items take foreman_host, foreman_port, foreman_user and foreman_pass, missing ones default to the options
+      of the module. String items are taken as foreman_host. Results are returned per Foreman in endpoints.
+    required: false
+    default: None
   foreman_host:
     description: Hostname or IP address of Foreman system
     required: false
     default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
   foreman_port:
     description: Port of Foreman API
     required: false
@@ -76,12 +125,9 @@ EXAMPLES = '''
     foreman_pass: secret
 '''
 
-try:
-    from foreman.foreman import *
-
-    foremanclient_found = True
-except ImportError:
-    foremanclient_found = False
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_utils import (ForemanError, changed_fields, ensure_endpoints, get_foreman_client,
+                                                project)
 
 
 def list_to_dict_list(alist, key):
@@ -92,21 +138,7 @@ def list_to_dict_list(alist, key):
     return result
 
 
-def dict_list_to_list(alist, key):
-    result = list()
-    if alist:
-        for item in alist:
-            result.append(item.get(key, None))
-    return result
-
-
-def equal_dict_lists(l1, l2, compare_key='name'):
-    s1 = set(dict_list_to_list(alist=l1, key=compare_key))
-    s2 = set(dict_list_to_list(alist=l2, key=compare_key))
-    return s1.issubset(s2) and s2.issubset(s1)
-
-
-def get_resources(resource_type, resource_specs):
+def get_resources(module, theforeman, resource_type, resource_specs):
     result = []
     for item in resource_specs:
         search_data = dict()
@@ -129,8 +161,9 @@ def get_resources(resource_type, resource_specs):
     return result
 
 
-def ensure():
+def ensure(module, theforeman):
     comparable_keys = ['description', 'family', 'major', 'minor', 'release_name']
+    list_keys = ['architectures', 'media', 'ptables']
     name = module.params['name']
     state = module.params['state']
 
@@ -154,13 +187,16 @@ def ensure():
 
         return False, os
 
-    data['architectures'] = get_resources(resource_type='architectures', resource_specs=module.params['architectures'])
+    data['architectures'] = get_resources(module=module, theforeman=theforeman, resource_type='architectures',
+                                          resource_specs=module.params['architectures'])
     data['description'] = module.params['description']
     data['family'] = module.params['family']
     data['minor'] = module.params['minor']
-    data['media'] = get_resources(resource_type='media', resource_specs=module.params['media'])
+    data['media'] = get_resources(module=module, theforeman=theforeman, resource_type='media',
+                                  resource_specs=module.params['media'])
 
-    data['ptables'] = get_resources(resource_type='ptables', resource_specs=module.params['ptables'])
+    data['ptables'] = get_resources(module=module, theforeman=theforeman, resource_type='ptables',
+                                    resource_specs=module.params['ptables'])
     data['release_name'] = module.params['release_name']
 
     if not os:
@@ -170,10 +206,8 @@ def ensure():
         except ForemanError as e:
             module.fail_json(msg='Could not create operatingsystem: {0}'.format(e.message))
 
-    if (not all(data[key] == os.get(key, data[key]) for key in comparable_keys)) or (
-            not equal_dict_lists(l1=data.get('architectures', None), l2=os.get('architectures', None))) or (
-            not equal_dict_lists(l1=data.get('media', None), l2=os.get('media', None))) or (
-            not equal_dict_lists(l1=data.get('ptables', None), l2=os.get('ptables', None))):
+    data = changed_fields(data=data, current=os, keys=comparable_keys + list_keys, list_keys=list_keys)
+    if data:
         try:
             os = theforeman.update_operatingsystem(id=os.get('id'), data=data)
             return True, os
@@ -184,9 +218,6 @@ def ensure():
 
 
 def main():
-    global module
-    global theforeman
-
     module = AnsibleModule(
         argument_spec=dict(
             architectures=dict(type='list', required=False),
@@ -199,30 +230,29 @@ def main():
             ptables=dict(type='list', required=False),
             release_name=dict(type='str', required=False),
             state=dict(type='str', default='present', choices=['present', 'absent']),
+            result_fields=dict(type='list', default=None),
+            foreman_endpoints=dict(type='list', default=None),
             foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
             foreman_port=dict(type='str', default='443'),
             foreman_user=dict(type='str', required=True),
             foreman_pass=dict(type='str', required=True)
         ),
     )
 
-    if not foremanclient_found:
-        module.fail_json(msg='python-foreman module is required. See https://github.com/Nosmoht/python-foreman.')
-
-    foreman_host = module.params['foreman_host']
-    foreman_port = module.params['foreman_port']
-    foreman_user = module.params['foreman_user']
-    foreman_pass = module.params['foreman_pass']
+    if module.params['foreman_endpoints']:
+        ensure_endpoints(module, ensure, 'operatingsystem')
 
-    theforeman = Foreman(hostname=foreman_host,
-                         port=foreman_port,
-                         username=foreman_user,
-                         password=foreman_pass)
+    theforeman = get_foreman_client(module)
 
-    changed, os = ensure()
-    module.exit_json(changed=changed, operatingsystem=os)
+    changed, os = ensure(module, theforeman)
+    module.exit_json(changed=changed, operatingsystem=project(os, module.params['result_fields']))
 
-# import module snippets
-from ansible.module_utils.basic import *
 
-main()
+if __name__ == '__main__':
+    main()
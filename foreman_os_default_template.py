@@ -25,10 +25,63 @@ options:
     required: false
     default: 'present'
     choices: ['present', 'absent']
+  per_page:
+    description: Number of config templates requested per page while searching the config template
+    required: false
+    default: 100
+  result_fields:
+    description:
+    - Fields of the returned object to keep besides id, name, title and login.
+    - Use it to keep results small, e.g. [] to return identifying fields only. The whole object is returned if
+      not given.
+    required: false
+    default: None
+  foreman_endpoints:
+    description:
+    - List of Foreman servers to apply the same configuration to in parallel instead of the one of foreman_host.
+    - Items take foreman_host, foreman_port, foreman_user and foreman_pass, missing ones default to the options
+      of the module. String items are taken as foreman_host. Results are returned per Foreman in endpoints.
+    required: false
+    default: None
   foreman_host:
     description: Hostname or IP address of Foreman system
     required: false
     default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
   foreman_port:
     description: Port of Foreman API
     required: false
@@ -59,15 +112,11 @@ EXAMPLES = '''
     foreman_port: 443
 '''
 
-try:
-    from foreman.foreman import *
-except ImportError:
-    foremanclient_found = False
-else:
-    foremanclient_found = True
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_utils import ForemanError, ensure_endpoints, find_first, get_foreman_client, project
 
 
-def ensure():
+def ensure(module, theforeman):
     os_name = module.params['operatingsystem']
     config_template_name = module.params['config_template']
     template_kind_name = module.params['template_kind']
@@ -81,40 +130,37 @@ def ensure():
     if not os:
         module.fail_json(msg='Operatingsystem {os_name} not found'.format(os_name=os_name))
 
+    per_page = module.params['per_page']
+
     try:
-        config_templates = theforeman.get_config_templates()
-    except:
+        config_template = find_first(
+            theforeman.iter_resources('config_templates', search='name = "{0}"'.format(config_template_name),
+                                      per_page=per_page),
+            lambda item: item.get('name') == config_template_name and item.get(
+                'template_kind_name') == template_kind_name)
+    except ForemanError as e:
         module.fail_json(msg='Could not get config templates: {0}'.format(e.message))
 
-    config_template = None
-    for item in config_templates:
-        if item.get('name') == config_template_name and item.get('template_kind_name') == template_kind_name:
-            config_template = item
-            break
-
     if not config_template:
         module.fail_json(msg='Could not find config template {config_template} of kind {template_kind}'.format(
-            config_template_name=config_template_name, template_kind=template_kind_name))
+            config_template=config_template_name, template_kind=template_kind_name))
 
     try:
-        os_default_templates = theforeman.get_operatingsystem_default_templates(id=os.get('id'))
+        os_default_template = find_first(
+            theforeman.iter_resources('operatingsystems/{0}/os_default_templates'.format(os.get('id')),
+                                      per_page=per_page),
+            lambda item: item.get('config_template_id') == config_template.get('id') and item.get(
+                'template_kind_id') == config_template.get('template_kind_id'))
     except ForemanError as e:
         module.fail_json(msg='Could not get operatingsystem default templates: {0}'.format(e.message))
 
-    os_default_template = None
-    for item in os_default_templates:
-        if (item.get('config_template_id') == config_template.get('id')) and (
-                    item.get('template_kind_id') == config_template.get('template_kind_id')):
-            os_default_template = item
-            break
-
     if state == 'absent':
         if os_default_template:
             try:
                 os_default_template = theforeman.delete_operatingsystem_default_template(id=os.get('id'),
                                                                                          template_id=os_default_template.get(
                                                                                              'id'))
-            except:
+            except ForemanError as e:
                 module.fail_json(msg='Could not delete operatingsystem default template: {0}'.format(e.message))
             return True, os_default_template
         return False, os_default_template
@@ -131,40 +177,37 @@ def ensure():
 
 
 def main():
-    global module
-    global theforeman
-
     module = AnsibleModule(
         argument_spec=dict(
             operatingsystem=dict(type='str', required=True),
             config_template=dict(type='str', required=True),
             template_kind=dict(type='str', required=True),
             state=dict(type='str', default='present', choices=['present', 'absent']),
+            per_page=dict(type='int', default=100),
+            result_fields=dict(type='list', default=None),
+            foreman_endpoints=dict(type='list', default=None),
             foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
             foreman_port=dict(type='str', default='443'),
             foreman_user=dict(type='str', required=True),
             foreman_pass=dict(type='str', required=True)
         ),
     )
 
-    if not foremanclient_found:
-        module.fail_json(msg='python-foreman module is required. See https://github.com/Nosmoht/python-foreman.')
-
-    foreman_host = module.params['foreman_host']
-    foreman_port = module.params['foreman_port']
-    foreman_user = module.params['foreman_user']
-    foreman_pass = module.params['foreman_pass']
+    if module.params['foreman_endpoints']:
+        ensure_endpoints(module, ensure, 'os_default_template')
 
-    theforeman = Foreman(hostname=foreman_host,
-                         port=foreman_port,
-                         username=foreman_user,
-                         password=foreman_pass)
+    theforeman = get_foreman_client(module)
 
-    changed, os_default_template = ensure()
-    module.exit_json(changed=changed, os_default_template=os_default_template)
+    changed, os_default_template = ensure(module, theforeman)
+    module.exit_json(changed=changed, os_default_template=project(os_default_template, module.params['result_fields']))
 
-# import module snippets
-from ansible.module_utils.basic import *
 
-main()
+if __name__ == '__main__':
+    main()
 
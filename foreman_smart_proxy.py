@@ -1,31 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-try:
-    from foreman.foreman import *
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_utils import ForemanError, ensure_endpoints, get_foreman_client, project
 
-    foremanclient_found = True
-except ImportError:
-    foremanclient_found = False
 
-
-def ensure(module):
+def ensure(module, theforeman):
     updateable_keys = ['url']
 
     name = module.params['name']
     url = module.params['url']
     state = module.params['state']
 
-    foreman_host = module.params['foreman_host']
-    foreman_port = module.params['foreman_port']
-    foreman_user = module.params['foreman_user']
-    foreman_pass = module.params['foreman_pass']
-
-    theforeman = Foreman(hostname=foreman_host,
-                         port=foreman_port,
-                         username=foreman_user,
-                         password=foreman_pass)
-
     data = {'name': name}
 
     try:
@@ -47,7 +33,7 @@ def ensure(module):
             try:
                 smart_proxy = theforeman.delete_smart_proxy(id=smart_proxy.get('id'))
                 return True, smart_proxy
-            except:
+            except ForemanError as e:
                 module.fail_json(msg='Could not delete smart proxy: {0}'.format(e.message))
 
         if not all(data[key] == smart_proxy[key] for key in updateable_keys):
@@ -65,20 +51,29 @@ def main():
             name=dict(type='str', required=True),
             url=dict(type='str', required=False),
             state=dict(type='str', default='present', choices=['present', 'absent']),
+            result_fields=dict(type='list', default=None),
+            foreman_endpoints=dict(type='list', default=None),
             foreman_host=dict(type='str', default='127.0.0.1'),
+            foreman_read_hosts=dict(type='list', default=None),
+            metrics_file=dict(type='str', default=None),
+            trace_dir=dict(type='str', default=None),
+            http_cache=dict(type='str', default=None),
+            http_pool_size=dict(type='int', default=10),
+            http_timeout=dict(type='float', default=None),
             foreman_port=dict(type='str', default='443'),
             foreman_user=dict(type='str', required=True),
             foreman_pass=dict(type='str', required=True)
         ),
     )
 
-    if not foremanclient_found:
-        module.fail_json(msg='python-foreman module is required. See https://github.com/Nosmoht/python-foreman.')
+    if module.params['foreman_endpoints']:
+        ensure_endpoints(module, ensure, 'smart_proxy')
+
+    theforeman = get_foreman_client(module)
 
-    changed, smart_proxy = ensure(module)
-    module.exit_json(changed=changed, smart_proxy=smart_proxy)
+    changed, smart_proxy = ensure(module, theforeman)
+    module.exit_json(changed=changed, smart_proxy=project(smart_proxy, module.params['result_fields']))
 
-# import module snippets
-from ansible.module_utils.basic import *
 
-main()
+if __name__ == '__main__':
+    main()
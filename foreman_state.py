@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+DOCUMENTATION = '''
+---
+module: foreman_state
+short_description: Ensure a complete Foreman configuration using Foreman API v2
+description:
+- Ensure architectures, media, partition tables, operatingsystems, domains, subnets, environments, smart proxies,
+  compute resources, compute profiles, compute attributes, hostgroups, config templates, roles and users in one
+  module run.
+- Objects referring to other objects of the configuration (e.g. a hostgroup and its subnet) are ensured after them,
+  objects to be deleted before the objects they refer to. Independent objects are ensured in parallel.
+- Referenced objects are searched once per module run and shared by all objects referring to them.
+- Items must name their object and take only the options of their module, otherwise the module fails before
+  changing anything.
+options:
+  architectures:
+    description: List of architectures. Items take the options of foreman_architecture or just a name.
+    required: false
+    default: None
+  compute_attributes:
+    description: List of compute attributes. Items take the options of foreman_compute_attribute.
+    required: false
+    default: None
+  compute_profiles:
+    description: List of compute profiles. Items take the options of foreman_compute_profile or just a name.
+    required: false
+    default: None
+  compute_resources:
+    description: List of compute resources. Items take the options of foreman_compute_resource.
+    required: false
+    default: None
+  config_templates:
+    description: List of config templates. Items take the options of foreman_config_template.
+    required: false
+    default: None
+  domains:
+    description: List of domains. Items take the options of foreman_domain or just a name.
+    required: false
+    default: None
+  environments:
+    description: List of environments. Items take the options of foreman_environment or just a name.
+    required: false
+    default: None
+  hostgroups:
+    description:
+    - List of hostgroups. Items take the options of foreman_hostgroup.
+    - As with foreman_hostgroup references of existing hostgroups are not updated.
+    required: false
+    default: None
+  media:
+    description: List of media. Items take the options of foreman_medium.
+    required: false
+    default: None
+  mirror:
+    description: Path of a SQLite database used as local mirror of Foreman objects, see foreman_hostgroup
+    required: false
+    default: None
+  mirror_max_age:
+    description: Seconds after which mirrored objects are synced incrementally with Foreman
+    required: false
+    default: 300
+  operatingsystems:
+    description: List of operatingsystems. Items take the options of foreman_operatingsystem.
+    required: false
+    default: None
+  pool_size:
+    description: Number of objects ensured in parallel
+    required: false
+    default: 8
+  ptables:
+    description: List of partition tables. Items take the options of foreman_ptable.
+    required: false
+    default: None
+  roles:
+    description: List of roles. Items take the options of foreman_role or just a name.
+    required: false
+    default: None
+  smart_proxies:
+    description: List of smart proxies. Items take the options of foreman_smart_proxy.
+    required: false
+    default: None
+  subnets:
+    description: List of subnets. Items take the options of foreman_subnet.
+    required: false
+    default: None
+  users:
+    description: List of users. Items take the options of foreman_user.
+    required: false
+    default: None
+  result_fields:
+    description:
+    - Fields of the returned objects to keep besides id, name, title and login.
+    - Use it to keep results small, e.g. [] to return identifying fields only. The whole object is returned if
+      not given.
+    required: false
+    default: None
+  foreman_endpoints:
+    description:
+    - List of Foreman servers to apply the same configuration to in parallel instead of the one of foreman_host.
+    - Items take foreman_host, foreman_port, foreman_user and foreman_pass, missing ones default to the options
+      of the module. String items are taken as foreman_host. Results are returned per Foreman in endpoints.
+    required: false
+    default: None
+  foreman_host:
+    description: Hostname or IP address of Foreman system
+    required: false
+    default: 127.0.0.1
+  foreman_read_hosts:
+    description:
+    - Further API nodes of the same Foreman. Reads go to the fastest healthy node of these and foreman_host, writes
+      to foreman_host. Reads fail over to the next node on connection errors.
+    required: false
+    default: None
+  metrics_file:
+    description:
+    - Prometheus textfile collector file (*.prom) on the machine running the module to add the module's Foreman API
+      requests, retries and cache hits to. Counters are summed up over all runs writing the file.
+    required: false
+    default: None
+  trace_dir:
+    description:
+    - Directory on the machine running the module to write a trace of the module run to, one OTLP-JSON file per
+      run with a span for every Foreman API call.
+    required: false
+    default: None
+  http_cache:
+    description:
+    - Directory on the machine running the module to cache Foreman objects in. Objects are revalidated with their
+      ETag or Last-Modified date on every read, unchanged objects cost a 304 response instead of the whole object.
+    required: false
+    default: None
+  http_pool_size:
+    description:
+    - Connections kept alive per Foreman node for the requests the modules send themselves (listings, http_cache).
+      Should be at least the number of threads of the module, e.g. pool_size.
+    required: false
+    default: 10
+  http_timeout:
+    description:
+    - Connect and read timeout in seconds of the requests the modules send themselves. Waits forever if not set.
+    required: false
+    default: None
+  foreman_port:
+    description: Port of Foreman API
+    required: false
+    default: 443
+  foreman_user:
+    description: Username to be used to authenticate on Foreman
+    required: true
+    default: null
+  foreman_pass:
+    description: Password to be used to authenticate user on Foreman
+    required: true
+    default: null
+notes:
+- Requires the python-foreman package to be installed. See https://github.com/Nosmoht/python-foreman.
+- Supports check mode.
+author: Thomas Krahn
+'''
+
+EXAMPLES = '''
+- name: Ensure Foreman configuration
+  foreman_state:
+    architectures:
+    - x86_64
+    media:
+    - name: CoreOS mirror
+      path: http://$release.release.core-os.net
+    ptables:
+    - name: CoreOS Partition Table
+      layout: 'some layout'
+    operatingsystems:
+    - name: CoreOS
+      major: 633
+      architectures:
+      - x86_64
+      media:
+      - CoreOS mirror
+      ptables:
+      - CoreOS Partition Table
+    domains:
+    - example.com
+    hostgroups:
+    - name: Hostgroup01
+      architecture: x86_64
+      domain: example.com
+      medium: CoreOS mirror
+      operatingsystem: CoreOS
+      partition_table: CoreOS Partition Table
+    foreman_user: admin
+    foreman_pass: secret
+    foreman_host: foreman.example.com
+    foreman_port: 443
+'''
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.foreman_mirror import get_mirror
+from ansible.module_utils.foreman_resources import (RESOURCES, Resolver, check_spec, ensure_resource, get_aliases,
+                                                    get_name, get_references, normalize_spec)
+from ansible.module_utils.foreman_utils import ForemanError, ensure_endpoints, get_foreman_client, project
+
+
+def node_key(node):
+    """
+    Sort key of nodes. Names may also be numbers, e.g. of environments.
+    """
+    return node[0], str(node[1])
+
+
+def build_graph(module):
+    """
+    Return all objects of the configuration as nodes (resource, name) -> spec and the nodes each node depends on.
+    Fail if an item lacks its name or has unknown options.
+    """
+    nodes = dict()
+    for resource in RESOURCES:
+        for index, spec in enumerate(module.params[resource] or []):
+            spec = normalize_spec(resource, spec)
+            error = check_spec(resource, spec)
+            if error:
+                module.fail_json(msg='{0} item {1}: {2}'.format(resource, index + 1, error))
+            node = (resource, get_name(resource, spec))
+            if node in nodes:
+                module.fail_json(msg='{0} {1} is defined more than once'.format(resource, node[1]))
+            nodes[node] = spec
+
+    # Further names references may use, e.g. operatingsystems are nodes by name and major version. None if the
+    # name is ambiguous.
+    aliases = dict()
+    for (resource, name), spec in nodes.items():
+        for alias in get_aliases(resource, spec):
+            if (resource, alias) not in nodes:
+                aliases[(resource, alias)] = None if (resource, alias) in aliases else (resource, name)
+
+    dependencies = dict((node, set()) for node in nodes)
+    for node, spec in nodes.items():
+        absent = spec.get('state', 'present') == 'absent'
+        for reference in get_references(node[0], spec):
+            reference = reference if reference in nodes else aliases.get(reference)
+            if reference is None:
+                continue
+            reference_absent = nodes[reference].get('state', 'present') == 'absent'
+            if not absent and not reference_absent:
+                # Create the referenced object first
+                dependencies[node].add(reference)
+            elif absent and reference_absent:
+                # Delete the referring object first
+                dependencies[reference].add(node)
+    return nodes, dependencies
+
+
+def ensure(module, theforeman):
+    nodes, dependencies = build_graph(module)
+    resolver = Resolver(client=theforeman, mirror=get_mirror(module))
+
+    dependents = dict((node, set()) for node in nodes)
+    for node, node_dependencies in dependencies.items():
+        for dependency in node_dependencies:
+            dependents[dependency].add(node)
+
+    results = dict()
+    finished = Queue()
+
+    def ensure_node(node):
+        try:
+            changed, obj = ensure_resource(client=theforeman, resource=node[0], spec=nodes[node], resolver=resolver,
+                                           check_mode=module.check_mode)
+            result = dict(changed=changed, object=project(obj, module.params['result_fields']))
+        except ForemanError as e:
+            result = dict(changed=False, failed=True, msg=e.message)
+        except Exception as e:
+            result = dict(changed=False, failed=True, msg=str(e))
+        finished.put((node, result))
+
+    pool = ThreadPool(processes=max(1, module.params['pool_size']))
+    try:
+        waiting = dict((node, set(node_dependencies)) for node, node_dependencies in dependencies.items())
+        running = 0
+        for node in [node for node, node_dependencies in waiting.items() if not node_dependencies]:
+            del waiting[node]
+            pool.apply_async(ensure_node, (node,))
+            running += 1
+
+        while running:
+            node, result = finished.get()
+            running -= 1
+            results[node] = result
+            for dependent in sorted(dependents[node], key=node_key):
+                if dependent not in waiting:
+                    continue
+                if result.get('failed'):
+                    # Skip everything depending on a failed object
+                    del waiting[dependent]
+                    finished.put((dependent, dict(changed=False, failed=True,
+                                                  msg='{0} {1} failed'.format(node[0], node[1]))))
+                    running += 1
+                    continue
+                waiting[dependent].discard(node)
+                if not waiting[dependent]:
+                    del waiting[dependent]
+                    pool.apply_async(ensure_node, (dependent,))
+                    running += 1
+    finally:
+        pool.close()
+
+    for node in waiting:
+        results[node] = dict(changed=False, failed=True, msg='Circular reference')
+
+    result_list = list()
+    for node in sorted(nodes, key=node_key):
+        result = dict(resource=node[0], name=node[1])
+        result.update(results[node])
+        result_list.append(result)
+    return any(result['changed'] for result in result_list), result_list
+
+
+def ensure_state(module, theforeman):
+    """
+    Like ensure but fail if any object failed.
+    """
+    changed, results = ensure(module, theforeman)
+    failed = [result for result in results if result.get('failed')]
+    if failed:
+        module.fail_json(msg='{0} of {1} objects failed'.format(len(failed), len(results)),
+                         changed=changed, results=results)
+    return changed, results
+
+
+def main():
+    argument_spec = dict(
+        mirror=dict(type='str', default=None),
+        mirror_max_age=dict(type='int', default=300),
+        pool_size=dict(type='int', default=8),
+        result_fields=dict(type='list', default=None),
+        foreman_endpoints=dict(type='list', default=None),
+        foreman_host=dict(type='str', default='127.0.0.1'),
+        foreman_read_hosts=dict(type='list', default=None),
+        metrics_file=dict(type='str', default=None),
+        trace_dir=dict(type='str', default=None),
+        http_cache=dict(type='str', default=None),
+        http_pool_size=dict(type='int', default=10),
+        http_timeout=dict(type='float', default=None),
+        foreman_port=dict(type='str', default='443'),
+        foreman_user=dict(type='str', required=True),
+        foreman_pass=dict(type='str', required=True)
+    )
+    for resource in RESOURCES:
+        argument_spec[resource] = dict(type='list', default=None)
+
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+
+    if module.params['foreman_endpoints']:
+        ensure_endpoints(module, ensure_state, 'results')
+
+    theforeman = get_foreman_client(module)
+
+    changed, results = ensure_state(module, theforeman)
+    module.exit_json(changed=changed, results=results)
+
+
+if __name__ == '__main__':
+    main()
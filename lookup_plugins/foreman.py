@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Lookup plugin returning Foreman objects or single fields of them.
+
+    {{ lookup('foreman', 'hostgroups', 'Hostgroup01', field='id') }}
+    {{ lookup('foreman', 'subnets', 'example.com', field='gateway') }}
+    {{ lookup('foreman', 'config_templates', 'CoreOS PXELinux', field='template') }}
+
+The first term is the resource (one of the lists of foreman_state or hosts), all further terms are names (for
+users logins, for hostgroups and operatingsystems also titles). Without field the whole object is returned.
+Objects are searched as foreman_state does. Fields only returned by the details of an object (e.g. the template
+of a config template) are fetched with a second request.
+
+Keyword arguments:
+  field:          Field to return
+  foreman_host, foreman_port, foreman_user, foreman_pass:
+                  Connection options, default to the variables of the same name
+  mirror, mirror_max_age:
+                  Local mirror of Foreman objects as used by the modules, shared by all lookups, tasks and runs
+
+Objects are memoized per process, so lookups repeated within a task (loops, templates) hit Foreman once per
+object. Use the mirror to share objects between tasks, as Ansible evaluates every task in a process of its own.
+"""
+
+import os
+import threading
+
+from ansible.errors import AnsibleError
+from ansible.plugins.lookup import LookupBase
+
+import ansible.module_utils
+
+# Make module_utils of this repository importable without configuring module_utils for plugins
+MODULE_UTILS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'module_utils')
+if MODULE_UTILS not in ansible.module_utils.__path__:
+    ansible.module_utils.__path__.append(MODULE_UTILS)
+
+from ansible.module_utils.foreman_mirror import ForemanMirror  # noqa: E402
+from ansible.module_utils.foreman_resources import RESOURCES, Resolver  # noqa: E402
+from ansible.module_utils.foreman_utils import ForemanClient, ForemanError  # noqa: E402
+
+CONNECTION_OPTIONS = dict(foreman_host='127.0.0.1', foreman_port='443', foreman_user=None, foreman_pass=None)
+
+# Objects found by lookups of this process: (host, port, resource, name) -> object. Objects fetched with their
+# details are marked with _details.
+MEMO = dict()
+MEMO_LOCK = threading.Lock()
+# One client (and resolver) per connection, sharing coalesced requests
+RESOLVERS = dict()
+
+
+def get_resolver(params):
+    key = (params['foreman_host'], params['foreman_port'], params['foreman_user'], params.get('mirror'))
+    with MEMO_LOCK:
+        if key not in RESOLVERS:
+            client = ForemanClient(hostname=params['foreman_host'],
+                                   port=params['foreman_port'],
+                                   username=params['foreman_user'],
+                                   password=params['foreman_pass'])
+            mirror = None
+            if params.get('mirror'):
+                mirror = ForemanMirror(path=params['mirror'], params=params,
+                                       max_age=params.get('mirror_max_age', 300))
+            RESOLVERS[key] = Resolver(client=client, mirror=mirror)
+        return RESOLVERS[key]
+
+
+def find(resolver, resource, name):
+    if resource == 'hosts':
+        result = None
+        if resolver.mirror:
+            result = resolver.mirror.find('host', name=name)
+        return result or resolver.client.search_host(data=dict(name=name))
+    return resolver.find(resource, name)
+
+
+class LookupModule(LookupBase):
+    def run(self, terms, variables=None, **kwargs):
+        variables = variables or dict()
+        if len(terms) < 2:
+            raise AnsibleError('foreman lookup needs a resource and at least one name')
+        resource = terms[0]
+        if resource not in RESOURCES and resource != 'hosts':
+            raise AnsibleError('Unsupported resource {0}, use one of {1}'.format(
+                resource, ', '.join(sorted(list(RESOURCES) + ['hosts']))))
+        field = kwargs.get('field')
+
+        params = dict()
+        for option, default in CONNECTION_OPTIONS.items():
+            params[option] = kwargs.get(option, variables.get(option, default))
+            if params[option] is None:
+                raise AnsibleError('foreman lookup needs {0}'.format(option))
+            params[option] = self._templar.template(params[option])
+        params['mirror'] = kwargs.get('mirror')
+        params['mirror_max_age'] = int(kwargs.get('mirror_max_age', 300))
+
+        resolver = get_resolver(params)
+        result = list()
+        for name in terms[1:]:
+            key = (params['foreman_host'], params['foreman_port'], resource, name)
+            with MEMO_LOCK:
+                obj = MEMO.get(key)
+            try:
+                if not obj:
+                    obj = find(resolver, resource, name)
+                    if not obj:
+                        raise AnsibleError('{0} {1} not found'.format(resource, name))
+                if not obj.get('_details') and (field is None and RESOURCES.get(resource, dict()).get('details') or
+                                                field is not None and field not in obj):
+                    resource_type = RESOURCES[resource]['type'] if resource in RESOURCES else 'host'
+                    obj = getattr(resolver.client, 'get_{0}'.format(resource_type))(id=obj.get('id'))
+                    obj['_details'] = True
+            except ForemanError as e:
+                raise AnsibleError('Could not look up {0} {1}: {2}'.format(resource, name, e.message))
+            with MEMO_LOCK:
+                MEMO[key] = obj
+            if field:
+                result.append(obj.get(field))
+            else:
+                result.append(dict((k, v) for k, v in obj.items() if k != '_details'))
+        return result
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+On-disk HTTP cache of Foreman objects revalidated with their ETag and Last-Modified validators.
+
+Every GET is sent to Foreman, but with If-None-Match and If-Modified-Since of the cached response. If the object
+didn't change Foreman answers 304 Not Modified without a body and the cached object is returned, so large objects
+(e.g. config templates) are downloaded once. Responses without validators aren't cached.
+
+Cached objects may contain secrets, the cache directory is only accessible by its owner and so are the files in it.
+A directory of another user isn't used.
+"""
+
+import hashlib
+import json
+import os
+import stat
+import threading
+
+from ansible.module_utils.foreman_telemetry import METRICS
+from ansible.module_utils.foreman_utils import ForemanError
+
+
+class HttpCache(object):
+    def __init__(self, path):
+        """
+        :param path: Directory holding one file per cached response
+        """
+        self.path = path
+        try:
+            os.makedirs(path, 0o700)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+        # makedirs leaves existing directories as they are
+        status = os.stat(path)
+        if status.st_uid != os.getuid():
+            raise ForemanError('http_cache {0} belongs to another user'.format(path))
+        if stat.S_IMODE(status.st_mode) & 0o077:
+            os.chmod(path, 0o700)
+
+    def _file(self, key):
+        return os.path.join(self.path, '{0}.json'.format(hashlib.sha1(key.encode('utf-8')).hexdigest()))
+
+    def load(self, key):
+        """
+        Return the cached entry of key (etag, last_modified and data) or None.
+        """
+        try:
+            with open(self._file(key)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def store(self, key, etag, last_modified, data):
+        """
+        Write the entry of key readable only by the owner. Responses are cached best effort, the entry is dropped if
+        it can't be written.
+        """
+        path = self._file(key)
+        tmp_path = '{0}.{1}.{2}.tmp'.format(path, os.getpid(), threading.current_thread().ident)
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except OSError:
+            return
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(etag=etag, last_modified=last_modified, data=data), f)
+        os.rename(tmp_path, path)
+
+    def get(self, session, url, username):
+        """
+        GET url with session, revalidating the cached response if there is one. Responses are cached per user as
+        Foreman returns different fields depending on permissions.
+        """
+        import requests
+
+        key = '{0} {1}'.format(username, url)
+        entry = self.load(key)
+        headers = dict()
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = session.get(url, headers=headers)
+        except requests.exceptions.RequestException as e:
+            raise ForemanError('Could not get {0}: {1}'.format(url, e))
+
+        if response.status_code == 304 and entry:
+            METRICS.cache('http', hit=True)
+            return entry['data']
+        if response.status_code != 200:
+            raise ForemanError('Could not get {0}: HTTP {1} {2}'.format(url, response.status_code, response.text),
+                               status_code=response.status_code)
+        METRICS.cache('http', hit=False)
+        data = response.json()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self.store(key, etag, last_modified, data)
+        return data
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""
+Pending long running operations (builds, power actions) persisted across module runs.
+
+Modules run with Ansible's async may be killed at the async timeout, and a later run checking on the same host
+shouldn't repeat the whole ensure. A module records the operation it started together with the host id and a
+deadline in a job state file; the next run finds the job and only checks whether the operation finished.
+"""
+
+import json
+import os
+import time
+
+from ansible.module_utils.foreman_utils import process_lock
+
+
+class JobState(object):
+    """
+    Jobs keyed by name in a JSON file shared by all processes of the user, updated under a lock.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return dict()
+
+    def _save(self, jobs):
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(jobs, f)
+        os.rename(tmp_path, self.path)
+
+    def get(self, name):
+        """
+        Return the job of name or None.
+        """
+        return self._load().get(name)
+
+    def start(self, name, host_id, operation, timeout, **kwargs):
+        """
+        Record that operation was started for the host, it has to finish within timeout seconds.
+        """
+        job = dict(host_id=host_id, operation=operation, started=time.time(), deadline=time.time() + timeout)
+        job.update(kwargs)
+        with process_lock('jobs:{0}'.format(self.path)):
+            jobs = self._load()
+            jobs[name] = job
+            self._save(jobs)
+        return job
+
+    def finish(self, name):
+        with process_lock('jobs:{0}'.format(self.path)):
+            jobs = self._load()
+            if jobs.pop(name, None) is not None:
+                self._save(jobs)
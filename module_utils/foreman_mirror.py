@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local SQLite mirror of Foreman objects.
+
+Each resource type is synced on first use and again once its last sync is older than max_age seconds. Syncs are
+incremental: only objects with updated_at newer than the newest mirrored one are fetched. If the number of objects
+Foreman reports differs from the mirrored number afterwards (objects were deleted) or the endpoint can't search by
+updated_at the resource type is synced completely.
+
+sqlite3 and foreman_telemetry are only imported once a mirror is used, modules merely importing get_mirror don't
+pay for them.
+"""
+
+import json
+import threading
+import time
+
+from ansible.module_utils.foreman_utils import ForemanError, get_endpoint, iter_resources
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS objects (endpoint TEXT NOT NULL, id INTEGER NOT NULL, name TEXT, title TEXT, '
+    'updated_at TEXT, data TEXT NOT NULL, PRIMARY KEY (endpoint, id))',
+    'CREATE INDEX IF NOT EXISTS objects_name ON objects (endpoint, name)',
+    'CREATE INDEX IF NOT EXISTS objects_title ON objects (endpoint, title)',
+    'CREATE TABLE IF NOT EXISTS sync_state (endpoint TEXT PRIMARY KEY, updated_at TEXT, synced_at REAL NOT NULL, '
+    'incremental INTEGER NOT NULL DEFAULT 1)',
+]
+
+
+class ForemanMirror(object):
+    def __init__(self, path, params, max_age=300):
+        """
+        :param path: SQLite database file
+        :param params: Module parameters containing the foreman_* connection options
+        :param max_age: Seconds after which a resource type is synced again
+        """
+        self.params = params
+        self.max_age = max_age
+        import sqlite3
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.db:
+            for statement in SCHEMA:
+                self.db.execute(statement)
+
+    def find(self, resource_type, name=None, title=None):
+        """
+        Return the mirrored object of resource_type with the given name or title. None is returned if the object is
+        unknown or resource_type isn't mirrored; callers should search Foreman in that case.
+        """
+        endpoint = get_endpoint(resource_type)
+        if not endpoint:
+            return None
+        self.sync(endpoint)
+        if name is not None:
+            where, value = 'name = ?', name
+        else:
+            where, value = 'title = ?', title
+        with self.lock:
+            row = self.db.execute('SELECT data FROM objects WHERE endpoint = ? AND ' + where + ' ORDER BY id LIMIT 1',
+                                  (endpoint, value)).fetchone()
+        from ansible.module_utils.foreman_telemetry import METRICS
+        METRICS.cache('mirror', hit=bool(row))
+        if row:
+            return json.loads(row[0])
+        return None
+
+    def store(self, resource_type, obj):
+        """
+        Add or replace an object, e.g. after it was created or updated by a module.
+        """
+        endpoint = get_endpoint(resource_type)
+        if endpoint and obj and obj.get('id') is not None:
+            with self.lock:
+                with self.db:
+                    self._store(endpoint, obj)
+
+    def forget(self, resource_type, obj_id):
+        endpoint = get_endpoint(resource_type)
+        if endpoint:
+            with self.lock:
+                with self.db:
+                    self.db.execute('DELETE FROM objects WHERE endpoint = ? AND id = ?', (endpoint, obj_id))
+
+    def replace(self, endpoint, objects):
+        """
+        Replace all mirrored objects of endpoint by objects, e.g. from an export. The endpoint counts as synced now.
+        objects may be an iterator, it's consumed one by one.
+        """
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                state = self._sync_state(endpoint)
+                self.db.execute('DELETE FROM objects WHERE endpoint = ?', (endpoint,))
+                last_updated_at = None
+                for obj in objects:
+                    self._store(endpoint, obj)
+                    if obj.get('updated_at'):
+                        last_updated_at = max(last_updated_at or '', obj.get('updated_at'))
+                self.db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)',
+                                (endpoint, last_updated_at, time.time(), 0 if state and not state[2] else 1))
+                self.db.commit()
+            except:
+                self.db.rollback()
+                raise
+
+    def sync(self, endpoint, force=False):
+        with self.lock:
+            state = self._sync_state(endpoint)
+            if not force and state and time.time() - state[1] < self.max_age:
+                return
+            # BEGIN IMMEDIATE serializes syncs of concurrent module runs sharing the database
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                state = self._sync_state(endpoint)
+                if force or not state or time.time() - state[1] >= self.max_age:
+                    self._sync(endpoint, state)
+                self.db.commit()
+            except:
+                self.db.rollback()
+                raise
+
+    def _sync_state(self, endpoint):
+        return self.db.execute('SELECT updated_at, synced_at, incremental FROM sync_state WHERE endpoint = ?',
+                               (endpoint,)).fetchone()
+
+    def _on_page(self, endpoint):
+        def on_page(seconds, error, size):
+            from ansible.module_utils.foreman_telemetry import METRICS, trace_page
+            METRICS.request(self.params['foreman_host'], 'GET {0}'.format(endpoint), seconds, error)
+            trace_page(self.params['foreman_host'], 'GET {0}'.format(endpoint), seconds, error, size)
+
+        return on_page
+
+    def _sync(self, endpoint, state):
+        synced_at = time.time()
+        last_updated_at = state[0] if state else None
+        incremental = bool(state and state[0] and state[2])
+
+        if incremental:
+            meta = dict()
+            try:
+                for obj in iter_resources(self.params, endpoint, search='updated_at >= "{0}"'.format(last_updated_at),
+                                          meta=meta, on_page=self._on_page(endpoint)):
+                    self._store(endpoint, obj)
+                    last_updated_at = max(last_updated_at, obj.get('updated_at') or '')
+            except ForemanError as e:
+                if e.status_code not in (400, 422):
+                    raise
+                # Endpoint doesn't support searching by updated_at
+                self.db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, 0)', (endpoint, None, 0))
+                incremental = False
+            else:
+                count = self.db.execute('SELECT COUNT(*) FROM objects WHERE endpoint = ?', (endpoint,)).fetchone()[0]
+                incremental = meta.get('total') is None or meta.get('total') == count
+
+        if not incremental:
+            self.db.execute('DELETE FROM objects WHERE endpoint = ?', (endpoint,))
+            last_updated_at = None
+            for obj in iter_resources(self.params, endpoint, on_page=self._on_page(endpoint)):
+                self._store(endpoint, obj)
+                if obj.get('updated_at'):
+                    last_updated_at = max(last_updated_at or '', obj.get('updated_at'))
+            state = self._sync_state(endpoint)
+
+        supports_incremental = 0 if state and not state[2] else 1
+        self.db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)',
+                        (endpoint, last_updated_at, synced_at, supports_incremental))
+
+    def _store(self, endpoint, obj):
+        self.db.execute('INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?)',
+                        (endpoint, obj.get('id'), obj.get('name'), obj.get('title'), obj.get('updated_at'),
+                         json.dumps(obj)))
+
+
+def get_mirror(module):
+    """
+    Return a ForemanMirror if the mirror option of module is set, otherwise None.
+    """
+    if not module.params.get('mirror'):
+        return None
+    return ForemanMirror(path=module.params['mirror'], params=module.params,
+                         max_age=module.params.get('mirror_max_age') or 0)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""
+Selection of Foreman API nodes for deployments with several nodes serving the same Foreman.
+
+Writes always go to the primary node (foreman_host). Reads go to the fastest healthy node of foreman_read_hosts
+and the primary. Latency and failures of every node are kept in a state file shared by all module runs of the
+user on this machine, so later runs start with the fastest node. Nodes never measured or measured too long ago
+are probed with a request of the API status before they are ranked.
+
+A node failing with a connection error or a 5xx status is skipped for RETRY_AFTER seconds.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+# Weight of a new latency measurement in the moving average
+SMOOTHING = 0.3
+# Seconds after which a latency measurement is probed again
+PROBE_INTERVAL = 300
+# Seconds a failed node is skipped
+RETRY_AFTER = 60
+PROBE_TIMEOUT = 5
+
+
+def get_state_path():
+    return os.path.join(tempfile.gettempdir(), 'ansible-foreman-{0}'.format(os.getuid()), 'nodes.json')
+
+
+class NodeSelector(object):
+    def __init__(self, primary, read_hosts, port, username, password, path=None):
+        """
+        :param primary: Node receiving writes
+        :param read_hosts: Further nodes serving reads
+        :param port: Port of the API on all nodes
+        :param path: State file, defaults to a file in the temp directory
+        """
+        self.primary = primary
+        self.hosts = [primary] + [host for host in read_hosts if host != primary]
+        self.port = port
+        self.username = username
+        self.password = password
+        self.path = path or get_state_path()
+        self.lock = threading.Lock()
+        self.stats = self._load()
+        self.probed = False
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return dict()
+
+    def save(self):
+        """
+        Merge the stats of this run's nodes into the state file.
+        """
+        directory = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+            stats = self._load()
+            with self.lock:
+                for host in self.hosts:
+                    if host in self.stats:
+                        stats[host] = self.stats[host]
+            tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(stats, f)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            # The stats only speed up later runs
+            pass
+
+    def record(self, host, elapsed=None, failed=False):
+        """
+        Record a request to host which took elapsed seconds or failed.
+        """
+        now = time.time()
+        with self.lock:
+            stat = self.stats.setdefault(host, dict(latency=None, measured_at=0, failures=0, failed_at=0))
+            if failed:
+                stat['failures'] += 1
+                stat['failed_at'] = now
+                return
+            stat['failures'] = 0
+            if stat['latency'] is None:
+                stat['latency'] = elapsed
+            else:
+                stat['latency'] = (1 - SMOOTHING) * stat['latency'] + SMOOTHING * elapsed
+            stat['measured_at'] = now
+
+    def healthy(self, host):
+        stat = self.stats.get(host)
+        return not stat or not stat['failures'] or time.time() - stat['failed_at'] > RETRY_AFTER
+
+    def probe(self, host):
+        try:
+            import requests
+        except ImportError:
+            return
+        url = 'https://{0}:{1}/api/v2/status'.format(host, self.port)
+        start = time.time()
+        try:
+            response = requests.get(url, auth=(self.username, self.password), verify=False, timeout=PROBE_TIMEOUT,
+                                    headers=dict(Accept='application/json'))
+            failed = response.status_code >= 500
+        except requests.exceptions.RequestException:
+            failed = True
+        self.record(host, elapsed=time.time() - start, failed=failed)
+
+    def probe_stale(self):
+        """
+        Probe nodes in parallel whose latency is unknown or older than PROBE_INTERVAL. Done once per run.
+        """
+        with self.lock:
+            if self.probed:
+                return
+            self.probed = True
+            now = time.time()
+            stale = [host for host in self.hosts if self.healthy(host) and (
+                host not in self.stats or now - self.stats[host]['measured_at'] > PROBE_INTERVAL)]
+        if len(self.hosts) < 2 or not stale:
+            return
+        pool = ThreadPool(processes=len(stale))
+        try:
+            pool.map(self.probe, stale)
+        finally:
+            pool.close()
+        self.save()
+
+    def read_order(self):
+        """
+        Return the nodes to try for a read: healthy ones fastest first, then failed ones as last resort.
+        Nodes not measured yet (e.g. probing needs python-requests) come first so they get measured.
+        """
+        self.probe_stale()
+
+        def latency(host):
+            stat = self.stats.get(host) or dict()
+            return stat.get('latency') or 0
+
+        with self.lock:
+            healthy = [host for host in self.hosts if self.healthy(host)]
+            failed = [host for host in self.hosts if host not in healthy]
+            return sorted(healthy, key=latency) + failed
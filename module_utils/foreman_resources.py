@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generic handling of the resource types managed by the foreman_* modules.
+
+RESOURCES describes each resource type by the options of its module. Options not described there are passed
+to Foreman as they are (after renaming) and compared with the current object.
+
+  type:        Resource type as used in the method names of python-foreman (search_<type>, create_<type>, ...)
+  options:     Options items take besides state, those of the resource's module. Others are rejected
+  key:         Option identifying an object, defaults to name
+  identity:    Options identifying an object together if given, e.g. name and major of operatingsystems
+  refs:        Options naming a single object of another resource type: option -> (resource, id field)
+  list_refs:   Options naming a list of objects of another resource type: option -> resource
+  rename:      Options sent to Foreman using another name: option -> field
+  files:       Options naming a file whose content is sent as field: option -> field
+  create_only: Options only sent when creating the object, e.g. passwords Foreman doesn't return
+  readonly:    Fields Foreman doesn't allow to change. Existing objects are not updated because of them
+  compare:     Fields the module compares to decide whether to update an object, defaults to all fields sent
+  defaults:    Fields the module sends with a default value if their option isn't given: field -> value
+  details:     Whether the object must be fetched completely to compare nested lists
+  title:       Whether objects may also be referenced by their title
+"""
+
+import threading
+
+from ansible.module_utils.foreman_telemetry import METRICS
+from ansible.module_utils.foreman_utils import ForemanError, changed_fields as changed_data, names
+
+RESOURCES = dict(
+    architectures=dict(type='architecture', options=['name'], compare=[]),
+    compute_attributes=dict(type='compute_attribute', options=['compute_profile', 'compute_resource', 'vm_attributes'],
+                            refs=dict(compute_profile=('compute_profiles', 'compute_profile_id'),
+                                      compute_resource=('compute_resources', 'compute_resource_id'))),
+    compute_profiles=dict(type='compute_profile', options=['name'], compare=[]),
+    compute_resources=dict(type='compute_resource', create_only=['password'],
+                           options=['name', 'access_key', 'datacenter', 'display_type', 'email', 'key_path',
+                                    'password', 'provider', 'region', 'server', 'tenat', 'url', 'user']),
+    config_templates=dict(type='config_template', details=True, create_only=['audit_comment'],
+                          options=['name', 'audit_comment', 'locked', 'operatingsystems', 'snippet', 'template',
+                                   'template_file', 'template_kind_name'],
+                          files=dict(template_file='template'), list_refs=dict(operatingsystems='operatingsystems'),
+                          compare=['locked', 'snippet', 'template', 'operatingsystems'],
+                          defaults=dict(locked=False, snippet=False)),
+    domains=dict(type='domain', options=['name', 'fullname']),
+    environments=dict(type='environment', options=['name'], compare=[]),
+    hostgroups=dict(type='hostgroup', title=True, compare=[],
+                    options=['name', 'architecture', 'compute_profile', 'domain', 'environment', 'medium',
+                             'operatingsystem', 'partition_table', 'smart_proxy', 'subnet'],
+                    refs=dict(architecture=('architectures', 'architecture_id'),
+                              compute_profile=('compute_profiles', 'compute_profile_id'),
+                              domain=('domains', 'domain_id'),
+                              environment=('environments', 'environment_id'),
+                              medium=('media', 'medium_id'),
+                              operatingsystem=('operatingsystems', 'operatingsystem_id'),
+                              partition_table=('ptables', 'ptable_id'),
+                              smart_proxy=('smart_proxies', 'puppet_proxy_id'),
+                              subnet=('subnets', 'subnet_id')),
+                    # See foreman_hostgroup
+                    readonly=['architecture_id', 'compute_profile_id', 'domain_id', 'environment_id', 'medium_id',
+                              'operatingsystem_id', 'subnet_id', 'ptable_id', 'puppet_proxy_id']),
+    media=dict(type='medium', options=['name', 'path'], compare=['path']),
+    operatingsystems=dict(type='operatingsystem', details=True, title=True, identity=['name', 'major'],
+                          options=['name', 'architectures', 'description', 'family', 'major', 'media', 'minor',
+                                   'ptables', 'release_name'],
+                          list_refs=dict(architectures='architectures', media='media', ptables='ptables'),
+                          compare=['description', 'family', 'major', 'minor', 'release_name', 'architectures', 'media',
+                                   'ptables']),
+    ptables=dict(type='partition_table', options=['name', 'layout'], compare=[]),
+    roles=dict(type='role', options=['name'], compare=[]),
+    smart_proxies=dict(type='smart_proxy', options=['name', 'url'], compare=['url']),
+    subnets=dict(type='subnet', rename=dict(ip_from='from', ip_to='to'),
+                 options=['name', 'dns_primary', 'dns_secondary', 'gateway', 'ip_from', 'ip_to', 'ipam', 'mask',
+                          'network', 'vlanid']),
+    users=dict(type='user', key='login', details=True, create_only=['password'],
+               options=['login', 'admin', 'auth', 'auth_source_name', 'firstname', 'lastname', 'mail', 'password',
+                        'roles'],
+               rename=dict(auth='auth_source_name'), list_refs=dict(roles='roles'),
+               compare=['admin', 'auth_source_name', 'firstname', 'lastname', 'mail', 'roles'],
+               defaults=dict(auth_source_name='Internal', roles=[])),
+)
+
+
+def get_name(resource, spec):
+    """
+    Return the identifying value of spec, e.g. the name or for users the login.
+    """
+    if resource == 'compute_attributes':
+        return '{0}/{1}'.format(spec.get('compute_profile'), spec.get('compute_resource'))
+    key = RESOURCES[resource].get('key', 'name')
+    if RESOURCES[resource].get('identity'):
+        # e.g. CentOS 7, the title Foreman gives the operatingsystem unless it has a minor version
+        return ' '.join(str(spec[field]) for field in RESOURCES[resource]['identity'] if spec.get(field) is not None)
+    return spec.get(key, spec.get('name'))
+
+
+def get_identity(resource, spec):
+    """
+    Return the fields searched to find the object of spec, None if the name alone identifies it.
+    """
+    fields = RESOURCES[resource].get('identity')
+    if not fields:
+        return None
+    return dict((field, spec[field]) for field in fields if spec.get(field) is not None)
+
+
+def get_aliases(resource, spec):
+    """
+    Return further names references may use for the object of spec: the name and the full title (with minor
+    version) of an operatingsystem.
+    """
+    if not RESOURCES[resource].get('identity'):
+        return []
+    result = [spec.get(RESOURCES[resource].get('key', 'name'))]
+    if spec.get('minor'):
+        result.append('{0}.{1}'.format(get_name(resource, spec), spec['minor']))
+    return result
+
+
+def check_spec(resource, spec):
+    """
+    Return why the normalized spec can't be ensured, e.g. a missing name or an unknown option, None if it can.
+    """
+    if resource == 'compute_attributes':
+        required = ['compute_profile', 'compute_resource']
+    else:
+        required = [RESOURCES[resource].get('key', 'name')]
+    for option in required:
+        if spec.get(option) is None or not str(spec[option]).strip():
+            return '{0} is required'.format(option)
+    options = RESOURCES[resource]['options']
+    unknown = sorted(str(option) for option in spec if option != 'state' and option not in options)
+    if unknown:
+        return 'Unsupported parameters {0}'.format(', '.join(unknown))
+    return None
+
+
+def normalize_spec(resource, spec):
+    """
+    Allow objects without further options to be given by name only.
+    """
+    if isinstance(spec, dict):
+        return spec
+    return {RESOURCES[resource].get('key', 'name'): spec}
+
+
+def get_references(resource, spec):
+    """
+    Return all (resource, name) pairs spec refers to.
+    """
+    definition = RESOURCES[resource]
+    result = list()
+    for option, (ref_resource, id_field) in definition.get('refs', dict()).items():
+        if spec.get(option):
+            result.append((ref_resource, spec[option]))
+    for option, ref_resource in definition.get('list_refs', dict()).items():
+        for item in spec.get(option) or []:
+            result.append((ref_resource, item.get('name') if isinstance(item, dict) else item))
+    return result
+
+
+class Resolver(object):
+    """
+    Thread safe cache of searched objects shared by all objects ensured within one module run.
+    Concurrent lookups of the same object wait for the first one instead of searching again.
+    """
+
+    def __init__(self, client, mirror=None):
+        self.client = client
+        self.mirror = mirror
+        self.cache = dict()
+        self.locks = dict()
+        self.lock = threading.Lock()
+
+    def _lock(self, key):
+        with self.lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def find(self, resource, name, identity=None):
+        """
+        Return the object of resource named name or None if it doesn't exist. identity (see get_identity) is
+        searched instead of name if given.
+        """
+        key = (resource, name)
+        with self._lock(key):
+            METRICS.cache('resolver', hit=key in self.cache)
+            if key not in self.cache:
+                self.cache[key] = self._search(resource, name, identity)
+            return self.cache[key]
+
+    def get(self, resource, name):
+        """
+        Like find but raise ForemanError if the object doesn't exist.
+        """
+        result = self.find(resource, name)
+        if not result:
+            raise ForemanError('{0} {1} not found'.format(RESOURCES[resource]['type'], name))
+        return result
+
+    def remember(self, resource, name, obj):
+        with self._lock((resource, name)):
+            self.cache[(resource, name)] = obj
+        if self.mirror and obj and obj.get('id') is not None:
+            self.mirror.store(RESOURCES[resource]['type'], obj)
+
+    def forget(self, resource, name, obj_id=None):
+        with self._lock((resource, name)):
+            self.cache[(resource, name)] = None
+        if self.mirror and obj_id is not None:
+            self.mirror.forget(RESOURCES[resource]['type'], obj_id)
+
+    def _search(self, resource, name, identity=None):
+        definition = RESOURCES[resource]
+        resource_type = definition['type']
+        key = definition.get('key', 'name')
+        if identity:
+            return self._search_identity(resource_type, key, identity)
+        if self.mirror:
+            result = self.mirror.find(resource_type, name=name)
+            if not result and definition.get('title'):
+                result = self.mirror.find(resource_type, title=name)
+            if result:
+                return result
+        search = getattr(self.client, 'search_{0}'.format(resource_type))
+        result = search(data={key: name})
+        if not result and definition.get('title'):
+            result = search(data=dict(title=name))
+        if result and self.mirror:
+            self.mirror.store(resource_type, result)
+        return result
+
+    def _search_identity(self, resource_type, key, identity):
+        """
+        Search the object with all fields of identity, e.g. name and major version.
+        """
+        if self.mirror:
+            # The mirror finds objects by name only, use it if the first one matches
+            result = self.mirror.find(resource_type, name=identity.get(key))
+            if result and all(str(result.get(field)) == str(value) for field, value in identity.items()):
+                return result
+        result = getattr(self.client, 'search_{0}'.format(resource_type))(data=identity)
+        if result and self.mirror:
+            self.mirror.store(resource_type, result)
+        return result
+
+
+def build_data(resource, spec, resolver):
+    """
+    Return the data sent to Foreman for spec with all references resolved.
+    """
+    definition = RESOURCES[resource]
+    refs = definition.get('refs', dict())
+    list_refs = definition.get('list_refs', dict())
+    rename = definition.get('rename', dict())
+    files = definition.get('files', dict())
+
+    data = dict()
+    for option, value in spec.items():
+        if option == 'state' or value is None:
+            continue
+        if option in files:
+            data[files[option]] = read_file(value)
+        elif option in refs:
+            ref_resource, id_field = refs[option]
+            data[id_field] = resolver.get(ref_resource, value).get('id')
+        elif option in list_refs:
+            data[option] = [resolver.get(list_refs[option], item.get('name') if isinstance(item, dict) else item)
+                            for item in value]
+        else:
+            data[rename.get(option, option)] = value
+    for field, value in definition.get('defaults', dict()).items():
+        data.setdefault(field, value)
+    return data
+
+
+def changed_fields(resource, data, current):
+    """
+    Return the fields of data differing from the current object. Nested lists are compared by name.
+    """
+    definition = RESOURCES[resource]
+    ignored = set(definition.get('create_only', [])) | set(definition.get('readonly', []))
+    keys = definition.get('compare')
+    if keys is None:
+        keys = list(data)
+    return changed_data(data=data, current=current, keys=[field for field in keys if field not in ignored],
+                        list_keys=list(definition.get('list_refs', dict())))
+
+
+def read_file(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except IOError as e:
+        raise ForemanError('Could not open file {0}: {1}'.format(path, e))
+
+
+def diff_resource(resource, spec, current):
+    """
+    Compare spec with the current object as the resource's module does, without resolving references: only the
+    fields the module updates are compared, with its defaults applied (see changed_fields). Nested lists are
+    compared by name. References of hostgroups are readonly, so references are never compared.
+    Returns the differing fields as field -> dict(desired=..., current=...).
+    """
+    definition = RESOURCES[resource]
+    refs = definition.get('refs', dict())
+    list_refs = definition.get('list_refs', dict())
+    rename = definition.get('rename', dict())
+    files = definition.get('files', dict())
+
+    data = dict()
+    for option, value in spec.items():
+        if option == 'state' or option in refs or value is None:
+            continue
+        if option in files:
+            data[files[option]] = read_file(value)
+        elif option in list_refs:
+            data[option] = [item if isinstance(item, dict) else dict(name=item) for item in value]
+        else:
+            data[rename.get(option, option)] = value
+    for field, value in definition.get('defaults', dict()).items():
+        data.setdefault(field, value)
+
+    result = dict()
+    for field, value in changed_fields(resource=resource, data=data, current=current).items():
+        if field in list_refs:
+            result[field] = dict(desired=sorted(names(value)), current=sorted(names(current.get(field))))
+        else:
+            result[field] = dict(desired=value, current=current.get(field))
+    return result
+
+
+def ensure_resource(client, resource, spec, resolver, check_mode=False):
+    """
+    Ensure one object of resource as described by spec, which takes the options of the resource's module.
+    Returns whether the object changed and the object. Errors are raised as ForemanError.
+    """
+    if resource == 'compute_attributes':
+        return ensure_compute_attribute(client=client, spec=spec, resolver=resolver, check_mode=check_mode)
+
+    definition = RESOURCES[resource]
+    resource_type = definition['type']
+    name = get_name(resource, spec)
+    state = spec.get('state', 'present')
+
+    current = resolver.find(resource, name, identity=get_identity(resource, spec))
+    if current and definition.get('details'):
+        current = getattr(client, 'get_{0}'.format(resource_type))(id=current.get('id'))
+
+    if state == 'absent':
+        if not current:
+            return False, None
+        if not check_mode:
+            getattr(client, 'delete_{0}'.format(resource_type))(id=current.get('id'))
+        resolver.forget(resource, name, current.get('id'))
+        return True, current
+
+    data = build_data(resource=resource, spec=spec, resolver=resolver)
+
+    if not current:
+        if check_mode:
+            obj = dict(data, id=None)
+        else:
+            obj = getattr(client, 'create_{0}'.format(resource_type))(data=data)
+        resolver.remember(resource, name, obj)
+        return True, obj
+
+    data = changed_fields(resource=resource, data=data, current=current)
+    if not data:
+        return False, current
+
+    if check_mode:
+        return True, current
+    obj = getattr(client, 'update_{0}'.format(resource_type))(id=current.get('id'), data=data)
+    resolver.remember(resource, name, obj)
+    return True, obj
+
+
+def ensure_compute_attribute(client, spec, resolver, check_mode=False):
+    compute_resource = resolver.get('compute_resources', spec.get('compute_resource'))
+    compute_profile = resolver.get('compute_profiles', spec.get('compute_profile'))
+    vm_attributes = spec.get('vm_attributes') or dict()
+
+    if compute_resource.get('id') is None or compute_profile.get('id') is None:
+        # Both are created by this check mode run
+        return True, None
+
+    compute_attributes = client.get_compute_attribute(compute_resource_id=compute_resource.get('id'),
+                                                      compute_profile_id=compute_profile.get('id'))
+    current = compute_attributes[0] if compute_attributes else None
+
+    if not current:
+        if check_mode:
+            return True, dict(vm_attrs=vm_attributes)
+        return True, client.create_compute_attribute(compute_resource_id=compute_resource.get('id'),
+                                                     compute_profile_id=compute_profile.get('id'),
+                                                     data={'vm_attrs': vm_attributes})
+
+    if all(current.get(key, vm_attributes.get(key)) == vm_attributes.get(key) for key in vm_attributes):
+        return False, current
+    if check_mode:
+        return True, current
+    current['vm_attrs'] = vm_attributes
+    return True, client.update_compute_attribute(id=current.get('id'), data=current)
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measurements of the requests the foreman_* modules send to Foreman.
+
+Every ForemanClient records the duration of its API calls in ApiStats. Modules return count, sum and percentiles
+of them by call as api_stats, the foreman_timing callback plugin aggregates them over a play.
+
+With the trace_dir option every module run writes a trace as OTLP-JSON file (as exported by OpenTelemetry's
+file exporters, importable e.g. into Jaeger or Grafana Tempo) to that directory: a root span for the module run and
+a child span for every API call with its endpoint, status and payload sizes.
+
+With the metrics_file option the modules also add their requests, retries and cache hits to a file in the format
+of Prometheus' textfile collector (node_exporter --collector.textfile.directory). Counters are summed up over all
+module runs writing the same file, the file is locked while it's updated so forks don't lose each other's counts.
+"""
+
+import atexit
+import binascii
+import json
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Durations kept per call to compute the percentiles of, counts and sums are always complete
+MAX_SAMPLES = 1000
+
+# Percentiles of the durations per call the modules return in api_stats
+PERCENTILES = [50, 95, 99]
+
+# Upper bounds (seconds) of the buckets of foreman_api_request_duration_seconds
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+METRICS_HELP = [
+    ('foreman_api_requests_total', 'counter', 'Requests sent to the Foreman API'),
+    ('foreman_api_request_duration_seconds', 'histogram', 'Duration of requests sent to the Foreman API'),
+    ('foreman_api_retries_total', 'counter', 'Reads repeated on another API node after a node failed'),
+    ('foreman_cache_hits_total', 'counter', 'Lookups answered without a request to Foreman'),
+    ('foreman_cache_misses_total', 'counter', 'Lookups that needed a request to Foreman'),
+]
+
+VERBS = [('search_', 'GET'), ('get_', 'GET'), ('create_', 'POST'), ('update_', 'PUT'), ('set_', 'PUT'),
+         ('delete_', 'DELETE')]
+
+
+def get_call_key(name):
+    """
+    Return the key calls are aggregated by: python-foreman method names as they are, paths of list endpoints
+    without ids, e.g. GET hosts/:id/parameters.
+    """
+    return re.sub(r'/\d+(?=/|$)', '/:id', name)
+
+
+def percentile(values, p):
+    """
+    Return the p-th percentile (nearest rank) of values.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, int(math.ceil(p / 100.0 * len(values))))
+    return values[rank - 1]
+
+
+def get_verb_endpoint(name):
+    """
+    Return HTTP verb and endpoint of a call, e.g. (GET, hostgroup) for search_hostgroup and (GET, hosts/:id/parameters)
+    for GET hosts/42/parameters. Other python-foreman methods (e.g. power actions) are taken as PUT.
+    """
+    key = get_call_key(name)
+    if ' ' in key:
+        verb, endpoint = key.split(' ', 1)
+        return verb, endpoint
+    for prefix, verb in VERBS:
+        if key.startswith(prefix):
+            return verb, key[len(prefix):]
+    return 'PUT', key
+
+
+def get_status(error):
+    """
+    Return the status label of a call that raised error, None if it succeeded.
+    """
+    if error is None:
+        return 'ok'
+    status_code = getattr(error, 'status_code', None)
+    return str(status_code) if status_code else 'error'
+
+
+class Metrics(object):
+    """
+    Thread safe counters and histograms of this process, written to a textfile collector file by write.
+    Nothing is recorded unless a path was set by enable_metrics.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        # (metric name, sorted label items) -> value
+        self.values = dict()
+
+    def inc(self, name, value=1, **labels):
+        if not self.path:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.path:
+            return
+        for bound in LATENCY_BUCKETS:
+            if seconds <= bound:
+                self.inc(name + '_bucket', le=format_value(bound), **labels)
+        self.inc(name + '_bucket', le='+Inf', **labels)
+        self.inc(name + '_sum', seconds, **labels)
+        self.inc(name + '_count', **labels)
+
+    def request(self, foreman, name, seconds, error=None):
+        verb, endpoint = get_verb_endpoint(name)
+        self.inc('foreman_api_requests_total', foreman=foreman, verb=verb, endpoint=endpoint,
+                 status=get_status(error))
+        self.observe('foreman_api_request_duration_seconds', seconds, foreman=foreman, verb=verb, endpoint=endpoint)
+
+    def cache(self, cache, hit):
+        self.inc('foreman_cache_hits_total' if hit else 'foreman_cache_misses_total', cache=cache)
+
+    def write(self):
+        """
+        Add the values of this process to the file and reset them.
+        """
+        with self.lock:
+            values, self.values = self.values, dict()
+        if not self.path or not values:
+            return
+        import fcntl
+
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                for key, value in read_metrics(self.path).items():
+                    values[key] = values.get(key, 0) + value
+                # The collector may read the file any time, replace it at once
+                tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+                with open(tmp_path, 'w') as f:
+                    f.write(format_metrics(values))
+                os.rename(tmp_path, self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def format_labels(labels):
+    return ','.join('{0}="{1}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                       .replace('\n', '\\n'))
+                    for key, value in labels)
+
+
+def unescape(value):
+    return re.sub(r'\\(.)', lambda match: '\n' if match.group(1) == 'n' else match.group(1), value)
+
+
+def parse_labels(text):
+    return tuple(sorted((key, unescape(value)) for key, value in re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', text)))
+
+
+def read_metrics(path):
+    """
+    Return the values of a file written by Metrics.write as (metric name, label items) -> value.
+    """
+    values = dict()
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except (IOError, OSError):
+        return values
+    for line in lines:
+        match = re.match(r'^(\w+)(?:\{(.*)\})? (\S+)$', line)
+        if not match:
+            continue
+        key = (match.group(1), parse_labels(match.group(2) or ''))
+        values[key] = values.get(key, 0) + float(match.group(3))
+    return values
+
+
+def sample_order(sample):
+    """
+    Sort samples by name and labels, buckets of a histogram by their upper bound as Prometheus expects them.
+    """
+    (name, labels), _ = sample
+    return name, [(key, float(value)) if key == 'le' else (key, value) for key, value in labels]
+
+
+def format_metrics(values):
+    lines = list()
+    for name, metric_type, description in METRICS_HELP:
+        samples = sorted(((key, value) for key, value in values.items() if key[0] == name or
+                          metric_type == 'histogram' and key[0] in (name + '_bucket', name + '_sum', name + '_count')),
+                         key=sample_order)
+        if not samples:
+            continue
+        lines.append('# HELP {0} {1}'.format(name, description))
+        lines.append('# TYPE {0} {1}'.format(name, metric_type))
+        for (sample_name, labels), value in samples:
+            lines.append('{0}{{{1}}} {2}'.format(sample_name, format_labels(labels), format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+# Metrics of this process, shared by all clients, mirrors and resolvers
+METRICS = Metrics()
+
+
+def enable_metrics(path):
+    """
+    Record metrics and add them to the textfile collector file path when the process exits.
+    """
+    with METRICS.lock:
+        if METRICS.path:
+            return
+        METRICS.path = path
+    atexit.register(METRICS.write)
+
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def random_id(size):
+    return binascii.hexlify(os.urandom(size)).decode('ascii')
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return dict(boolValue=value)
+    if isinstance(value, int):
+        # int64 values are strings in OTLP-JSON
+        return dict(intValue=str(value))
+    if isinstance(value, float):
+        return dict(doubleValue=value)
+    return dict(stringValue=str(value))
+
+
+class Span(object):
+    def __init__(self, tracer, name, parent, kind, attributes, start=None):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = random_id(8)
+        self.parent_id = parent.span_id if parent else None
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.start = start if start is not None else time.time()
+        self.end = None
+        self.error = None
+
+    def finish(self, error=None, end=None):
+        self.end = end if end is not None else time.time()
+        self.error = error
+        if getattr(error, 'status_code', None):
+            self.attributes['http.response.status_code'] = error.status_code
+        self.tracer.add(self)
+
+    def as_dict(self):
+        span = dict(traceId=self.tracer.trace_id,
+                     spanId=self.span_id,
+                     name=self.name,
+                     kind=self.kind,
+                     startTimeUnixNano=str(int(self.start * 1e9)),
+                     endTimeUnixNano=str(int((self.end or time.time()) * 1e9)),
+                     attributes=[dict(key=key, value=otlp_value(value))
+                                 for key, value in sorted(self.attributes.items()) if value is not None],
+                     status=dict(code=STATUS_OK))
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.error is not None:
+            span['status'] = dict(code=STATUS_ERROR, message=str(getattr(self.error, 'message', self.error)))
+        return span
+
+
+class Tracer(object):
+    """
+    Collects the spans of one trace. Spans started in a thread are children of the span the thread is in, spans of
+    threads without one (e.g. of a ThreadPool) are children of the root span.
+    """
+
+    def __init__(self, name):
+        self.trace_id = random_id(16)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.spans = list()
+        self.root = Span(self, name, parent=None, kind=SPAN_KIND_INTERNAL, attributes=dict())
+
+    def current(self):
+        stack = getattr(self.local, 'stack', None)
+        return stack[-1] if stack else self.root
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name, kind=SPAN_KIND_INTERNAL, **attributes):
+        """
+        Run the body in a span. The span is yielded so the body can add attributes.
+        """
+        span = Span(self, name, parent=self.current(), kind=kind, attributes=attributes)
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = list()
+        self.local.stack.append(span)
+        error = None
+        try:
+            yield span
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.local.stack.pop()
+            span.finish(error)
+
+    def record(self, name, seconds, error=None, kind=SPAN_KIND_CLIENT, **attributes):
+        """
+        Add a span that just ended after seconds.
+        """
+        end = time.time()
+        span = Span(self, name, parent=self.current(), kind=kind, attributes=attributes, start=end - seconds)
+        span.finish(error, end)
+
+    def write(self, directory):
+        """
+        Write the trace to <trace id>.json in directory, ending the root span.
+        """
+        if self.root.end is None:
+            self.root.finish()
+        with self.lock:
+            spans = [span.as_dict() for span in self.spans]
+        data = dict(resourceSpans=[dict(
+            resource=dict(attributes=[dict(key='service.name', value=otlp_value('ansible-foreman'))]),
+            scopeSpans=[dict(scope=dict(name='foreman_telemetry'), spans=spans)])])
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, '{0}.json'.format(self.trace_id))
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.rename(path + '.tmp', path)
+
+
+# Trace of this process if enabled by enable_tracing
+TRACER = None
+TRACER_LOCK = threading.Lock()
+
+
+def enable_tracing(directory, name, **attributes):
+    """
+    Start the trace of this process, its root span is called name. The trace is written to directory at exit.
+    """
+    global TRACER
+    with TRACER_LOCK:
+        if TRACER is None:
+            TRACER = Tracer(name)
+            TRACER.root.attributes.update(attributes)
+            atexit.register(TRACER.write, directory)
+    return TRACER
+
+
+def get_tracer():
+    """
+    Return the Tracer of this process, None if tracing isn't enabled.
+    """
+    return TRACER
+
+
+@contextmanager
+def trace_span(name, **attributes):
+    """
+    Run the body in a span of the trace if tracing is enabled.
+    """
+    if TRACER is None:
+        yield None
+        return
+    with TRACER.span(name, **attributes) as span:
+        yield span
+
+
+def get_request_attributes(foreman, name):
+    verb, endpoint = get_verb_endpoint(name)
+    return {'http.request.method': verb, 'foreman.endpoint': endpoint, 'server.address': foreman}
+
+
+def trace_page(foreman, name, seconds, error=None, size=None):
+    """
+    Add the span of a request this process sent itself (a page of iter_resources, put_resource) if tracing is enabled.
+    """
+    if TRACER is not None:
+        attributes = get_request_attributes(foreman, name)
+        attributes['foreman.response_size'] = size
+        TRACER.record(name, seconds, error, **attributes)
+
+
+def payload_size(data):
+    """
+    Return the size of data as JSON, None if it can't be serialized.
+    """
+    if data is None:
+        return None
+    try:
+        return len(json.dumps(data))
+    except (TypeError, ValueError):
+        return None
+
+
+class ApiStats(object):
+    """
+    Thread safe count, sum and durations of API calls by call key. Calls are also recorded in METRICS.
+    """
+
+    def __init__(self, foreman=None):
+        self.foreman = foreman
+        self.lock = threading.Lock()
+        self.calls = dict()
+
+    def record(self, name, seconds, error=None):
+        key = get_call_key(name)
+        with self.lock:
+            call = self.calls.setdefault(key, dict(count=0, seconds=0.0, max=0.0, durations=[]))
+            call['count'] += 1
+            call['seconds'] += seconds
+            call['max'] = max(call['max'], seconds)
+            if len(call['durations']) < MAX_SAMPLES:
+                call['durations'].append(seconds)
+        METRICS.request(self.foreman, name, seconds, error)
+
+    @contextmanager
+    def measure(self, name):
+        start = time.time()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.record(name, time.time() - start, error)
+
+    def as_dict(self):
+        """
+        Return the stats as returned by the modules: count and seconds of every call and its p50, p95, p99 and max
+        duration in milliseconds.
+        """
+        by_call = dict()
+        with self.lock:
+            for key, call in self.calls.items():
+                stats = dict(count=call['count'], seconds=round(call['seconds'], 3),
+                             max_ms=int(round(call['max'] * 1000)))
+                for p in PERCENTILES:
+                    stats['p{0}_ms'.format(p)] = int(round(percentile(call['durations'], p) * 1000))
+                by_call[key] = stats
+        return dict(calls=sum(call['count'] for call in by_call.values()),
+                    seconds=round(sum(call['seconds'] for call in by_call.values()), 3),
+                    by_call=by_call)
@@ -0,0 +1,907 @@
+# -*- coding: utf-8 -*-
+
+"""
+Helpers shared by the foreman_* modules.
+
+Make this directory known to Ansible (module_utils = /path/to/ansible-library-foreman/module_utils in ansible.cfg).
+Modules import it as ansible.module_utils.foreman_utils.
+
+Importing python-foreman and requests takes a noticeable part of a module run. Both are imported only once they
+are needed, modules not talking to Foreman at all (e.g. answered from the mirror) never import them. The same goes
+for foreman_telemetry, imported with the first API call, metrics or trace, and multiprocessing's thread pool.
+"""
+
+import atexit
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from ansible.module_utils.six import string_types
+
+try:
+    from importlib.util import find_spec
+except ImportError:
+    # Python 2
+    import imp
+
+    def find_spec(name):
+        try:
+            imp.find_module(name)
+        except ImportError:
+            return None
+        return True
+
+# Resource types as used by the modules for their options
+ARCHITECTURE = 'architecture'
+COMPUTE_PROFILE = 'compute_profile'
+COMPUTE_RESOURCE = 'compute_resource'
+DOMAIN = 'domain'
+ENVIRONMENT = 'environment'
+HOSTGROUP = 'hostgroup'
+LOCATION = 'location'
+MEDIUM = 'medium'
+OPERATINGSYSTEM = 'operatingsystem'
+ORGANIZATION = 'organization'
+PARTITION_TABLE = 'partition_table'
+SMART_PROXY = 'smart_proxy'
+SUBNET = 'subnet'
+
+# Foreman API v2 endpoint of each resource type, keyed by the names the modules use for their options
+RESOURCE_ENDPOINTS = dict(
+    architecture='architectures',
+    compute_profile='compute_profiles',
+    compute_resource='compute_resources',
+    config_template='config_templates',
+    domain='domains',
+    environment='environments',
+    host='hosts',
+    hostgroup='hostgroups',
+    location='locations',
+    medium='media',
+    operatingsystem='operatingsystems',
+    organization='organizations',
+    partition_table='ptables',
+    ptable='ptables',
+    role='roles',
+    smart_proxy='smart_proxies',
+    subnet='subnets',
+    user='users',
+)
+
+# References foreman_host changes on existing hosts
+HOST_UPDATABLE_REFS = [ARCHITECTURE, DOMAIN, ENVIRONMENT, HOSTGROUP, LOCATION, MEDIUM, OPERATINGSYSTEM, ORGANIZATION,
+                       SUBNET]
+
+DEFAULT_PER_PAGE = 100
+# Names searched per request, see name_searches
+NAME_SEARCH_CHUNK = 50
+DEFAULT_HTTP_POOL_SIZE = 10
+
+# Sessions shared by all requests of this process, see get_session
+SESSIONS = dict()
+SESSIONS_LOCK = threading.Lock()
+
+# Fields kept by project in addition to the requested ones
+IDENTITY_FIELDS = ['id', 'name', 'title', 'login']
+
+FOREMANCLIENT_MISSING = 'python-foreman module is required. See https://github.com/Nosmoht/python-foreman.'
+
+
+class ForemanError(Exception):
+    def __init__(self, message, status_code=None):
+        super(ForemanError, self).__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def foremanclient_found():
+    """
+    Check whether python-foreman is installed without importing it.
+    """
+    return find_spec('foreman') is not None
+
+
+# Fields identifying an object to be created, the first one is searched for. Defaults to name.
+CREATE_IDENTITY = dict(
+    hostgroup=['name', 'parent_id'],
+    operatingsystem=['name', 'major'],
+    user=['login'],
+)
+
+
+class SingleFlight(object):
+    """
+    Collapse concurrent identical calls into one. Callers arriving while a call with the same key is in flight wait
+    for it and get a copy of its result (or its error) instead of calling again. Results are not kept afterwards.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = dict()
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = dict(done=threading.Event(), result=None, error=None)
+        from ansible.module_utils.foreman_telemetry import METRICS
+        METRICS.cache('coalesced', hit=not leader)
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return copy.deepcopy(call['result'])
+
+        try:
+            call['result'] = func()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+        return call['result']
+
+
+@contextmanager
+def process_lock(key):
+    """
+    Hold an exclusive lock on key shared by all processes of the same user on this machine, e.g. Ansible's forks.
+    Doesn't lock on systems without fcntl.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    directory = os.path.join(tempfile.gettempdir(), 'ansible-foreman-{0}'.format(os.getuid()))
+    try:
+        os.makedirs(directory, 0o700)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    path = os.path.join(directory, '{0}.lock'.format(hashlib.sha1(key.encode('utf-8')).hexdigest()))
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class ForemanClient(object):
+    """
+    Proxy of python-foreman's Foreman class.
+
+    python-foreman is imported and the Foreman object created on the first call of an API method. Errors raised by
+    python-foreman are raised as ForemanError of this module, so modules don't need to import python-foreman to
+    handle them.
+
+    With read_hosts get_* and search_* calls go to the fastest healthy of read_hosts and hostname, failing over to
+    the next node on connection errors, everything else goes to hostname. See foreman_nodes.
+
+    With http_cache get_* calls by id are answered from an on-disk cache revalidated with ETags, see foreman_http_cache.
+
+    Concurrent identical get_* and search_* calls (e.g. of the threads of foreman_host's hosts mode) are sent once,
+    see SingleFlight. Concurrent create_<type>(data=...) calls of top-level resources for the same object are sent
+    once as well. If Foreman refuses a create as the object exists (e.g. another fork created it meanwhile), the
+    object is searched and returned instead of failing.
+    """
+
+    def __init__(self, hostname, port, username, password, read_hosts=None, http_cache=None, http_pool_size=None,
+                 http_timeout=None):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.http_pool_size = http_pool_size
+        self.http_timeout = http_timeout
+        self._apis = dict()
+        self._client_error = None
+        self._http_cache = None
+        if http_cache:
+            from ansible.module_utils.foreman_http_cache import HttpCache
+            self._http_cache = HttpCache(path=http_cache)
+        self._single_flight = SingleFlight()
+        self._nodes = None
+        self._stats = None
+        self._stats_lock = threading.Lock()
+        if read_hosts:
+            from ansible.module_utils.foreman_nodes import NodeSelector
+            self._nodes = NodeSelector(primary=hostname, read_hosts=read_hosts, port=port, username=username,
+                                       password=password)
+            atexit.register(self._nodes.save)
+
+    @property
+    def stats(self):
+        """
+        ApiStats of the calls of this client, created with the first call.
+        """
+        with self._stats_lock:
+            if self._stats is None:
+                from ansible.module_utils.foreman_telemetry import ApiStats
+                self._stats = ApiStats(foreman=self.hostname)
+            return self._stats
+
+    def get_api_stats(self):
+        """
+        Return the stats as returned by the modules, see ApiStats.as_dict. Without calls there aren't any.
+        """
+        if self._stats is None:
+            return dict(calls=0, seconds=0, by_call=dict())
+        return self._stats.as_dict()
+
+    @property
+    def api(self):
+        return self._get_api(self.hostname)
+
+    def _get_api(self, hostname):
+        if hostname not in self._apis:
+            try:
+                from foreman.foreman import Foreman, ForemanError as ClientError
+            except ImportError:
+                raise ForemanError(FOREMANCLIENT_MISSING)
+            self._client_error = ClientError
+            self._apis[hostname] = Foreman(hostname=hostname,
+                                           port=self.port,
+                                           username=self.username,
+                                           password=self.password)
+        return self._apis[hostname]
+
+    def _get_params(self, hostname):
+        return dict(foreman_host=hostname,
+                    foreman_port=self.port,
+                    foreman_user=self.username,
+                    foreman_pass=self.password,
+                    http_pool_size=self.http_pool_size,
+                    http_timeout=self.http_timeout)
+
+    def _call(self, hostname, name, args, kwargs):
+        """
+        Call the API method name on node hostname, get_* calls by id through the HTTP cache if there is one.
+        """
+        endpoint = None
+        if self._http_cache and name.startswith('get_') and not args and list(kwargs) == ['id']:
+            endpoint = get_endpoint(name[len('get_'):])
+        if endpoint:
+            url = 'https://{0}:{1}/api/v2/{2}/{3}'.format(hostname, self.port, endpoint, kwargs['id'])
+            return self._http_cache.get(session=get_session(self._get_params(hostname)), url=url,
+                                        username=self.username)
+        return getattr(self._get_api(hostname), name)(*args, **kwargs)
+
+    def _node_failed(self, error):
+        """
+        Whether error means the node rather than the request failed, i.e. another node may succeed.
+        """
+        if isinstance(error, (self._client_error, ForemanError)):
+            status_code = getattr(error, 'status_code', None)
+            return status_code is None or status_code >= 500
+        try:
+            import requests
+        except ImportError:
+            return False
+        return isinstance(error, requests.exceptions.RequestException)
+
+    def _read(self, name, args, kwargs):
+        """
+        Call the read method name on the fastest healthy node, failing over to the next node if a node fails.
+        """
+        hosts = self._nodes.read_order()
+        for host in hosts:
+            start = time.time()
+            try:
+                result = self._call(host, name, args, kwargs)
+            except Exception as e:
+                if host == hosts[-1] or not self._node_failed(e):
+                    raise
+                self._nodes.record(host, failed=True)
+                from ansible.module_utils.foreman_telemetry import METRICS
+                METRICS.inc('foreman_api_retries_total', foreman=self.hostname, node=host)
+                continue
+            self._nodes.record(host, elapsed=time.time() - start)
+            return result
+
+    def __getattr__(self, name):
+        attr = getattr(self.api, name)
+        if not callable(attr):
+            return attr
+        read = name.startswith('get_') or name.startswith('search_')
+
+        def send(*args, **kwargs):
+            with self.stats.measure(name):
+                if read and self._nodes:
+                    return self._read(name, args, kwargs)
+                return self._call(self.hostname, name, args, kwargs)
+
+        def invoke(*args, **kwargs):
+            from ansible.module_utils.foreman_telemetry import (SPAN_KIND_CLIENT, get_request_attributes, get_tracer,
+                                                                payload_size)
+            tracer = get_tracer()
+            try:
+                if tracer is None:
+                    return send(*args, **kwargs)
+                attributes = get_request_attributes(self.hostname, name)
+                attributes['foreman.request_size'] = payload_size(kwargs.get('data'))
+                with tracer.span(name, kind=SPAN_KIND_CLIENT, **attributes) as span:
+                    result = send(*args, **kwargs)
+                    span.attributes['foreman.response_size'] = payload_size(result)
+                    return result
+            except self._client_error as e:
+                raise ForemanError(getattr(e, 'message', str(e)), status_code=getattr(e, 'status_code', None))
+
+        def call(*args, **kwargs):
+            if read:
+                key = json.dumps([name, args, kwargs], sort_keys=True, default=str)
+                return self._single_flight.do(key, lambda: invoke(*args, **kwargs))
+            if name.startswith('create_'):
+                return self._create(name[len('create_'):], invoke, args, kwargs)
+            return invoke(*args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    def _create(self, resource_type, invoke, args, kwargs):
+        data = kwargs.get('data')
+        fields = CREATE_IDENTITY.get(resource_type, ['name'])
+        if args or list(kwargs) != ['data'] or resource_type not in RESOURCE_ENDPOINTS or not isinstance(data, dict) \
+                or not data.get(fields[0]):
+            # Nested (e.g. host parameters of a host_id) or nothing to identify the object by
+            return invoke(*args, **kwargs)
+
+        key = json.dumps(['create', resource_type] + [data.get(field) for field in fields], default=str)
+
+        def create():
+            try:
+                return invoke(*args, **kwargs)
+            except ForemanError as e:
+                if e.status_code != 422:
+                    raise
+                existing = self._find_created(resource_type, data, fields)
+                if existing:
+                    return existing
+                raise
+
+        return self._single_flight.do(key, create)
+
+    def _find_created(self, resource_type, data, fields):
+        search = getattr(self.api, 'search_{0}'.format(resource_type), None)
+        if search is None:
+            return None
+        try:
+            existing = search(data={fields[0]: data[fields[0]]})
+        except self._client_error:
+            return None
+        if existing and all(str(existing.get(field)) == str(data.get(field)) for field in fields[1:]):
+            return existing
+        return None
+
+    def iter_resources(self, endpoint, search=None, per_page=DEFAULT_PER_PAGE, meta=None, thin=False, prefetch=True):
+        hostname = self._nodes.read_order()[0] if self._nodes else self.hostname
+        name = 'GET {0}'.format(endpoint)
+
+        def on_page(seconds, error, size):
+            from ansible.module_utils.foreman_telemetry import trace_page
+            self.stats.record(name, seconds, error)
+            trace_page(hostname, name, seconds, error, size)
+
+        return iter_resources(params=self._get_params(hostname), endpoint=endpoint, search=search, per_page=per_page,
+                              meta=meta, thin=thin, prefetch=prefetch, on_page=on_page)
+
+    def put_resource(self, endpoint, data):
+        """
+        PUT data to endpoint on hostname, see put_resource. Recorded in stats and the trace like API calls.
+        """
+        name = 'PUT {0}'.format(endpoint)
+        start = time.time()
+        error = None
+        size = None
+        try:
+            result, size = put_resource(params=self._get_params(self.hostname), endpoint=endpoint, data=data)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            from ansible.module_utils.foreman_telemetry import trace_page
+            seconds = time.time() - start
+            self.stats.record(name, seconds, error)
+            trace_page(self.hostname, name, seconds, error, size)
+
+
+def values_differ(desired, current):
+    """
+    Compare a desired value with the value Foreman returned. Values are compared as strings as Foreman returns
+    e.g. numbers the modules take as strings. None means the value isn't managed.
+    """
+    if desired is None:
+        return False
+    if isinstance(desired, bool) or isinstance(current, bool):
+        return str(desired).lower() != str(current).lower()
+    return str(desired) != str(current)
+
+
+def names(objects):
+    return set(item.get('name') for item in objects or [])
+
+
+def changed_fields(data, current, keys=None, list_keys=None):
+    """
+    Return the items of data differing from the current object, i.e. what must be sent to Foreman to update it.
+
+    :param data: Desired fields
+    :param current: Object as returned by Foreman
+    :param keys: Fields to compare, defaults to all fields of data
+    :param list_keys: Fields holding lists of objects, compared by the names of the objects
+
+    Fields Foreman didn't return count as unchanged, otherwise an object would be updated on every run.
+    """
+    list_keys = list_keys or []
+    result = dict()
+    for key in keys if keys is not None else data:
+        if key not in data:
+            continue
+        value = data[key]
+        if key in list_keys:
+            if value is not None and names(value) != names(current.get(key)):
+                result[key] = value
+        elif key in current and values_differ(value, current[key]):
+            result[key] = value
+    return result
+
+
+def host_ref_differs(host, ref, wanted):
+    """
+    Whether the reference ref of host (one of HOST_UPDATABLE_REFS) differs from the name wanted, compared with the
+    <ref>_name field Foreman returns. References not wanted are left as they are and unknown ones, i.e. the field
+    is missing, count as not differing. foreman_host and foreman_drift both decide by this.
+    """
+    key = '{0}_name'.format(ref)
+    if not wanted or key not in host:
+        return False
+    current = [host.get(key)]
+    if ref == HOSTGROUP:
+        current.append(host.get('hostgroup_title'))
+    if ref == OPERATINGSYSTEM and host.get(key):
+        # Foreman fills operatingsystem_name of hosts with the title, i.e. name and version, e.g. CentOS 7
+        current.extend([host.get('operatingsystem_title'), host[key].rsplit(' ', 1)[0]])
+    return wanted not in current
+
+
+def project(obj, fields):
+    """
+    Return obj reduced to its identifying fields and fields, e.g. to keep the results of modules small.
+    obj is returned as it is if fields is None.
+    """
+    if fields is None or not isinstance(obj, dict):
+        return obj
+    return dict((key, value) for key, value in obj.items() if key in IDENTITY_FIELDS or key in fields)
+
+
+def check_search(module):
+    """
+    Fail if the search option of module is given but blank. Foreman ignores empty searches, they would select all
+    hosts.
+    """
+    search = module.params.get('search')
+    if search is not None and not search.strip():
+        module.fail_json(msg='search must not be empty, it would select all hosts')
+
+
+def name_searches(names, chunk_size=NAME_SEARCH_CHUNK):
+    """
+    Return Foreman search queries finding the objects named names, each for chunk_size names at most to keep URLs
+    short. Searching a few hundred hosts this way is much cheaper than reading all hosts.
+    """
+    names = sorted(names)
+    return ['name ^ ({0})'.format(', '.join('"{0}"'.format(name) for name in names[i:i + chunk_size]))
+            for i in range(0, len(names), chunk_size)]
+
+
+def search_hosts(theforeman, names, per_page=DEFAULT_PER_PAGE):
+    """
+    Return the hosts named names by name, searching them in chunks instead of one request per host, e.g. to poll
+    their build state. Hosts that don't exist are missing in the result.
+    """
+    result = dict()
+    for search in name_searches(names):
+        for host in theforeman.iter_resources('hosts', search=search, per_page=per_page):
+            result[host.get('name')] = host
+    return result
+
+
+def poll_builds(theforeman, started, timeout, progress, per_page=DEFAULT_PER_PAGE, is_built=None):
+    """
+    Poll the build state of the hosts started maps to the time their build started, searching them together.
+    Return the seconds every built host took and the error of every host deleted or still building after timeout
+    seconds. Hosts time out even if the search fails, so an unreachable Foreman doesn't keep them waiting forever.
+    is_built(host) defaults to the host having left build mode.
+    """
+    is_built = is_built or (lambda host: not host.get('build'))
+    try:
+        current = search_hosts(theforeman, list(started), per_page=per_page)
+    except ForemanError as e:
+        # Builds go on anyway, try again with the next poll
+        progress.write(status='poll_failed', msg=e.message)
+        current = None
+
+    now = time.time()
+    built = dict()
+    errors = dict()
+    for name, start in started.items():
+        elapsed = int(now - start)
+        if current is not None and name not in current:
+            errors[name] = 'Host was deleted while building'
+        elif current is not None and is_built(current[name]):
+            built[name] = elapsed
+        elif elapsed > timeout:
+            errors[name] = 'Still in build mode after {0} seconds'.format(timeout)
+    return built, errors
+
+
+class Progress(object):
+    """
+    Append one line of JSON per event (e.g. a processed host) to a file, flushed immediately. Does nothing without
+    a path.
+    """
+
+    def __init__(self, path):
+        self.f = open(path, 'a') if path else None
+        self.lock = threading.Lock()
+
+    def write(self, **kwargs):
+        if not self.f:
+            return
+        kwargs['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with self.lock:
+            self.f.write(json.dumps(kwargs) + '\n')
+            self.f.flush()
+
+    def close(self):
+        if self.f:
+            self.f.close()
+
+
+class RateLimiter(object):
+    """
+    Thread safe limit of how many actions start per second. A rate of None or 0 doesn't limit.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until the next action may start.
+        """
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ModuleViewError(Exception):
+    def __init__(self, message, **kwargs):
+        super(ModuleViewError, self).__init__(message)
+        self.message = message
+        self.kwargs = kwargs
+
+
+class ModuleView(object):
+    """
+    Stand-in for the AnsibleModule using other parameters, e.g. one item of a list option or one Foreman endpoint.
+    fail_json raises ModuleViewError instead of exiting so a failing item doesn't abort the others. Everything else
+    is taken from the module.
+    """
+
+    def __init__(self, module, params):
+        self.module = module
+        self.params = params
+
+    def fail_json(self, msg, **kwargs):
+        raise ModuleViewError(msg, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+
+def ensure_endpoints(module, ensure, result_key):
+    """
+    Call ensure(module, theforeman) for every item of the foreman_endpoints option in parallel and exit the module
+    with the results per endpoint.
+
+    Items override the module's parameters, usually foreman_host, foreman_port, foreman_user and foreman_pass, string
+    items are taken as foreman_host. Every endpoint gets its own client. A local mirror is only used if an item
+    names one, as a mirror holds the objects of one Foreman only.
+    """
+    from multiprocessing.pool import ThreadPool
+
+    from ansible.module_utils.foreman_telemetry import trace_span
+
+    endpoints = list()
+    for endpoint in module.params['foreman_endpoints']:
+        if isinstance(endpoint, string_types):
+            endpoint = dict(foreman_host=endpoint)
+        if not isinstance(endpoint, dict):
+            module.fail_json(msg='Items of foreman_endpoints must be dicts or hostnames, got {0}'.format(endpoint))
+        endpoints.append(endpoint)
+    start_tracing(module)
+
+    def ensure_endpoint(endpoint):
+        params = dict(module.params)
+        params['foreman_endpoints'] = None
+        if 'mirror' in params:
+            params['mirror'] = None
+        result = dict(foreman_host=endpoint.get('foreman_host', params['foreman_host']))
+        client = None
+        try:
+            for key, value in endpoint.items():
+                if key not in params:
+                    raise ModuleViewError('Unsupported parameter {0} in foreman_endpoints'.format(key))
+                params[key] = value
+            view = ModuleView(module=module, params=params)
+            with trace_span('ensure', **{'server.address': result['foreman_host']}):
+                client = get_foreman_client(view)
+                changed, obj = ensure(view, client)
+            result.update(changed=changed)
+            result[result_key] = project(obj, params.get('result_fields'))
+        except ModuleViewError as e:
+            result.update(e.kwargs)
+            result.update(changed=result.get('changed', False), failed=True, msg=e.message)
+        except ForemanError as e:
+            result.update(changed=False, failed=True, msg=e.message)
+        if client:
+            result['api_stats'] = client.get_api_stats()
+        return result
+
+    pool = ThreadPool(processes=max(1, len(endpoints)))
+    try:
+        results = pool.map(ensure_endpoint, endpoints)
+    finally:
+        pool.close()
+
+    changed = any(result['changed'] for result in results)
+    failed = [result for result in results if result.get('failed')]
+    if failed:
+        module.fail_json(msg='{0} of {1} Foreman endpoints failed'.format(len(failed), len(results)),
+                         changed=changed, endpoints=results)
+    module.exit_json(changed=changed, endpoints=results)
+
+
+def get_foreman_client(module):
+    """
+    Return a ForemanClient using the connection options of module. Fail if python-foreman isn't installed.
+    The results of module contain the client's ApiStats as api_stats. With the metrics_file option metrics are
+    written to that file when the module exits, with trace_dir a trace of the module run to that directory.
+    """
+    if not foremanclient_found():
+        module.fail_json(msg=FOREMANCLIENT_MISSING)
+    if module.params.get('metrics_file'):
+        from ansible.module_utils.foreman_telemetry import enable_metrics
+        enable_metrics(module.params['metrics_file'])
+    start_tracing(module)
+    client = ForemanClient(hostname=module.params['foreman_host'],
+                           port=module.params['foreman_port'],
+                           username=module.params['foreman_user'],
+                           password=module.params['foreman_pass'],
+                           read_hosts=module.params.get('foreman_read_hosts'),
+                           http_cache=module.params.get('http_cache'),
+                           http_pool_size=module.params.get('http_pool_size'),
+                           http_timeout=module.params.get('http_timeout'))
+    for name in ('exit_json', 'fail_json'):
+        setattr(module, name, with_api_stats(getattr(module, name), client))
+    return client
+
+
+def start_tracing(module):
+    """
+    Start the trace of the module run if the trace_dir option is set. The root span is named after the module.
+    """
+    if module.params.get('trace_dir'):
+        from ansible.module_utils.foreman_telemetry import enable_tracing
+        enable_tracing(module.params['trace_dir'], getattr(module, '_name', None) or 'foreman',
+                       **{'server.address': module.params.get('foreman_host')})
+
+
+def with_api_stats(method, client):
+    def call(*args, **kwargs):
+        kwargs.setdefault('api_stats', client.get_api_stats())
+        return method(*args, **kwargs)
+
+    return call
+
+
+def get_session(params):
+    """
+    Return the requests session shared by all requests this process sends itself (not through python-foreman) with
+    the connection options of params, so connections are kept alive across calls, threads and clients.
+
+    Responses are requested gzip compressed. http_pool_size of params is the number of connections kept per node,
+    it should be at least the number of threads sending requests. http_timeout is the connect and read timeout in
+    seconds, None waits forever. Certificates aren't verified, like python-foreman doesn't, even if
+    REQUESTS_CA_BUNDLE or CURL_CA_BUNDLE is set.
+    """
+    try:
+        import requests
+        import requests.adapters
+    except ImportError:
+        raise ForemanError('python-requests is required to read Foreman resources')
+
+    pool_size = params.get('http_pool_size') or DEFAULT_HTTP_POOL_SIZE
+    timeout = params.get('http_timeout')
+    key = (params['foreman_user'], params['foreman_pass'], pool_size, timeout)
+    with SESSIONS_LOCK:
+        if key not in SESSIONS:
+            class TimeoutAdapter(requests.adapters.HTTPAdapter):
+                def send(self, request, **kwargs):
+                    if kwargs.get('timeout') is None:
+                        kwargs['timeout'] = timeout
+                    # Session.verify is overridden by REQUESTS_CA_BUNDLE and CURL_CA_BUNDLE, so pass it on each request
+                    kwargs['verify'] = False
+                    return super(TimeoutAdapter, self).send(request, **kwargs)
+
+            session = requests.Session()
+            session.auth = (params['foreman_user'], params['foreman_pass'])
+            session.verify = False
+            session.headers['Accept'] = 'application/json'
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+            session.mount('https://', TimeoutAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+            SESSIONS[key] = session
+        return SESSIONS[key]
+
+
+def get_endpoint(resource_type):
+    """
+    Return the API endpoint of resource_type. resource_type may already be an endpoint.
+    """
+    if resource_type in RESOURCE_ENDPOINTS.values():
+        return resource_type
+    return RESOURCE_ENDPOINTS.get(resource_type)
+
+
+class PageFetch(threading.Thread):
+    """
+    Fetch one page in the background. get() waits for the page and raises what fetching raised.
+    """
+
+    def __init__(self, fetch, page):
+        super(PageFetch, self).__init__()
+        # Don't keep the interpreter alive for pages nobody reads anymore
+        self.daemon = True
+        self.fetch = fetch
+        self.page = page
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.fetch(self.page)
+        except Exception as e:
+            self.error = e
+
+    def get(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def iter_resources(params, endpoint, search=None, per_page=DEFAULT_PER_PAGE, meta=None, thin=False, prefetch=True,
+                   on_page=None):
+    """
+    Yield all items of a Foreman API v2 index endpoint page by page.
+
+    Only the page being processed is kept in memory. With prefetch the next page is requested in the background
+    while the items of the current page are processed. Stop iterating (or use find_first) to stop paging.
+
+    :param params: Module parameters containing the foreman_* connection options
+    :param endpoint: API path below /api/v2, e.g. hostgroups
+    :param search: Foreman search query
+    :param per_page: Items requested per page
+    :param meta: Optional dict receiving total and subtotal of the first page
+    :param thin: Let Foreman return id and name of the items only
+    :param prefetch: Request the next page while the current one is processed
+    :param on_page: Called with the seconds each page took, the error it raised or None and its size in bytes
+    """
+    session = get_session(params)
+    import requests
+
+    url = 'https://{0}:{1}/api/v2/{2}'.format(params['foreman_host'], params['foreman_port'], endpoint)
+
+    def fetch(page):
+        start = time.time()
+        error = None
+        size = None
+        try:
+            body, size = fetch_page(page)
+            return body
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if on_page:
+                on_page(time.time() - start, error, size)
+
+    def fetch_page(page):
+        query = dict(page=page, per_page=per_page)
+        if search:
+            query['search'] = search
+        if thin:
+            query['thin'] = 'true'
+        try:
+            response = session.get(url, params=query)
+        except requests.exceptions.RequestException as e:
+            raise ForemanError('Could not get {0}: {1}'.format(endpoint, e))
+        if response.status_code != 200:
+            raise ForemanError('Could not get {0}: HTTP {1} {2}'.format(endpoint, response.status_code,
+                                                                       response.text),
+                               status_code=response.status_code)
+        return response.json(), len(response.content)
+
+    page = 1
+    body = fetch(page)
+    while True:
+        results = body.get('results') or []
+        if page == 1 and meta is not None:
+            meta['total'] = body.get('total')
+            meta['subtotal'] = body.get('subtotal')
+
+        last = len(results) < per_page or page * per_page >= (body.get('subtotal') or 0)
+        next_page = None
+        if not last and prefetch:
+            next_page = PageFetch(fetch, page + 1)
+            next_page.start()
+
+        for item in results:
+            yield item
+
+        if last:
+            break
+        page += 1
+        body = next_page.get() if next_page else fetch(page)
+
+
+def put_resource(params, endpoint, data):
+    """
+    Send data to a Foreman API v2 endpoint with PUT, e.g. a hosts bulk action python-foreman doesn't know.
+    Return the decoded response (None if empty) and its size in bytes. Raise ForemanError with the status code if
+    Foreman doesn't accept it, 404 if Foreman doesn't have the endpoint.
+    """
+    session = get_session(params)
+    import requests
+
+    url = 'https://{0}:{1}/api/v2/{2}'.format(params['foreman_host'], params['foreman_port'], endpoint)
+    try:
+        response = session.put(url, json=data)
+    except requests.exceptions.RequestException as e:
+        raise ForemanError('Could not put {0}: {1}'.format(endpoint, e))
+    if response.status_code not in (200, 201, 202):
+        raise ForemanError('Could not put {0}: HTTP {1} {2}'.format(endpoint, response.status_code, response.text),
+                           status_code=response.status_code)
+    return (response.json() if response.content else None), len(response.content)
+
+
+def find_first(items, match):
+    """
+    Return the first of items match returns True for or None. Paging of items stops once it's found.
+    """
+    for item in items:
+        if match(item):
+            if hasattr(items, 'close'):
+                items.close()
+            return item
+    return None